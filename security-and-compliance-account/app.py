@@ -37,6 +37,8 @@ CrossAccountRoleStack(
   app, 
   'CrossAccountRoleStack',
   source_repo_arn=source_repo_arn,
+  rule_bundle_objects_arn=pipeline_stack.rule_bundle_objects_arn,
+  pipeline_encryption_key_arn=pipeline_stack.pipeline_encryption_key_arn,
   stack_name='cf-CrossAccountRoles', 
   description = 'IAM role to allows app accounts to pull code for compliance check'
 )
@@ -15,25 +15,13 @@
 
 #!/bin/bash
 
-set -x
-
 # CLI Parameters
 arg_role=$1
 
-CREDS=$(aws sts assume-role \
---role-arn $arg_role \
---role-session-name $(date '+%Y%m%d%H%M%S%3N') \
---duration-seconds 3600 \
---query '[Credentials.AccessKeyId,Credentials.SecretAccessKey,Credentials.SessionToken]' \
---output text)
-
-echo $CREDS
+# Sessions come from the credential broker, which reuses a cached session of the role until it nears expiry.
+# The credentials are only exported, never printed: the session is shared by later builds
+CREDS=$(PYTHONPATH="$(dirname ${BASH_SOURCE[0]})${PYTHONPATH:+:$PYTHONPATH}" python3 -m compliance.credentials env $arg_role)
 
 export AWS_DEFAULT_REGION="us-east-1"
 echo "export AWS_DEFAULT_REGION=us-east-1"
-export AWS_ACCESS_KEY_ID=$(echo $CREDS | cut -d' ' -f1)
-echo "export AWS_ACCESS_KEY_ID=$(echo $CREDS | cut -d' ' -f1)"
-export AWS_SECRET_ACCESS_KEY=$(echo $CREDS | cut -d' ' -f2)
-echo "export AWS_SECRET_ACCESS_KEY=$(echo $CREDS | cut -d' ' -f2)"
-export AWS_SESSION_TOKEN=$(echo $CREDS | cut -d' ' -f3)
-echo "export AWS_SESSION_TOKEN=$(echo $CREDS | cut -d' ' -f3)"
\ No newline at end of file
+eval "$CREDS"
@@ -0,0 +1,259 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Synthetic terraform plans for the benchmarks.
+#
+# Writes a `terraform show -json` document of any size whose resources
+# follow the test fixtures: resource types are drawn with the frequency they
+# have in test/*.tf and the types the feature files check get the attributes
+# the fixtures give them. A share of the resources (--violations) breaks the
+# rules they are checked against, so failing paths are measured as well.
+# Resources are grouped in child modules of MODULE_SIZE and every
+# aws_cloudtrail refers to a bucket of its module in the configuration.
+#
+# A resource only depends on the seed and its index, the document is written
+# one resource at a time and the generator's memory stays flat.
+#
+# Usage (from security-and-compliance-code):
+#   python3 -m benchmarks.generate --resources 10000 -o plan.out.json [--seed 1] [--violations 0.1]
+
+import argparse
+import collections
+import json
+import os
+import random
+import re
+import sys
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test')
+MODULE_SIZE = 200
+# Bumped whenever the generated documents change, results of different versions are not comparable
+VERSION = 1
+
+_RESOURCE = re.compile(r'^resource\s+"([a-z0-9_]+)"', re.MULTILINE)
+
+
+def fixture_weights(fixtures_dir=FIXTURES_DIR):
+    counts = collections.Counter()
+    for name in sorted(os.listdir(fixtures_dir)):
+        if name.endswith('.tf'):
+            with open(os.path.join(fixtures_dir, name), 'r') as f:
+                counts.update(_RESOURCE.findall(f.read()))
+    return sorted(counts.items())
+
+
+def _tags(rng, name, bad):
+    if bad and rng.random() < 0.5:
+        return {}
+    return {'Name': name, 'Environment': rng.choice(['dev', 'test', 'prod'])}
+
+
+def _s3_bucket(rng, name, bad):
+    return {
+        'bucket': name, 'acl': 'public-read' if bad else 'private', 'force_destroy': False, 'policy': None,
+        'server_side_encryption_configuration': [] if bad else [{'rule': [{'apply_server_side_encryption_by_default': [{'sse_algorithm': 'aws:kms', 'kms_master_key_id': None}]}]}],
+        'lifecycle_rule': [{'id': 'tmp', 'enabled': True, 'prefix': 'tmp/', 'expiration': [{'days': rng.choice([30, 90, 365])}]}],
+        'versioning': [{'enabled': True, 'mfa_delete': False}],
+        'logging': [{'target_bucket': 'logs', 'target_prefix': name + '/'}],
+        'tags': _tags(rng, name, bad)
+    }
+
+
+def _instance(rng, name, bad):
+    return {
+        'ami': 'ami-0323c3dd2da7fb37d', 'instance_type': rng.choice(['t2.micro', 't3.small', 'm5.large']),
+        'iam_instance_profile': None if bad else 'test_profile', 'key_name': 'ec2-key-pair', 'monitoring': rng.random() < 0.5,
+        'root_block_device': [{'volume_size': rng.choice([8, 20, 100]), 'volume_type': 'gp2', 'encrypted': not bad, 'delete_on_termination': True}],
+        'tags': _tags(rng, name, bad)
+    }
+
+
+def _rule(rng, bad):
+    port = rng.choice([22, 80, 443, 3306, 8080])
+    return {
+        'from_port': port if not bad else 0, 'to_port': port if not bad else 65535, 'protocol': rng.choice(['tcp', 'udp']) if bad else 'tcp',
+        'cidr_blocks': ['0.0.0.0/0'] if bad or port in (80, 443) else ['10.0.0.0/8'], 'ipv6_cidr_blocks': [],
+        'prefix_list_ids': [], 'security_groups': [], 'self': False, 'description': ''
+    }
+
+
+def _security_group(rng, name, bad):
+    return {
+        'name': name, 'description': 'Managed by Terraform', 'vpc_id': 'vpc-0123456789',
+        'ingress': [_rule(rng, bad and i == 0) for i in range(rng.randint(1, 4))],
+        'egress': [{'from_port': 0, 'to_port': 0, 'protocol': '-1', 'cidr_blocks': ['0.0.0.0/0'], 'ipv6_cidr_blocks': [],
+                    'prefix_list_ids': [], 'security_groups': [], 'self': False, 'description': ''}],
+        'tags': _tags(rng, name, bad)
+    }
+
+
+_ALARMS = [
+    ('AWS/EC2', 'CPUUtilization', 'AutoScalingGroupName'),
+    ('AWS/NetworkELB', 'HealthyHostCount', 'LoadBalancer'),
+    ('AWS/NetworkELB', 'UnHealthyHostCount', 'LoadBalancer'),
+    ('AWS/DynamoDB', 'ConsumedWriteCapacityUnits', 'TableName')
+]
+
+
+def _metric_alarm(rng, name, bad):
+    namespace, metric, dimension = rng.choice(_ALARMS)
+    return {
+        'alarm_name': name, 'comparison_operator': 'GreaterThanOrEqualToThreshold', 'evaluation_periods': 2,
+        'namespace': namespace, 'metric_name': metric, 'period': 300 if bad else 60, 'statistic': 'Average', 'threshold': 80,
+        'dimensions': {('TargetGroup' if bad else dimension): name}, 'alarm_actions': [],
+        'tags': _tags(rng, name, bad)
+    }
+
+
+def _cloudtrail(rng, name, bad):
+    return {
+        'name': name, 's3_bucket_name': None, 's3_key_prefix': 'prefix', 'include_global_service_events': False,
+        'enable_logging': True, 'enable_log_file_validation': not bad, 'is_multi_region_trail': not bad,
+        'kms_key_id': None if bad else 'arn:aws:kms:us-east-1:111111111111:key/' + name,
+        'tags': _tags(rng, name, bad)
+    }
+
+
+def _ebs_volume(rng, name, bad):
+    return {'availability_zone': 'us-east-1a', 'size': rng.choice([8, 40, 100]), 'encrypted': not bad, 'tags': _tags(rng, name, bad)}
+
+
+def _dlm_lifecycle_policy(rng, name, bad):
+    return {'description': 'example DLM lifecycle policy', 'state': 'DISABLED' if bad else 'ENABLED', 'execution_role_arn': 'arn', 'tags': _tags(rng, name, bad)}
+
+
+def _instance_profile(rng, name, bad):
+    return {'name': name, 'role': None if bad else 'role-' + name}
+
+
+def _lambda_function(rng, name, bad):
+    return {
+        'function_name': name, 'handler': 'index.lambda_handler', 'role': 'arn', 'timeout': 25,
+        'runtime': 'python2.7' if bad else rng.choice(['python3.6', 'python3.8', 'nodejs12.x']),
+        'tags': _tags(rng, name, bad)
+    }
+
+
+def _generic(rng, name, bad):
+    return {'name': name, 'tags': _tags(rng, name, bad)}
+
+
+TEMPLATES = {
+    'aws_s3_bucket': _s3_bucket,
+    'aws_instance': _instance,
+    'aws_security_group': _security_group,
+    'aws_cloudwatch_metric_alarm': _metric_alarm,
+    'aws_cloudtrail': _cloudtrail,
+    'aws_ebs_volume': _ebs_volume,
+    'aws_dlm_lifecycle_policy': _dlm_lifecycle_policy,
+    'aws_iam_instance_profile': _instance_profile,
+    'aws_lambda_function': _lambda_function
+}
+
+# Attributes only known after apply
+UNKNOWN = {'id': True, 'arn': True}
+
+
+class Generator:
+
+    def __init__(self, seed=1, violations=0.1, weights=None):
+        self.seed = seed
+        self.violations = violations
+        weights = weights or fixture_weights()
+        self.types = [resource_type for resource_type, _ in weights]
+        self.cumulative = []
+        total = 0
+        for _, weight in weights:
+            total += weight
+            self.cumulative.append(total)
+
+    def resource(self, index):
+        # (module, type, name, values) of the index-th resource
+        rng = random.Random(self.seed * 1000003 + index)
+        resource_type = rng.choices(self.types, cum_weights=self.cumulative)[0]
+        name = 'r{}'.format(index)
+        bad = rng.random() < self.violations
+        values = TEMPLATES.get(resource_type, _generic)(rng, name, bad)
+        return 'module.m{}'.format(index // MODULE_SIZE), resource_type, name, values
+
+    def modules(self, count):
+        # [(module address, [resource indexes])]
+        return [
+            ('module.m{}'.format(start // MODULE_SIZE), range(start, min(start + MODULE_SIZE, count)))
+            for start in range(0, count, MODULE_SIZE)
+        ]
+
+    def write(self, path, count):
+        modules = self.modules(count)
+        with open(path, 'w') as f:
+            f.write('{"format_version":"0.1","terraform_version":"0.13.5","planned_values":{"root_module":{"resources":[],"child_modules":[')
+            for module_number, (module, indexes) in enumerate(modules):
+                f.write((',' if module_number else '') + '{"address":' + json.dumps(module) + ',"resources":[')
+                for position, index in enumerate(indexes):
+                    _, resource_type, name, values = self.resource(index)
+                    f.write((',' if position else '') + json.dumps({
+                        'address': '{}.{}.{}'.format(module, resource_type, name), 'mode': 'managed', 'type': resource_type, 'name': name,
+                        'provider_name': 'registry.terraform.io/hashicorp/aws', 'schema_version': 0, 'values': values
+                    }))
+                f.write(']}')
+            f.write(']}},"resource_changes":[')
+            for index in range(count):
+                module, resource_type, name, values = self.resource(index)
+                f.write((',' if index else '') + json.dumps({
+                    'address': '{}.{}.{}'.format(module, resource_type, name), 'module_address': module, 'mode': 'managed',
+                    'type': resource_type, 'name': name, 'provider_name': 'registry.terraform.io/hashicorp/aws',
+                    'change': {'actions': ['create'], 'before': None, 'after': values, 'after_unknown': UNKNOWN}
+                }))
+            f.write('],"configuration":{"root_module":{"module_calls":{')
+            for module_number, (module, indexes) in enumerate(modules):
+                f.write((',' if module_number else '') + json.dumps(module.split('.', 1)[1]) + ':{"source":"./service","module":{"resources":[')
+                buckets = []
+                for position, index in enumerate(indexes):
+                    _, resource_type, name, _ = self.resource(index)
+                    expressions = {'tags': {'constant_value': {'Name': name}}}
+                    if resource_type == 'aws_s3_bucket':
+                        buckets.append(name)
+                    elif resource_type == 'aws_cloudtrail' and buckets:
+                        bucket = 'aws_s3_bucket.' + buckets[-1]
+                        expressions['s3_bucket_name'] = {'references': [bucket + '.id', bucket]}
+                    f.write((',' if position else '') + json.dumps({
+                        'address': '{}.{}'.format(resource_type, name), 'mode': 'managed', 'type': resource_type, 'name': name,
+                        'provider_config_key': 'aws', 'expressions': expressions, 'schema_version': 0
+                    }))
+                f.write(']}}')
+            f.write('}}}}')
+
+
+def write_plan(path, count, seed=1, violations=0.1):
+    Generator(seed, violations).write(path, count)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic terraform plan JSON modelled on the test fixtures')
+    parser.add_argument('--resources', type=int, default=1000)
+    parser.add_argument('-o', '--output', required=True, help='File the plan JSON is written to')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--violations', type=float, default=0.1, help='Share of resources breaking the rules they are checked against')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    write_plan(args.output, args.resources, args.seed, args.violations)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
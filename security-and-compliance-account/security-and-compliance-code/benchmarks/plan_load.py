@@ -0,0 +1,97 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Peak memory of loading a large plan.
+#
+# Writes a synthetic `terraform show -json` document with --resources
+# resources (benchmarks/generate.py) and loads it in a fresh process per
+# loader, so each peak RSS only covers that loader:
+#   full     Plan.load() of the whole document (json.load)
+#   stream   Plan.stream() keeping the attributes read by the feature files
+#
+# Usage (from security-and-compliance-code):
+#   python3 -m benchmarks.plan_load --resources 100000 [-f ./src/] [--output results.json]
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import generate
+from compliance.engine import Engine
+from compliance.plan import Plan
+
+LOADERS = ('full', 'stream')
+
+
+def measure(loader, plan_path, features_dir):
+    # Runs in its own process, see main()
+    attributes = Engine.from_directory(features_dir).referenced_attributes() if loader == 'stream' else None
+    start = time.perf_counter()
+    plan = Plan.stream(plan_path, attributes) if loader == 'stream' else Plan.load(plan_path)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        'loader': loader,
+        'resources': len(plan.resources),
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Peak memory of the full and streaming plan loaders')
+    parser.add_argument('--resources', type=int, default=100000, help='Resources in the synthetic plan')
+    parser.add_argument('--plan', default=None, help='Existing plan JSON to load instead of a synthetic one')
+    parser.add_argument('-f', '--features', default='./src/', help='Directory holding the .feature files')
+    parser.add_argument('--output', default=None, help='File the results are written to as JSON')
+    parser.add_argument('--measure', choices=LOADERS, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.plan, args.features)))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plan_path = args.plan
+        if not plan_path:
+            plan_path = os.path.join(tmp, 'plan.out.json')
+            generate.write_plan(plan_path, args.resources)
+        size_mb = round(os.path.getsize(plan_path) / (1 << 20), 1)
+        results = []
+        for loader in LOADERS:
+            output = subprocess.check_output(
+                [sys.executable, '-m', 'benchmarks.plan_load', '--measure', loader, '--plan', plan_path, '-f', args.features],
+                universal_newlines=True
+            )
+            result = json.loads(output)
+            result['plan_mb'] = size_mb
+            results.append(result)
+            print('{loader:<7} {resources} resources from {plan_mb} MB in {seconds}s, peak RSS {peak_rss_mb} MB'.format(**result))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
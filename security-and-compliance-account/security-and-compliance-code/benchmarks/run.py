@@ -0,0 +1,226 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Benchmark harness.
+#
+# For every plan size a synthetic plan is generated (benchmarks/generate.py,
+# kept in the work directory between runs) and checked in a fresh process
+# that times the phases separately:
+#   parse      Plan.load() of the plan JSON
+#   evaluate   evaluation of each feature file on its own, serially
+#   report     cucumber JSON, BDD XML, summary and HTML report of that feature
+# and records the peak RSS of the process. Nothing needs the network or
+# terraform.
+#
+# Results are written to <results dir>/<time>-<commit>.json and two result
+# files are compared with `compare`, which exits with 1 when a timing or the
+# peak RSS grew by more than --threshold.
+#
+# Usage (from security-and-compliance-code):
+#   python3 -m benchmarks.run run [--sizes 1000,10000,100000] [--results-dir benchmarks/results]
+#   python3 -m benchmarks.run compare benchmarks/results/<base>.json benchmarks/results/<new>.json
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import generate
+from compliance import gherkin
+from compliance import report
+from compliance import results
+from compliance import runner
+from compliance.engine import Engine, to_cucumber
+from compliance.plan import Plan
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), 'compliance-benchmarks')
+DEFAULT_SIZES = '1000,10000,100000'
+
+# Differences below these are noise whatever their ratio
+MIN_SECONDS = 0.05
+MIN_RSS_MB = 5
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure(plan_path, features_dir):
+    # Runs in its own process so the peak RSS only covers this plan
+    start = time.perf_counter()
+    plan = Plan.load(plan_path)
+    measured = {'resources': len(plan.resources), 'parse_s': round(time.perf_counter() - start, 3), 'features': {}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for feature in gherkin.load_features(features_dir):
+            name = os.path.basename(feature.uri)
+            engine = Engine([feature])
+            start = time.perf_counter()
+            feature_results = engine.evaluate(plan)
+            evaluate_s = time.perf_counter() - start
+
+            reports_dir = os.path.join(tmp, name)
+            os.makedirs(reports_dir)
+            start = time.perf_counter()
+            features = to_cucumber(feature_results)
+            cucumber_json = os.path.join(reports_dir, runner.CUCUMBER_JSON)
+            results.write_cucumber_json(features, cucumber_json)
+            summary = results.summarize(features)
+            results.write_bdd_xml(features, os.path.join(reports_dir, runner.BDD_XML), summary)
+            results.write_summary(summary, os.path.join(reports_dir, runner.SUMMARY_JSON))
+            report.generate(cucumber_json, reports_dir)
+            report_s = time.perf_counter() - start
+
+            measured['features'][name] = {
+                'evaluate_s': round(evaluate_s, 3),
+                'report_s': round(report_s, 3),
+                'scenarios': summary['scenarios']
+            }
+    measured['peak_rss_mb'] = peak_rss_mb()
+    return measured
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARKS_DIR, stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD', '--', '.'], cwd=os.path.dirname(BENCHMARKS_DIR), stderr=subprocess.DEVNULL) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def run(sizes, features_dir, work_dir, results_dir, seed=1, violations=0.1):
+    os.makedirs(work_dir, exist_ok=True)
+    commit, dirty = git_commit()
+    benchmark = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'generator_version': generate.VERSION,
+        'seed': seed,
+        'violations': violations,
+        'sizes': {}
+    }
+    for size in sizes:
+        plan_path = os.path.join(work_dir, 'plan-v{}-s{}-v{}-{}.json'.format(generate.VERSION, seed, violations, size))
+        if not os.path.exists(plan_path):
+            generate.write_plan(plan_path + '.tmp', size, seed, violations)
+            os.replace(plan_path + '.tmp', plan_path)
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.run', 'measure', plan_path, '-f', features_dir],
+            universal_newlines=True
+        )
+        measured = benchmark['sizes'][str(size)] = json.loads(output)
+        print('{} resources: parse {}s, peak RSS {} MB'.format(size, measured['parse_s'], measured['peak_rss_mb']))
+        for name, feature in sorted(measured['features'].items()):
+            print('  {:<28} evaluate {:>8.3f}s  report {:>8.3f}s'.format(name, feature['evaluate_s'], feature['report_s']))
+
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, '{}-{}{}.json'.format(
+        time.strftime('%Y%m%dT%H%M%S', time.gmtime()), commit[:12], '-dirty' if dirty else ''))
+    with open(path, 'w') as f:
+        json.dump(benchmark, f, indent=2, sort_keys=True)
+    print('Results written to ' + path)
+    return path
+
+
+def metrics(benchmark):
+    # {(size, metric): value} of a result file
+    found = {}
+    for size, measured in benchmark['sizes'].items():
+        found[(size, 'parse_s')] = measured['parse_s']
+        found[(size, 'peak_rss_mb')] = measured['peak_rss_mb']
+        for name, feature in measured['features'].items():
+            found[(size, name + ' evaluate_s')] = feature['evaluate_s']
+            found[(size, name + ' report_s')] = feature['report_s']
+    return found
+
+
+def compare(base, new, threshold):
+    # Returns the regressions, [(size, metric, base value, new value)]
+    if (base.get('generator_version'), base.get('seed'), base.get('violations')) != (new.get('generator_version'), new.get('seed'), new.get('violations')):
+        print('Warning: the results were measured on different synthetic plans')
+    base_metrics = metrics(base)
+    regressions = []
+    for key, value in sorted(metrics(new).items(), key=lambda entry: (int(entry[0][0]), entry[0][1])):
+        if key not in base_metrics:
+            continue
+        size, metric = key
+        before = base_metrics[key]
+        floor = MIN_RSS_MB if metric == 'peak_rss_mb' else MIN_SECONDS
+        change = (value - before) / before if before else 0
+        regressed = value - before > floor and change > threshold
+        if regressed:
+            regressions.append((size, metric, before, value))
+        print('{:>7} {:<40} {:>10} {:>10} {:>+7.1%}{}'.format(size, metric, before, value, change, '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the compliance checks on synthetic plans')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', help='Measure every plan size and store the results')
+    run_parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma separated resource counts, defaults to ' + DEFAULT_SIZES)
+    run_parser.add_argument('-f', '--features', default='./src/', help='Directory holding the .feature files')
+    run_parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR, help='Directory the generated plans are kept in')
+    run_parser.add_argument('--results-dir', default=DEFAULT_RESULTS_DIR, help='Directory the results are written to')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--violations', type=float, default=0.1, help='Share of resources breaking the rules')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='Relative growth reported as a regression, defaults to 0.2')
+
+    measure_parser = subparsers.add_parser('measure', help=argparse.SUPPRESS)
+    measure_parser.add_argument('plan')
+    measure_parser.add_argument('-f', '--features', default='./src/')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'measure':
+        print(json.dumps(measure(args.plan, args.features)))
+        return 0
+    if args.command == 'run':
+        sizes = [int(size) for size in args.sizes.split(',') if size]
+        run(sizes, args.features, args.work_dir, args.results_dir, args.seed, args.violations)
+        return 0
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    regressions = compare(base, new, args.threshold)
+    print('{} regressions'.format(len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,36 +23,83 @@ arg_reports_dir=$2
 # Tag that identifies specific features to be run
 arg_tag=$3
 
-# Create Terraform Plan
+# Plan cache location (s3://bucket/prefix or a local directory). Caching is disabled when not set.
+var_plan_cache_store=$PLAN_CACHE_STORE
+export PYTHONPATH=$CODEBUILD_SRC_DIR
+
+# Workloads unchanged since their last passing check reuse its reports (CHANGE_STATE_STORE), see compliance/change_state.py
+python3 -m compliance.change_state restore $arg_tf_dir $arg_reports_dir
+var_restore_code=$?
+if [ $var_restore_code != 3 ]
+then
+  exit $var_restore_code
+fi
+
+# Look up the plan by a hash of the terraform sources, variables, provider lock and state serial
 echo $arg_tf_dir
 cd $arg_tf_dir
-terraform init \
-  -backend-config="region=${AWS_DEFAULT_REGION}" \
-  -backend-config="bucket=${TF_BACKEND_S3_BUCKET}"
-terraform plan -var "region=${AWS_DEFAULT_REGION}" -out="plan.out"
+var_plan_json=$arg_tf_dir/plan.out.json
+var_plan_cache_hit=1
+if [[ $var_plan_cache_store != "" ]]
+then
+  var_plan_key=$(python3 -m compliance.plan_cache key $arg_tf_dir \
+    --var "region=${AWS_DEFAULT_REGION}" \
+    --backend-bucket "${TF_BACKEND_S3_BUCKET}" \
+    --extra "$(terraform version | head -1)")
+  if [[ $var_plan_key != "" ]]
+  then
+    python3 -m compliance.plan_cache get --store $var_plan_cache_store --key $var_plan_key --dest $var_plan_json
+    var_plan_cache_hit=$?
+  fi
+fi
+
+# Create Terraform Plan unless it was restored from the cache
+if [ $var_plan_cache_hit != 0 ]
+then
+  # Providers come from the shared mirror when it can be set up, otherwise terraform downloads them
+  eval "$(python3 -m compliance.provider_mirror env $arg_tf_dir ${PROVIDER_MIRROR_STORE:+--store $PROVIDER_MIRROR_STORE})"
+  terraform init \
+    -backend-config="region=${AWS_DEFAULT_REGION}" \
+    -backend-config="bucket=${TF_BACKEND_S3_BUCKET}"
+  terraform plan -var "region=${AWS_DEFAULT_REGION}" -out="plan.out" && \
+    terraform show -json plan.out > $var_plan_json
+  var_plan_resp_code=$?
+  # Only successful plans are cached
+  if [[ $var_plan_key != "" ]] && [ $var_plan_resp_code == 0 ]
+  then
+    python3 -m compliance.plan_cache put --store $var_plan_cache_store --key $var_plan_key --plan $var_plan_json
+  fi
+fi
 
 # Check for compliance
+# The plan is evaluated once and the cucumber json, bdd xml and summary reports are all written from that run
+# The resource inventory of the plan is written with the reports and published to INVENTORY_STORE as TF_APP_ID, see compliance/inventory.py
+# A running compliance server (COMPLIANCE_SERVER=unix:<socket> or host:port) evaluates with rules it already loaded,
+# see compliance/server.py. The check falls back to a local evaluation when it is not reachable or holds other rules
 cd $CODEBUILD_SRC_DIR
+var_runner="compliance.runner"
+if [[ $COMPLIANCE_SERVER != "" ]]
+then
+  var_runner="compliance.server check --server $COMPLIANCE_SERVER"
+fi
 if [[ $arg_tag != "" ]]
 then
   echo "Compliance check requested for tag $arg_tag"
-  terraform-compliance -f ./src/ -p $arg_tf_dir/plan.out --cucumber-json=$arg_reports_dir/test.json --tags $arg_tag
-  terraform-compliance -f ./src/ -p $arg_tf_dir/plan.out --bdd-xml=$arg_reports_dir/test.xml --tags $arg_tag
+  python3 -m $var_runner -f ./src/ -p $var_plan_json -o $arg_reports_dir --tags $arg_tag
 else
   echo "Compliance check requested for all tags"
-  terraform-compliance -f ./src/ -p $arg_tf_dir/plan.out --cucumber-json=$arg_reports_dir/test.json
-  terraform-compliance -f ./src/ -p $arg_tf_dir/plan.out --bdd-xml=$arg_reports_dir/test.xml
+  python3 -m $var_runner -f ./src/ -p $var_plan_json -o $arg_reports_dir
 fi
 
 # Handle reponse
 var_resp_code=$?
 
-# Generate Cucumber report
-sed -i 's/\.[0-9]*,/,/g' $arg_reports_dir/test.json
-java -jar ./lib/cucumber-sandwich.jar -f $arg_reports_dir -o $arg_reports_dir -n
+# Generate Cucumber html report and the json consumed by the CodeBuild report group
+python3 -m compliance.report -f $arg_reports_dir/test.json -o $arg_reports_dir
 if [ $var_resp_code == 0 ]
 then
   echo Success
+  python3 -m compliance.change_state record $arg_tf_dir $arg_reports_dir --plan $var_plan_json
   exit 0
 else
   echo Failure
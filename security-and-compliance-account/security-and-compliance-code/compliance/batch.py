@@ -0,0 +1,255 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Batch compliance check.
+#
+# Checks several terraform workloads in one build instead of one build per
+# workload. The toolchain is installed once, the feature files are parsed
+# once into an Engine shared by every workload, and the terraform plans run
+# concurrently. Each plan is evaluated as soon as it is ready, while the
+# other plans are still running. Every workload gets its own reports under
+# <reports>/<APP_ID>/, including its resource inventory which is published
+# to $INVENTORY_STORE. A summary of the batch is written to
+# <reports>/batch-summary.json.
+#
+# pull fetches the workloads listed in $TF_WORKLOADS (a JSON list of the
+# TERRAFORM_APPLICATION_WORKLOADS entries of cdk_stack_param.json) through
+# their git mirrors and exports each src directory to <dest>/<APP_ID>/.
+#
+# check takes its workloads from --sources, a space separated list of
+#   <APP_ID>:<VAR>   an input artifact holding one workload
+#   <VAR>            an input artifact holding one workload per subdirectory
+# where VAR names the CODEBUILD_SRC_DIR_* variable of the artifact (or is a
+# plain directory path).
+#
+# Usage:
+#   python3 -m compliance.batch pull --workloads "$TF_WORKLOADS" --dest $HOME/tf-workload
+#   python3 -m compliance.batch check --sources "$TF_BATCH_SOURCES" -f ./src/ -o $HOME/reports
+
+import argparse
+import concurrent.futures
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from compliance import change_state
+from compliance import inventory
+from compliance import report
+from compliance import results
+from compliance import rule_bundle
+from compliance import runner
+from compliance import terraform
+from compliance.credentials import role_environment
+from compliance.engine import exit_code, to_cucumber
+from compliance.plan import Plan
+from compliance.store import open_store
+
+BATCH_SUMMARY_JSON = 'batch-summary.json'
+TERRAFORM_LOG = 'terraform.log'
+WORKLOAD_SRC_DIR = 'src'
+
+
+def pull_workload(workload, dest_dir, store=None, state=None, ruleset=None):
+    env = role_environment(workload['CROSS_ACCOUNT_ROLE_ARN'], 'compliance-batch')
+    target = os.path.join(dest_dir, workload['APP_ID'])
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    with tempfile.TemporaryDirectory(dir=dest_dir) as tmp:
+        source = change_state.pull(workload['APP_ID'], workload['GIT_REPO_URL'], tmp, [WORKLOAD_SRC_DIR], state, ruleset, store, env)
+        if source['skipped']:
+            os.makedirs(target)
+        else:
+            os.rename(os.path.join(tmp, WORKLOAD_SRC_DIR), target)
+    change_state.write_source(target, source)
+    return target, source
+
+
+def pull(workloads, dest_dir, concurrency, store=None, state=None):
+    os.makedirs(dest_dir, exist_ok=True)
+    ruleset = change_state.RuleSet()
+    if state:
+        state.save_rules(ruleset.rules, ruleset.scenarios)
+    resp_code = 0
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        futures = dict(
+            (executor.submit(pull_workload, workload, dest_dir, store, state, ruleset), workload['APP_ID'])
+            for workload in workloads
+        )
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                target, source = future.result()
+                if source['skipped']:
+                    print('{} {} at {}, check skipped'.format(futures[future], source['reason'], source['commit']))
+                else:
+                    print('Pulled {} into {}'.format(futures[future], target))
+            except (subprocess.CalledProcessError, OSError, ValueError) as e:
+                print('Pull failed for {}: {}'.format(futures[future], e))
+                resp_code = 1
+    return resp_code
+
+
+def resolve_sources(sources):
+    # Returns [(APP_ID, directory)]
+    workloads = []
+    for source in sources.split():
+        app_id, _, name = source.rpartition(':')
+        directory = os.environ.get(name, name)
+        if app_id:
+            workloads.append((app_id, directory))
+            continue
+        for entry in sorted(os.listdir(directory)):
+            if os.path.isdir(os.path.join(directory, entry)):
+                workloads.append((entry, os.path.join(directory, entry)))
+    return workloads
+
+
+def plan_workload(app_id, tf_dir, reports_dir, region, backend_bucket, cache_store, version, mirror_store):
+    workload_reports = os.path.join(reports_dir, app_id)
+    os.makedirs(workload_reports, exist_ok=True)
+    with open(os.path.join(workload_reports, TERRAFORM_LOG), 'w') as log:
+        return terraform.plan_json(tf_dir, region, backend_bucket, log, cache_store, version, mirror_store)
+
+
+def evaluate_workload(engine, app_id, plan_path, reports_dir, inventory_store=None):
+    workload_reports = os.path.join(reports_dir, app_id)
+    plan = Plan.load(plan_path, engine.referenced_attributes())
+    inventory.emit(plan, app_id, os.path.join(workload_reports, inventory.INVENTORY_JSON), inventory_store)
+    feature_results = engine.evaluate(plan)
+    features = to_cucumber(feature_results)
+    cucumber_json = os.path.join(workload_reports, runner.CUCUMBER_JSON)
+    results.write_cucumber_json(features, cucumber_json)
+    summary = results.summarize(features)
+    results.write_bdd_xml(features, os.path.join(workload_reports, runner.BDD_XML), summary)
+    results.write_summary(summary, os.path.join(workload_reports, runner.SUMMARY_JSON))
+    report.generate(cucumber_json, workload_reports)
+    return summary, exit_code(feature_results), set(plan.by_type)
+
+
+def restore_workload(state, app_id, source, reports_dir):
+    workload_reports = os.path.join(reports_dir, app_id)
+    if not state or not state.restore(source, workload_reports):
+        return {'status': 'error', 'error': 'reports of the last check at {} could not be restored'.format(source['commit'])}
+    with open(os.path.join(workload_reports, runner.SUMMARY_JSON)) as f:
+        summary = json.load(f)
+    return {'status': results.PASSED, 'scenarios': summary['scenarios'], 'reused': source['commit']}
+
+
+def check(workloads, features_dir, reports_dir, tags=None, plan_jobs=4, region=None, backend_bucket=None, cache_store=None, mirror_store=None,
+          state=None, inventory_store=None):
+    os.makedirs(reports_dir, exist_ok=True)
+    # The rules are parsed once and every workload is evaluated against the same Engine
+    engine = rule_bundle.load_engine(features_dir, tags)
+    version = terraform.terraform_version()
+    mirror_store = open_store(mirror_store) if mirror_store else None
+    inventory_store = open_store(inventory_store) if inventory_store else None
+    batch_summary = {}
+
+    # Workloads unchanged since their last passing check reuse its reports
+    sources = dict((app_id, change_state.read_source(tf_dir)) for app_id, tf_dir in workloads)
+    for app_id, source in sorted(sources.items()):
+        if source and source['skipped']:
+            batch_summary[app_id] = restore_workload(state, app_id, source, reports_dir)
+            print('{}: {}, reused the check of {}'.format(app_id, batch_summary[app_id]['status'], source['commit']))
+    workloads = [(app_id, tf_dir) for app_id, tf_dir in workloads if app_id not in batch_summary]
+
+    # Evaluation stays in this process: the build's cores are already busy with the concurrent plans
+    with concurrent.futures.ThreadPoolExecutor(plan_jobs) as executor:
+        futures = dict(
+            (executor.submit(plan_workload, app_id, tf_dir, reports_dir, region, backend_bucket, cache_store, version, mirror_store), app_id)
+            for app_id, tf_dir in workloads
+        )
+        for future in concurrent.futures.as_completed(futures):
+            app_id = futures[future]
+            try:
+                plan_path = future.result()
+            except (terraform.TerraformError, OSError, subprocess.CalledProcessError) as e:
+                print('{}: plan failed, see {}/{}: {}'.format(app_id, app_id, TERRAFORM_LOG, e))
+                batch_summary[app_id] = {'status': 'error', 'error': str(e)}
+                continue
+            summary, resp_code, resource_types = evaluate_workload(engine, app_id, plan_path, reports_dir, inventory_store)
+            batch_summary[app_id] = {
+                'status': results.PASSED if resp_code == 0 else results.FAILED,
+                'scenarios': summary['scenarios']
+            }
+            if state and resp_code == 0 and sources[app_id]:
+                state.record(sources[app_id], os.path.join(reports_dir, app_id), resource_types)
+            print('{}: {}, scenarios {passed} passed, {failed} failed, {skipped} skipped'.format(
+                app_id, batch_summary[app_id]['status'], **summary['scenarios']))
+
+    with open(os.path.join(reports_dir, BATCH_SUMMARY_JSON), 'w') as f:
+        json.dump(batch_summary, f, indent=2, sort_keys=True)
+    failed = sorted(app_id for app_id, entry in batch_summary.items() if entry['status'] != results.PASSED)
+    print('Batch of {} workloads: {} passed, {} failed {}'.format(len(batch_summary), len(batch_summary) - len(failed), len(failed), ' '.join(failed)))
+    return 1 if failed else 0
+
+
+def change_state_from(location):
+    return change_state.ChangeState(open_store(location)) if location else None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compliance check of several terraform workloads in one build')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    pull_parser = subparsers.add_parser('pull', help='Clone the workloads into one directory per APP_ID')
+    pull_parser.add_argument('--workloads', default=os.environ.get('TF_WORKLOADS'), help='JSON list of workloads, defaults to $TF_WORKLOADS')
+    pull_parser.add_argument('--dest', required=True, help='Directory the workloads are copied to')
+    pull_parser.add_argument('--concurrency', type=int, default=4, help='Workloads cloned at the same time')
+    pull_parser.add_argument('--git-mirror-store', default=os.environ.get('GIT_MIRROR_STORE'),
+                             help='Store keeping the git mirrors of the workloads, defaults to $GIT_MIRROR_STORE')
+    pull_parser.add_argument('--change-state-store', default=os.environ.get('CHANGE_STATE_STORE'),
+                             help='Store of the last passing checks, unchanged workloads are skipped, defaults to $CHANGE_STATE_STORE')
+
+    check_parser = subparsers.add_parser('check', help='Plan and evaluate every workload of the batch')
+    check_parser.add_argument('--sources', default=os.environ.get('TF_BATCH_SOURCES'), help='Workload sources, defaults to $TF_BATCH_SOURCES')
+    check_parser.add_argument('-f', '--features', required=True, help='Directory holding the .feature files, or a rule bundle')
+    check_parser.add_argument('-o', '--reports-dir', required=True, help='Directory the per workload reports are written to')
+    check_parser.add_argument('--tags', default=None, help='Only run features/scenarios matching the tag')
+    check_parser.add_argument('--plan-jobs', type=int, default=int(os.environ.get('TF_PLAN_JOBS', 4)),
+                              help='Terraform plans run at the same time, defaults to $TF_PLAN_JOBS or 4')
+    check_parser.add_argument('--region', default=os.environ.get('AWS_DEFAULT_REGION'))
+    check_parser.add_argument('--backend-bucket', default=os.environ.get('TF_BACKEND_S3_BUCKET'))
+    check_parser.add_argument('--plan-cache-store', default=os.environ.get('PLAN_CACHE_STORE'))
+    check_parser.add_argument('--provider-mirror-store', default=os.environ.get('PROVIDER_MIRROR_STORE'))
+    check_parser.add_argument('--change-state-store', default=os.environ.get('CHANGE_STATE_STORE'))
+    check_parser.add_argument('--inventory-store', default=os.environ.get('INVENTORY_STORE'))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'pull':
+        if not args.workloads:
+            print('No workloads given')
+            return 1
+        store = open_store(args.git_mirror_store) if args.git_mirror_store else None
+        return pull(json.loads(args.workloads), args.dest, args.concurrency, store, change_state_from(args.change_state_store))
+
+    if not args.sources:
+        print('No workload sources given')
+        return 1
+    return check(
+        resolve_sources(args.sources), args.features, args.reports_dir, args.tags,
+        args.plan_jobs, args.region, args.backend_bucket, args.plan_cache_store, args.provider_mirror_store,
+        change_state_from(args.change_state_store), args.inventory_store
+    )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
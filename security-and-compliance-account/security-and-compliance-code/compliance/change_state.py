@@ -0,0 +1,292 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Change scoped compliance checks.
+#
+# A workload only needs to be checked again when its code changed or the
+# compliance rules changed in a way that can affect it. The store keeps, per
+# workload, the state of its last passing check together with that check's
+# reports:
+#   <key>/state.json      {"workload", "url", "paths", "commit", "engine", "rules", "resource_types"}
+#   <key>/reports.tar.gz  the reports directory of that check
+#   rules/<rules>.json    snapshot of the rules a check ran with (compliance/impact.py)
+# where key is <APP_ID>/<hash of the repository url and the pulled paths>, so
+# workloads sharing a repository keep their own state. engine is a fingerprint
+# of the checker itself: the compliance package, compliance-check.sh and the
+# buildspecs of the pull and check steps. resource_types are the types of the
+# checked plan.
+#
+# The pull step compares `git ls-remote` of the repository and the
+# fingerprints against the state. A workload is skipped when its commit and
+# the checker are the same and the rules either did not change or only
+# changed scenarios selecting resource types the workload does not have.
+# Skipped workloads are not pulled at all; the pulled directory then only
+# holds SOURCE_FILE marking it as skipped, and the check step restores the
+# last reports instead of planning. Checks of pulled workloads record their
+# state once they pass, failed checks are never reused.
+#
+# Usage:
+#   python3 -m compliance.change_state pull $REPO_URL --workload $TF_APP_ID --dest ./workload --path src --role-arn $ROLE
+#   python3 -m compliance.change_state restore ./workload $HOME/reports    (exit code 3: not skipped)
+#   python3 -m compliance.change_state record ./workload $HOME/reports --plan plan.out.json
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+from compliance import git_mirror
+from compliance import impact
+from compliance import inventory
+from compliance.credentials import role_environment
+from compliance.plan import Plan
+from compliance.store import open_store
+
+SOURCE_FILE = '.compliance-source.json'
+STATE_KEY = 'state.json'
+REPORTS_KEY = 'reports.tar.gz'
+# Exit code of restore for sources that have to be checked
+NOT_SKIPPED = 3
+
+RULES_PREFIX = 'rules'
+
+# What the checker fingerprint covers, relative to the compliance repository
+ENGINE_DIRS = [('compliance', '.py')]
+ENGINE_FILES = [
+    'compliance-check.sh',
+    'buildspec-code-pull.yml',
+    'buildspec-code-pull-batch.yml',
+    'buildspec-compliance-check.yml',
+    'buildspec-compliance-check-batch.yml'
+]
+FEATURES_DIR = 'src'
+
+
+def engine_fingerprint(root='.'):
+    digest = hashlib.sha256()
+    paths = [os.path.join(root, name) for name in ENGINE_FILES]
+    for directory, extension in ENGINE_DIRS:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, directory)):
+            dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+            paths.extend(os.path.join(dirpath, name) for name in filenames if name.endswith(extension))
+    for path in sorted(paths):
+        if not os.path.isfile(path):
+            continue
+        digest.update(os.path.relpath(path, root).encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def state_key(workload, url, paths):
+    digest = hashlib.sha256('\0'.join([url] + sorted(paths)).encode('utf-8')).hexdigest()[:24]
+    return '{}/{}'.format(workload, digest)
+
+
+def source_key(source):
+    return state_key(source['workload'], source['url'], source['paths'])
+
+
+def remote_commit(url, ref='HEAD', env=None):
+    output = git_mirror.git(['ls-remote', url, ref], env=env)
+    return output.split()[0] if output.strip() else None
+
+
+def read_source(source_dir):
+    try:
+        with open(os.path.join(source_dir, SOURCE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_source(source_dir, source):
+    os.makedirs(source_dir, exist_ok=True)
+    with open(os.path.join(source_dir, SOURCE_FILE), 'w') as f:
+        json.dump(source, f, indent=2, sort_keys=True)
+
+
+class ChangeState:
+
+    def __init__(self, store):
+        self.store = store
+
+    def last(self, key):
+        text = self.store.get_text('{}/{}'.format(key, STATE_KEY))
+        return json.loads(text) if text else None
+
+    def save_rules(self, rules, scenarios):
+        key = '{}/{}.json'.format(RULES_PREFIX, rules)
+        if self.store.get_text(key) is None:
+            self.store.put_text(key, json.dumps(scenarios, sort_keys=True))
+
+    def load_rules(self, rules):
+        text = self.store.get_text('{}/{}.json'.format(RULES_PREFIX, rules))
+        return json.loads(text) if text else None
+
+    def skip_reason(self, key, commit, engine, rules, scenarios):
+        # Why the last check of the workload still holds, None when it has to be checked
+        last = self.last(key)
+        if not last or last['commit'] != commit or last['engine'] != engine:
+            return None
+        if last['rules'] == rules:
+            return 'unchanged'
+        old = self.load_rules(last['rules'])
+        if old is None or last.get('resource_types') is None:
+            return None
+        if impact.affects(old, scenarios, last['resource_types']):
+            return None
+        return 'unaffected'
+
+    def record(self, source, reports_dir, resource_types=None):
+        key = source_key(source)
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            for name in sorted(os.listdir(reports_dir)):
+                tar.add(os.path.join(reports_dir, name), name)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, REPORTS_KEY)
+            with open(path, 'wb') as f:
+                f.write(buffer.getvalue())
+            self.store.put('{}/{}'.format(key, REPORTS_KEY), path)
+        # The state goes last so it never points at reports of another check
+        self.store.put_text('{}/{}'.format(key, STATE_KEY), json.dumps({
+            'workload': source['workload'],
+            'url': source['url'],
+            'paths': source['paths'],
+            'commit': source['commit'],
+            'engine': source['engine'],
+            'rules': source['rules'],
+            'resource_types': sorted(resource_types) if resource_types is not None else None,
+            'time': int(time.time())
+        }, sort_keys=True))
+
+    def restore(self, source, reports_dir):
+        key = source_key(source)
+        last = self.last(key)
+        if not last or last['commit'] != source['commit'] or last['engine'] != source['engine']:
+            return False
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, REPORTS_KEY)
+            if not self.store.get('{}/{}'.format(key, REPORTS_KEY), path):
+                return False
+            os.makedirs(reports_dir, exist_ok=True)
+            with tarfile.open(path, 'r:gz') as tar:
+                tar.extractall(reports_dir)
+        return True
+
+
+class RuleSet:
+    # Fingerprints of the compliance repository the checks run with
+
+    def __init__(self, root='.'):
+        self.engine = engine_fingerprint(root)
+        self.scenarios = impact.directory_snapshot(os.path.join(root, FEATURES_DIR))
+        self.rules = impact.fingerprint(self.scenarios)
+
+
+def pull(workload, url, dest, paths, state, ruleset, mirror_store=None, env=None):
+    # Pulls the workload unless its last passing check still holds, returns the source written to dest
+    commit = remote_commit(url, env=env)
+    source = {
+        'workload': workload, 'url': url, 'paths': sorted(paths), 'commit': commit,
+        'engine': ruleset.engine, 'rules': ruleset.rules, 'skipped': False
+    }
+    key = state_key(workload, url, paths)
+    reason = state.skip_reason(key, commit, ruleset.engine, ruleset.rules, ruleset.scenarios) if state and commit else None
+    if reason:
+        source['skipped'] = True
+        source['reason'] = reason
+    else:
+        git_mirror.pull(url, dest, paths, commit or 'HEAD', store=mirror_store, env=env)
+    return source
+
+
+def plan_resource_types(plan_path, reports_dir=None):
+    # The inventory written with the reports saves loading the plan again
+    resource_types = inventory.resource_types(os.path.join(reports_dir, inventory.INVENTORY_JSON)) if reports_dir else None
+    if resource_types is not None:
+        return resource_types
+    return set(Plan.load(plan_path, ()).by_type) if plan_path and os.path.isfile(plan_path) else None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Skip compliance checks of unchanged workloads')
+    parser.add_argument('--store', default=os.environ.get('CHANGE_STATE_STORE'),
+                        help='Store (s3://bucket/prefix or directory) of the check states, defaults to $CHANGE_STATE_STORE')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    pull_parser = subparsers.add_parser('pull', help='Pull a workload unless it is unchanged since its last passing check')
+    pull_parser.add_argument('url')
+    pull_parser.add_argument('--workload', default=os.environ.get('TF_APP_ID'), help='Workload id (APP_ID), defaults to $TF_APP_ID')
+    pull_parser.add_argument('--dest', required=True, help='Directory the source is written to')
+    pull_parser.add_argument('--path', action='append', default=[], help='Path to export, repeatable')
+    pull_parser.add_argument('--source-path', default=None, help='Path of the source below dest the marker goes into, defaults to dest')
+    pull_parser.add_argument('--rules', default='.', help='Compliance repository the rule set is read from')
+    pull_parser.add_argument('--role-arn', default=None, help='Role the repository is accessed with')
+    pull_parser.add_argument('--git-mirror-store', default=os.environ.get('GIT_MIRROR_STORE'),
+                             help='Store keeping the git mirrors, defaults to $GIT_MIRROR_STORE')
+
+    for name, help_text in (('restore', 'Restore the reports of a skipped source'), ('record', 'Record a passing check of a source')):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('source_dir')
+        subparser.add_argument('reports_dir')
+        if name == 'record':
+            subparser.add_argument('--plan', default=None, help='Plan JSON of the check, its resource types scope later rule changes')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    state = ChangeState(open_store(args.store)) if args.store else None
+
+    if args.command == 'pull':
+        if not args.workload:
+            print('--workload or $TF_APP_ID is required')
+            return 2
+        env = role_environment(args.role_arn, 'change-state') if args.role_arn else None
+        mirror_store = open_store(args.git_mirror_store) if args.git_mirror_store else None
+        ruleset = RuleSet(args.rules)
+        if state:
+            state.save_rules(ruleset.rules, ruleset.scenarios)
+        source = pull(args.workload, args.url, args.dest, args.path, state, ruleset, mirror_store, env)
+        write_source(os.path.join(args.dest, args.source_path) if args.source_path else args.dest, source)
+        print('{} at {}: {}'.format(args.url, source['commit'], source['reason'] + ', check skipped' if source['skipped'] else 'pulled'))
+        return 0
+
+    source = read_source(args.source_dir)
+    if args.command == 'restore':
+        if not source or not source['skipped']:
+            return NOT_SKIPPED
+        if not state or not state.restore(source, args.reports_dir):
+            print('Reports of the last check of {} at {} could not be restored'.format(source['url'], source['commit']))
+            return 1
+        print('Reused the reports of the last check of {} at {}'.format(source['url'], source['commit']))
+        return 0
+
+    if state and source and not source['skipped']:
+        state.record(source, args.reports_dir, plan_resource_types(args.plan, args.reports_dir))
+        print('Recorded the check of {} at {}'.format(source['url'], source['commit']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
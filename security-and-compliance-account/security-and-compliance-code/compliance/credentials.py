@@ -0,0 +1,220 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Cross account credentials.
+#
+# Commands that must run as a workload account's cross account role get the
+# role's temporary credentials in their environment only, so the build's own
+# role stays in effect for everything else (e.g. the pipeline bucket).
+#
+# Sessions are brokered: one session per role is kept in a cache file and
+# handed out until it gets within REFRESH_SECONDS of its expiration, then
+# it is replaced by a new one. Threads of a process share the session held
+# in memory, processes share the cache file under a lock, so concurrent
+# workers assume a role once instead of each on their own.
+#
+# Credentials are also served through the credential_process interface:
+#
+#   python3 -m compliance.credentials process <role arn>
+#
+# prints them as the CLI and SDKs expect, `profile` writes an AWS config
+# profile using that, and `env` prints export lines for a shell. The cache
+# file holds the STS Credentials document as is. The workload account's
+# remote_pull_repo.sh gets its sessions from the broker as well.
+#
+# STS_ENDPOINT_URL (or --endpoint-url) points the broker at another STS
+# endpoint, e.g. a local stand-in.
+
+import argparse
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'aws-credentials')
+DURATION_SECONDS = 3600
+# SDKs refresh credential_process credentials 15 minutes ahead, so sessions
+# served are always further away from their expiration than that
+REFRESH_SECONDS = 1200
+
+
+def assume_role(role_arn, session_name='compliance', duration_seconds=DURATION_SECONDS, endpoint_url=None):
+    # Returns the STS Credentials document
+    command = [
+        'aws', 'sts', 'assume-role',
+        '--role-arn', role_arn,
+        '--role-session-name', '{}-{}'.format(session_name, int(time.time() * 1000)),
+        '--duration-seconds', str(duration_seconds),
+        '--query', 'Credentials',
+        '--output', 'json'
+    ]
+    if endpoint_url:
+        command += ['--endpoint-url', endpoint_url]
+    return json.loads(subprocess.check_output(command, universal_newlines=True))
+
+
+def expiration(credentials):
+    # Seconds since the epoch, STS answers e.g. 2020-10-01T12:00:00Z or 2020-10-01T12:00:00+00:00
+    value = credentials['Expiration']
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def environment(credentials):
+    return {
+        'AWS_ACCESS_KEY_ID': credentials['AccessKeyId'],
+        'AWS_SECRET_ACCESS_KEY': credentials['SecretAccessKey'],
+        'AWS_SESSION_TOKEN': credentials['SessionToken']
+    }
+
+
+class CredentialBroker:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, endpoint_url=None, duration_seconds=DURATION_SECONDS,
+                 refresh_seconds=REFRESH_SECONDS):
+        self.cache_dir = cache_dir
+        self.endpoint_url = endpoint_url
+        self.duration_seconds = duration_seconds
+        self.refresh_seconds = refresh_seconds
+        self._sessions = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def credentials(self, role_arn, session_name='compliance'):
+        with self._lock:
+            lock = self._locks.setdefault(role_arn, threading.Lock())
+        with lock:
+            credentials = self._sessions.get(role_arn)
+            if credentials is None or not self._fresh(credentials):
+                credentials = self._shared(role_arn, session_name)
+                self._sessions[role_arn] = credentials
+            return credentials
+
+    def _fresh(self, credentials):
+        return expiration(credentials) - time.time() > self.refresh_seconds
+
+    def _path(self, role_arn):
+        return os.path.join(self.cache_dir, hashlib.sha256(role_arn.encode()).hexdigest()[:24] + '.json')
+
+    def _shared(self, role_arn, session_name):
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        path = self._path(role_arn)
+        with open(path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    credentials = json.load(f)
+                if self._fresh(credentials):
+                    return credentials
+            except (OSError, ValueError, KeyError):
+                pass
+            credentials = assume_role(role_arn, session_name, self.duration_seconds, self.endpoint_url)
+            fd = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(credentials, f)
+            os.replace(path + '.tmp', path)
+            return credentials
+
+
+_broker = None
+
+
+def default_broker():
+    global _broker
+    if _broker is None:
+        _broker = CredentialBroker(endpoint_url=os.environ.get('STS_ENDPOINT_URL'))
+    return _broker
+
+
+def role_environment(role_arn, session_name='compliance'):
+    # Environment for a subprocess running as role_arn
+    return dict(os.environ, **environment(default_broker().credentials(role_arn, session_name)))
+
+
+def process_output(credentials):
+    # credential_process format
+    return {
+        'Version': 1,
+        'AccessKeyId': credentials['AccessKeyId'],
+        'SecretAccessKey': credentials['SecretAccessKey'],
+        'SessionToken': credentials['SessionToken'],
+        'Expiration': credentials['Expiration']
+    }
+
+
+def write_profile(name, role_arn, broker, session_name, config_file):
+    command = [sys.executable, os.path.abspath(__file__), 'process', role_arn,
+               '--session-name', session_name, '--cache-dir', broker.cache_dir]
+    if broker.endpoint_url:
+        command += ['--endpoint-url', broker.endpoint_url]
+    section = '[profile {}]\ncredential_process = {}\n'.format(name, ' '.join(command))
+    os.makedirs(os.path.dirname(config_file), exist_ok=True)
+    with open(config_file, 'a') as f:
+        f.write('\n' + section)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Cached cross account role sessions')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory the sessions are cached in')
+    parser.add_argument('--endpoint-url', default=os.environ.get('STS_ENDPOINT_URL'),
+                        help='STS endpoint, defaults to $STS_ENDPOINT_URL or the regular one')
+    parser.add_argument('--session-name', default='compliance', help='Prefix of the role session names')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    process_parser = subparsers.add_parser('process', help='Print credentials in credential_process format')
+    process_parser.add_argument('role_arn')
+
+    env_parser = subparsers.add_parser('env', help='Print shell export lines for the credentials')
+    env_parser.add_argument('role_arn')
+
+    profile_parser = subparsers.add_parser('profile', help='Add a profile getting its credentials from the broker')
+    profile_parser.add_argument('role_arn')
+    profile_parser.add_argument('--name', required=True, help='Profile name')
+    profile_parser.add_argument('--config-file',
+                                default=os.environ.get('AWS_CONFIG_FILE', os.path.join(os.path.expanduser('~'), '.aws', 'config')),
+                                help='AWS config file, defaults to $AWS_CONFIG_FILE or ~/.aws/config')
+
+    # Options are accepted after the subcommand too, as written into profiles
+    for subparser in (process_parser, env_parser, profile_parser):
+        subparser.add_argument('--cache-dir', default=argparse.SUPPRESS)
+        subparser.add_argument('--endpoint-url', default=argparse.SUPPRESS)
+        subparser.add_argument('--session-name', default=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    broker = CredentialBroker(args.cache_dir, args.endpoint_url)
+    if args.command == 'profile':
+        write_profile(args.name, args.role_arn, broker, args.session_name, args.config_file)
+        print('Added profile {} for {}'.format(args.name, args.role_arn))
+        return 0
+    credentials = broker.credentials(args.role_arn, args.session_name)
+    if args.command == 'process':
+        print(json.dumps(process_output(credentials)))
+    else:
+        for name, value in sorted(environment(credentials).items()):
+            print('export {}={}'.format(name, value))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
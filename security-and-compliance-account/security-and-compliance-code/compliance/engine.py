@@ -0,0 +1,322 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Native evaluation engine.
+#
+# The feature files are parsed once into an Engine; each plan is loaded once
+# into an indexed Plan and every selected scenario is evaluated against it.
+# Results are kept per step and per resource address and rendered in the
+# cucumber JSON shape expected by compliance.results and compliance.report.
+#
+# The rows of a Scenario Outline are evaluated together: the steps they have
+# in common run once and diverging steps with a batch implementation check
+# all rows in one pass. Every row still gets its own result.
+
+import re
+import time
+
+from compliance import gherkin
+from compliance import results
+from compliance.steps import LIBRARY, Skip
+
+FAILONSKIP = '@failonskip'
+
+
+class ScenarioContext:
+
+    def __init__(self, plan, regex_cache):
+        self.plan = plan
+        self.stash = []
+        self.failed = []
+        self._regex_cache = regex_cache
+
+    def fail(self, item, message):
+        self.failed.append((item, message))
+
+    def regex(self, pattern):
+        regex = self._regex_cache.get(pattern)
+        if regex is None:
+            regex = self._regex_cache[pattern] = re.compile(pattern)
+        return regex
+
+
+class StepResult:
+
+    __slots__ = ('step', 'status', 'duration', 'failures', 'message')
+
+    def __init__(self, step, status, duration=0, failures=(), message=''):
+        self.step = step
+        self.status = status
+        self.duration = duration
+        self.failures = list(failures)
+        self.message = message
+
+    @property
+    def error_message(self):
+        if self.failures:
+            return '\n'.join(message for _, message in self.failures)
+        return self.message
+
+
+class ScenarioResult:
+
+    def __init__(self, scenario, steps, failures, resources, reached=None, failed_at=None):
+        self.scenario = scenario
+        self.steps = steps
+        # address -> first failure message of that resource
+        self.failures = failures
+        # addresses selected by the Given steps
+        self.resources = resources
+        # address -> index of the last step the resource passed / the step it failed in
+        self.reached = reached if reached is not None else {}
+        self.failed_at = failed_at if failed_at is not None else {}
+
+    @property
+    def status(self):
+        statuses = [step.status for step in self.steps]
+        if results.FAILED in statuses:
+            return results.FAILED
+        if results.UNDEFINED in statuses:
+            return results.UNDEFINED
+        if statuses and all(status == results.PASSED for status in statuses):
+            return results.PASSED
+        return results.SKIPPED
+
+
+class FeatureResult:
+
+    def __init__(self, feature, scenarios):
+        self.feature = feature
+        self.scenarios = scenarios
+
+
+class Engine:
+
+    def __init__(self, features, tags=None, library=LIBRARY):
+        self.features = features
+        self.library = library
+        self.selected = []
+        self.regex_cache = {}
+        selector = gherkin.tag_filter(tags)
+        for feature in features:
+            scenarios = []
+            for scenario in feature.scenarios:
+                scenarios += [expanded for expanded in scenario.expand() if selector(expanded.all_tags)]
+            if scenarios:
+                self.selected.append((feature, scenarios))
+
+    @classmethod
+    def from_directory(cls, features_dir, tags=None):
+        return cls(gherkin.load_features(features_dir), tags)
+
+    def referenced_attributes(self):
+        # Resource attributes the selected scenarios read, None when that is not known for every step
+        return self.library.referenced_attributes(
+            step.text for _, scenarios in self.selected for scenario in scenarios for step in scenario.steps)
+
+    def evaluate(self, plan):
+        return [
+            FeatureResult(feature, [result for rows in outline_groups(scenarios) for result in self.evaluate_rows(plan, rows)])
+            for feature, scenarios in self.selected
+        ]
+
+    def evaluate_scenario(self, plan, scenario):
+        return self.evaluate_rows(plan, [scenario])[0]
+
+    def evaluate_rows(self, plan, scenarios):
+        # Evaluates the rows of one Scenario Outline together, returns one ScenarioResult per row.
+        # Rows whose step and input stash are the same share a single evaluation of that step, so the
+        # Given/When steps common to all rows run once. Rows that diverge are evaluated in one pass
+        # when the step has a batch implementation, otherwise one after the other.
+        branches = [_Branch(scenario) for scenario in scenarios]
+        for index in range(len(scenarios[0].steps)):
+            groups = {}
+            for branch in branches:
+                step = branch.scenario.steps[index]
+                if branch.stopped:
+                    branch.step_results.append(StepResult(step, results.SKIPPED))
+                    continue
+                match = self.library.match(step.text)
+                if match is None:
+                    branch.step_results.append(StepResult(step, results.UNDEFINED, message='Step definition not found: ' + step.text))
+                    branch.stopped = True
+                    continue
+                function, arguments = match
+                group = groups.setdefault((id(function), id(branch.stash)), (function, branch.stash, {}))
+                group[2].setdefault(arguments, []).append(branch)
+
+            for function, stash, by_arguments in groups.values():
+                for arguments, outcome, duration in self._run_step(plan, function, stash, list(by_arguments)):
+                    rows = by_arguments[arguments]
+                    share = duration // len(rows)
+                    shared = {}
+                    for branch in rows:
+                        branch.apply(index, outcome, share, shared)
+        return [branch.result() for branch in branches]
+
+    def _run_step(self, plan, function, stash, argument_lists):
+        # Yields (arguments, (stash, failed) or Skip, duration) for every distinct argument list
+        batch = self.library.batch(function)
+        if batch and len(argument_lists) > 1:
+            ctx = ScenarioContext(plan, self.regex_cache)
+            ctx.stash = stash
+            start = time.perf_counter_ns()
+            try:
+                outcomes = batch(ctx, argument_lists)
+            except Skip as skip:
+                outcomes = [skip] * len(argument_lists)
+            duration = (time.perf_counter_ns() - start) // len(argument_lists)
+            for arguments, outcome in zip(argument_lists, outcomes):
+                yield arguments, outcome, duration
+            return
+
+        for arguments in argument_lists:
+            ctx = ScenarioContext(plan, self.regex_cache)
+            ctx.stash = stash
+            start = time.perf_counter_ns()
+            try:
+                outcome = (function(ctx, *arguments), ctx.failed)
+            except Skip as skip:
+                outcome = skip
+            yield arguments, outcome, time.perf_counter_ns() - start
+
+
+class _Branch:
+    # Evaluation state of one scenario (one row of an outline)
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.failonskip = FAILONSKIP in scenario.all_tags
+        self.step_results = []
+        self.failures = {}
+        self.resources = set()
+        self.reached = {}
+        self.failed_at = {}
+        self.stash = _INITIAL_STASH
+        self.stopped = False
+        self.has_failed = False
+
+    def apply(self, index, outcome, duration, shared):
+        # shared caches the stash derived from the outcome so the rows sharing it stay grouped
+        step = self.scenario.steps[index]
+        if isinstance(outcome, Skip):
+            status = results.FAILED if self.failonskip else results.SKIPPED
+            self.step_results.append(StepResult(step, status, duration, message=str(outcome)))
+            self.stopped = True
+            return
+
+        stash, failed = outcome
+        if step.kind == 'Given':
+            self.resources.update(item.resource.address for item in stash)
+        step_failures = [(item.resource.address, message) for item, message in failed]
+        for address, message in step_failures:
+            if address not in self.failures:
+                self.failures[address] = message
+                self.failed_at[address] = index
+
+        if step_failures:
+            status = results.FAILED
+            self.has_failed = True
+            # Failed resources are not checked again by the following steps
+            if 'stash' not in shared:
+                failed_items = set(id(item) for item, _ in failed)
+                shared['stash'] = [item for item in stash if id(item) not in failed_items]
+            stash = shared['stash']
+        else:
+            status = results.SKIPPED if self.has_failed else results.PASSED
+        self.step_results.append(StepResult(step, status, duration, step_failures))
+        for item in stash:
+            self.reached[item.resource.address] = index
+
+        self.stash = stash
+        if not stash:
+            self.stopped = True
+
+    def result(self):
+        return ScenarioResult(self.scenario, self.step_results, self.failures, self.resources, self.reached, self.failed_at)
+
+
+_INITIAL_STASH = []
+
+
+def outline_groups(scenarios):
+    # Splits a list of scenarios into runs of consecutive rows of the same outline
+    groups = []
+    for scenario in scenarios:
+        if groups and scenario.outline is not None and groups[-1][-1].outline is scenario.outline:
+            groups[-1].append(scenario)
+        else:
+            groups.append([scenario])
+    return groups
+
+
+def exit_code(feature_results):
+    for feature_result in feature_results:
+        for scenario_result in feature_result.scenarios:
+            if scenario_result.status in (results.FAILED, results.UNDEFINED):
+                return 1
+    return 0
+
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+
+def _tags(tags, line):
+    return [{'name': tag, 'line': line} for tag in tags]
+
+
+def to_cucumber(feature_results):
+    features = []
+    for feature_result in feature_results:
+        feature = feature_result.feature
+        feature_id = _slug(feature.name)
+        elements = []
+        for scenario_result in feature_result.scenarios:
+            scenario = scenario_result.scenario
+            steps = []
+            for step_result in scenario_result.steps:
+                step = step_result.step
+                result = {'status': step_result.status, 'duration': step_result.duration}
+                if step_result.status in (results.FAILED, results.UNDEFINED) or step_result.error_message:
+                    result['error_message'] = step_result.error_message
+                steps.append({
+                    'keyword': step.keyword + ' ',
+                    'name': step.text,
+                    'line': step.line,
+                    'match': {'location': '{}:{}'.format(feature.uri, step.line)},
+                    'result': result
+                })
+            elements.append({
+                'keyword': 'Scenario Outline' if scenario.outline else 'Scenario',
+                'type': 'scenario',
+                'id': '{};{}'.format(feature_id, _slug(scenario.name)),
+                'name': scenario.name,
+                'line': scenario.line,
+                'description': '',
+                'tags': _tags(scenario.tags, scenario.line),
+                'steps': steps
+            })
+        features.append({
+            'keyword': 'Feature',
+            'id': feature_id,
+            'name': feature.name,
+            'uri': feature.uri,
+            'line': feature.line,
+            'description': '\n'.join(feature.description),
+            'tags': _tags(feature.tags, max(feature.line - 1, 1)),
+            'elements': elements
+        })
+    return features
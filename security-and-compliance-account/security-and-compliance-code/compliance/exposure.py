@@ -0,0 +1,275 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Ingress exposure index.
+#
+# Answers "which resources let <protocol> traffic on <ports> in from <cidr>"
+# for all ingress rules of a plan at once, instead of comparing every rule of
+# every security group with every forbidden range. The index is built once
+# per plan on first use:
+#   - one static interval tree of the rule port ranges per protocol number,
+#     rules for all protocols (-1) are kept under their own key
+#   - a binary trie of the rule CIDRs, IPv4 and IPv6 separately
+# A query collects the rules overlapping the ports from the matching
+# protocol trees (O(log n + k)) and keeps the ones listing the CIDR, then
+# reports per resource the first such rule in the order of its ingress list.
+#
+# The verdicts are those of the step it backs ("it must not have <proto>
+# protocol and port <ports> for <cidr>"): a rule matches when it lists the
+# exact CIDR, only equivalent spellings of a network (::0/0 and ::/0) are
+# treated as the same. Rules whose ports are only known after apply are
+# taken as open on all ports.
+#
+# Usage:
+#   python3 -m compliance.exposure plan.out.json --protocol tcp --ports 1024-65535 --cidr 0.0.0.0/0
+
+import argparse
+import ipaddress
+import sys
+
+from compliance.plan import Plan
+
+PROTOCOL_NUMBERS = {'tcp': '6', 'udp': '17', 'icmp': '1', 'icmpv6': '58', 'all': '-1'}
+ALL_PROTOCOLS = '-1'
+ALL_PORTS = (0, 65535)
+
+INDEX_KEY = 'exposure'
+
+
+def protocol_number(protocol):
+    return PROTOCOL_NUMBERS.get(str(protocol).lower(), str(protocol))
+
+
+def protocol_matches(rule_protocol, protocol):
+    rule_protocol = protocol_number(rule_protocol)
+    protocol = protocol_number(protocol)
+    return rule_protocol == ALL_PROTOCOLS or protocol == ALL_PROTOCOLS or rule_protocol == protocol
+
+
+def rule_ports(rule):
+    if str(rule.get('protocol')) == ALL_PROTOCOLS:
+        return ALL_PORTS
+    low, high = rule.get('from_port') or 0, rule.get('to_port') or 0
+    if not isinstance(low, int) or not isinstance(high, int):
+        return ALL_PORTS
+    return low, high
+
+
+def rule_cidrs(rule):
+    cidrs = []
+    for key in ('cidr_blocks', 'ipv6_cidr_blocks'):
+        if isinstance(rule.get(key), list):
+            cidrs += rule[key]
+    return cidrs
+
+
+def parse_ports(ports):
+    ranges = []
+    for part in ports.split(','):
+        low, _, high = part.strip().partition('-')
+        ranges.append((int(low), int(high or low)))
+    return ranges
+
+
+class IntervalTree:
+    # Static interval tree over (low, high, value): the intervals sorted by low form an implicit
+    # balanced binary tree, every node knowing the highest high of its subtree
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self.lows = [low for low, _, _ in intervals]
+        self.highs = [high for _, high, _ in intervals]
+        self.values = [value for _, _, value in intervals]
+        self.max_highs = list(self.highs)
+        self._build(0, len(intervals))
+
+    def _build(self, start, end):
+        if start >= end:
+            return -1
+        mid = (start + end) // 2
+        highest = self.highs[mid]
+        for child in (self._build(start, mid), self._build(mid + 1, end)):
+            if child >= 0 and self.max_highs[child] > highest:
+                highest = self.max_highs[child]
+        self.max_highs[mid] = highest
+        return mid
+
+    def overlapping(self, low, high):
+        # Values of the intervals sharing at least one point with [low, high]
+        found = []
+        pending = [(0, len(self.lows))]
+        while pending:
+            start, end = pending.pop()
+            if start >= end:
+                continue
+            mid = (start + end) // 2
+            if self.max_highs[mid] < low:
+                continue
+            pending.append((start, mid))
+            if self.lows[mid] <= high:
+                if self.highs[mid] >= low:
+                    found.append(self.values[mid])
+                pending.append((mid + 1, end))
+        return found
+
+    def __len__(self):
+        return len(self.lows)
+
+
+class CidrTrie:
+    # Binary trie of networks, nodes are [zero child, one child, values]
+
+    def __init__(self):
+        self.roots = {4: [None, None, None], 6: [None, None, None]}
+        # CIDR text -> values of its node, every distinct text is only parsed once.
+        # CIDRs that are not valid networks are only matched by their exact text.
+        self.by_text = {}
+
+    @staticmethod
+    def parse(cidr):
+        try:
+            return ipaddress.ip_network(cidr)
+        except (TypeError, ValueError):
+            return None
+
+    def _node(self, network, create):
+        node = self.roots[network.version]
+        address = int(network.network_address)
+        bits = network.max_prefixlen
+        for position in range(network.prefixlen):
+            bit = (address >> (bits - 1 - position)) & 1
+            if node[bit] is None:
+                if not create:
+                    return None
+                node[bit] = [None, None, None]
+            node = node[bit]
+        return node
+
+    def add(self, cidr, value):
+        values = self.by_text.get(cidr)
+        if values is None:
+            network = self.parse(cidr)
+            if network is None:
+                values = set()
+            else:
+                node = self._node(network, True)
+                if node[2] is None:
+                    node[2] = set()
+                values = node[2]
+            self.by_text[str(cidr)] = values
+        values.add(value)
+
+    def find(self, cidr):
+        # Values added with exactly this network
+        values = self.by_text.get(cidr)
+        if values is not None:
+            return values
+        network = self.parse(cidr)
+        if network is None:
+            return set()
+        node = self._node(network, False)
+        return node[2] if node is not None and node[2] is not None else set()
+
+    def covering(self, cidr):
+        # Values added with this network or one containing it
+        network = self.parse(cidr)
+        if network is None:
+            return set(self.by_text.get(cidr, ()))
+        found = set()
+        node = self.roots[network.version]
+        address = int(network.network_address)
+        bits = network.max_prefixlen
+        for position in range(network.prefixlen + 1):
+            if node[2]:
+                found.update(node[2])
+            if position == network.prefixlen:
+                break
+            node = node[(address >> (bits - 1 - position)) & 1]
+            if node is None:
+                break
+        return found
+
+
+class ExposureIndex:
+
+    def __init__(self, resources):
+        # rule id -> (address, low, high), ids follow the resources and their ingress lists
+        self.rules = []
+        self.cidrs = CidrTrie()
+        intervals = {}
+        for resource in resources:
+            ingress = resource.values.get('ingress')
+            if not isinstance(ingress, list):
+                continue
+            for rule in ingress:
+                if not isinstance(rule, dict):
+                    continue
+                rule_id = len(self.rules)
+                low, high = rule_ports(rule)
+                self.rules.append((resource.address, low, high))
+                intervals.setdefault(protocol_number(rule.get('protocol')), []).append((low, high, rule_id))
+                for cidr in rule_cidrs(rule):
+                    self.cidrs.add(cidr, rule_id)
+        self.trees = dict((protocol, IntervalTree(items)) for protocol, items in intervals.items())
+
+    def exposed(self, protocol, ranges, cidr):
+        # address -> (low, high) of the first rule of the resource matching the query
+        with_cidr = self.cidrs.find(cidr)
+        if not with_cidr:
+            return {}
+        protocol = protocol_number(protocol)
+        if protocol == ALL_PROTOCOLS:
+            trees = list(self.trees.values())
+        else:
+            trees = [self.trees[key] for key in (protocol, ALL_PROTOCOLS) if key in self.trees]
+        matched = set()
+        for tree in trees:
+            for low, high in ranges:
+                matched.update(rule_id for rule_id in tree.overlapping(low, high) if rule_id in with_cidr)
+        exposed = {}
+        for rule_id in sorted(matched):
+            address, low, high = self.rules[rule_id]
+            if address not in exposed:
+                exposed[address] = (low, high)
+        return exposed
+
+
+def index(plan):
+    # Built on first use and kept with the plan
+    found = plan.indexes.get(INDEX_KEY)
+    if found is None:
+        found = plan.indexes[INDEX_KEY] = ExposureIndex(plan.resources)
+    return found
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='List the resources whose ingress rules expose ports to a CIDR')
+    parser.add_argument('plan', help='JSON form of the terraform plan')
+    parser.add_argument('--protocol', default='tcp', help='Protocol name or number, -1 for all of them')
+    parser.add_argument('--ports', default='0-65535', help='Port ranges, e.g. 22 or 1024-65535,3389')
+    parser.add_argument('--cidr', default='0.0.0.0/0')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    exposed = index(Plan.load(args.plan)).exposed(args.protocol, parse_ports(args.ports), args.cidr)
+    for address, (low, high) in sorted(exposed.items()):
+        print('{} {}-{}'.format(address, low, high))
+    return 1 if exposed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
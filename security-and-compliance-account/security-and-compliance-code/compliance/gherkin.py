@@ -0,0 +1,263 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Minimal Gherkin parser for the compliance feature files.
+#
+# Supports what terraform-compliance features use: tags, Feature with a free
+# text description, Background, Scenario, Scenario Outline with Examples
+# tables and Given/When/Then/And/But steps. `#` comment lines are ignored.
+
+import os
+import re
+
+STEP_KEYWORDS = ('Given', 'When', 'Then', 'And', 'But', '*')
+
+_TAG = re.compile(r'@[^\s@]+')
+_PLACEHOLDER = re.compile(r'<([^<>]+)>')
+
+
+class GherkinError(ValueError):
+    pass
+
+
+class Step:
+
+    def __init__(self, keyword, text, line, kind):
+        # keyword is the word written in the file, kind the effective Given/When/Then
+        self.keyword = keyword
+        self.text = text
+        self.line = line
+        self.kind = kind
+
+    def substitute(self, values):
+        text = _PLACEHOLDER.sub(lambda m: values.get(m.group(1), m.group(0)), self.text)
+        return Step(self.keyword, text, self.line, self.kind)
+
+    def __repr__(self):
+        return 'Step({} {})'.format(self.keyword, self.text)
+
+
+class Examples:
+
+    def __init__(self, line, tags):
+        self.line = line
+        self.tags = tags
+        self.header = None
+        self.rows = []
+
+    def add_row(self, line, cells):
+        if self.header is None:
+            self.header = cells
+        elif len(cells) != len(self.header):
+            raise GherkinError('Examples row on line {} has {} cells, expected {}'.format(line, len(cells), len(self.header)))
+        else:
+            self.rows.append((line, dict(zip(self.header, cells))))
+
+
+class Scenario:
+
+    def __init__(self, keyword, name, line, tags, feature):
+        self.keyword = keyword
+        self.name = name
+        self.line = line
+        self.tags = tags
+        self.feature = feature
+        self.steps = []
+        self.examples = []
+        # Set on scenarios expanded from an outline
+        self.outline = None
+        self.example_row = None
+
+    @property
+    def is_outline(self):
+        return self.keyword == 'Scenario Outline'
+
+    @property
+    def all_tags(self):
+        return self.feature.tags + self.tags
+
+    def expand(self):
+        # An outline becomes one scenario per Examples row, a plain scenario is returned as is
+        if not self.is_outline:
+            return [self]
+        scenarios = []
+        for examples_index, examples in enumerate(self.examples, 1):
+            for row_index, (line, values) in enumerate(examples.rows, 1):
+                name = '{} -- @{}.{}'.format(self.name, examples_index, row_index)
+                scenario = Scenario('Scenario', name, line, self.tags + examples.tags, self.feature)
+                scenario.steps = [step.substitute(values) for step in self.steps]
+                scenario.outline = self
+                scenario.example_row = values
+                scenarios.append(scenario)
+        return scenarios
+
+    def __repr__(self):
+        return 'Scenario({})'.format(self.name)
+
+
+class Feature:
+
+    def __init__(self, name, line, tags, uri):
+        self.name = name
+        self.line = line
+        self.tags = tags
+        self.uri = uri
+        self.description = []
+        self.background = []
+        self.scenarios = []
+
+    def __repr__(self):
+        return 'Feature({})'.format(self.name)
+
+
+def _split_row(text):
+    cells = text.strip()[1:]
+    if cells.endswith('|'):
+        cells = cells[:-1]
+    return [cell.strip() for cell in cells.split('|')]
+
+
+def parse(text, uri='<string>'):
+    feature = None
+    scenario = None
+    examples = None
+    in_background = False
+    pending_tags = []
+    previous_kind = None
+
+    for line_number, raw_line in enumerate(text.splitlines(), 1):
+        line = raw_line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        if line.startswith('@'):
+            pending_tags += _TAG.findall(line.split('#', 1)[0])
+            continue
+
+        keyword, _, rest = line.partition(':')
+        keyword = keyword.strip()
+        rest = rest.strip()
+
+        if keyword == 'Feature':
+            if feature is not None:
+                raise GherkinError('{}:{}: only one Feature per file is supported'.format(uri, line_number))
+            feature = Feature(rest, line_number, pending_tags, uri)
+            pending_tags = []
+            continue
+
+        if feature is None:
+            raise GherkinError('{}:{}: expected Feature but found {!r}'.format(uri, line_number, line))
+
+        if keyword == 'Background':
+            in_background = True
+            scenario = None
+            examples = None
+            previous_kind = None
+            continue
+
+        if keyword in ('Scenario', 'Scenario Outline', 'Scenario Template'):
+            keyword = 'Scenario' if keyword == 'Scenario' else 'Scenario Outline'
+            scenario = Scenario(keyword, rest, line_number, pending_tags, feature)
+            feature.scenarios.append(scenario)
+            in_background = False
+            examples = None
+            pending_tags = []
+            previous_kind = None
+            continue
+
+        if keyword in ('Examples', 'Scenarios'):
+            if scenario is None or not scenario.is_outline:
+                raise GherkinError('{}:{}: Examples outside of a Scenario Outline'.format(uri, line_number))
+            examples = Examples(line_number, pending_tags)
+            scenario.examples.append(examples)
+            pending_tags = []
+            continue
+
+        if line.startswith('|'):
+            if examples is None:
+                raise GherkinError('{}:{}: table rows are only supported in Examples'.format(uri, line_number))
+            examples.add_row(line_number, _split_row(line))
+            continue
+
+        word = line.split(None, 1)[0]
+        if word in STEP_KEYWORDS:
+            text_part = line[len(word):].strip()
+            if word in ('And', 'But', '*'):
+                if previous_kind is None:
+                    raise GherkinError('{}:{}: {} step without a preceding step'.format(uri, line_number, word))
+                kind = previous_kind
+            else:
+                kind = word
+            previous_kind = kind
+            step = Step(word, text_part, line_number, kind)
+            if in_background:
+                feature.background.append(step)
+            elif scenario is not None:
+                scenario.steps.append(step)
+            else:
+                raise GherkinError('{}:{}: step outside of a scenario'.format(uri, line_number))
+            continue
+
+        # Free text below the Feature line is its description
+        if scenario is None and not in_background:
+            feature.description.append(line)
+            continue
+
+        raise GherkinError('{}:{}: unexpected line {!r}'.format(uri, line_number, line))
+
+    if feature is None:
+        raise GherkinError('{}: no Feature found'.format(uri))
+    for scenario in feature.scenarios:
+        scenario.steps = feature.background + scenario.steps
+    return feature
+
+
+def parse_file(path, uri=None):
+    with open(path, 'r') as f:
+        return parse(f.read(), uri or path)
+
+
+def load_features(features_dir):
+    features = []
+    for name in sorted(os.listdir(features_dir)):
+        if name.endswith('.feature'):
+            features.append(parse_file(os.path.join(features_dir, name)))
+    return features
+
+
+def tag_filter(expression):
+    # Builds a predicate from a tag expression such as "@security", "security,log" or "@log and not @slow"
+    if not expression:
+        return lambda tags: True
+    tokens = re.findall(r'\(|\)|[^\s(),]+|,', expression)
+    python = []
+    for token in tokens:
+        lowered = token.lower()
+        if token in ('(', ')') or lowered in ('and', 'or', 'not'):
+            python.append(lowered)
+        elif token == ',':
+            python.append('or')
+        elif token.startswith('~'):
+            python.append('not ({!r} in tags)'.format('@' + token.lstrip('~@')))
+        else:
+            python.append('({!r} in tags)'.format('@' + token.lstrip('@')))
+    # Adjacent tags without an operator mean "or", as in a space separated list
+    joined = []
+    for token in python:
+        if joined and joined[-1] not in ('and', 'or', 'not', '(') and token not in ('and', 'or', ')'):
+            joined.append('or')
+        joined.append(token)
+    code = compile(' '.join(joined), '<tags>', 'eval')
+    return lambda tags: bool(eval(code, {'__builtins__': {}}, {'tags': set(tags)}))
@@ -0,0 +1,197 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Incremental git mirror for repository pulls.
+#
+# Every repository gets a bare mirror under <root>/<key>.git, where key is a
+# hash of the repository url. On a fresh build host the mirror is restored
+# from the store and then brought up to date with `git fetch`. The fetch
+# transfers only the objects the store does not have yet, so a pull no
+# longer grows with the repository history. The requested paths are then
+# exported from the mirror with `git archive`: a sparse checkout without a
+# working tree.
+#
+# Store layout (workload-code/remote_pull_repo.sh pulls the compliance repo through this module):
+#   <key>/HEAD                          id of the current base bundle
+#   <key>/<id>.bundle                   full bundle of the mirror
+#   <key>/<id>.incremental.bundle       objects added since that base
+# Only the incremental bundle is rewritten after a fetch. A new base is
+# written once the incremental bundle grows past a quarter of the base.
+#
+# Usage:
+#   python3 -m compliance.git_mirror pull $REPO_URL --dest ./workload --path src --store s3://bucket/git-mirror
+
+import argparse
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+from compliance.credentials import role_environment
+from compliance.store import open_store
+
+DEFAULT_ROOT = os.path.join(os.path.expanduser('~'), '.cache', 'git-mirror')
+HEAD_KEY = 'HEAD'
+# Rebase once the incremental bundle exceeds this fraction of the base bundle
+REBASE_RATIO = 0.25
+
+
+def mirror_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:24]
+
+
+def git(arguments, env=None, **kwargs):
+    return subprocess.check_output(['git'] + arguments, env=env, universal_newlines=True, **kwargs)
+
+
+class GitMirror:
+
+    def __init__(self, url, root=DEFAULT_ROOT, store=None, env=None):
+        self.url = url
+        self.key = mirror_key(url)
+        self.path = os.path.join(root, self.key + '.git')
+        # Local copy of the base bundle the store's incremental bundle is relative to
+        self.base_bundle = self.path + '.base.bundle'
+        self.store = store
+        # Environment of the commands talking to the remote (e.g. cross account credentials)
+        self.env = env
+
+    def git(self, arguments, env=None, **kwargs):
+        return git(['--git-dir', self.path] + arguments, env=env, **kwargs)
+
+    def refs(self):
+        return self.git(['for-each-ref', '--format=%(objectname) %(refname)'])
+
+    def _store_key(self, name):
+        return '{}/{}'.format(self.key, name)
+
+    def restore(self):
+        if not self.store:
+            return False
+        base_id = self.store.get_text(self._store_key(HEAD_KEY))
+        if not base_id:
+            return False
+        base_id = base_id.strip()
+        with tempfile.TemporaryDirectory() as tmp:
+            base = os.path.join(tmp, 'base.bundle')
+            if not self.store.get(self._store_key(base_id + '.bundle'), base):
+                return False
+            git(['clone', '--quiet', '--mirror', base, self.path])
+            incremental = os.path.join(tmp, 'incremental.bundle')
+            if self.store.get(self._store_key(base_id + '.incremental.bundle'), incremental):
+                self.git(['fetch', '--quiet', incremental, '+refs/*:refs/*'])
+            shutil.copyfile(base, self.base_bundle)
+        self.git(['remote', 'set-url', 'origin', self.url])
+        return True
+
+    def update(self):
+        # Brings the mirror up to date, returns True when its refs changed
+        if not os.path.isdir(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if not self.restore():
+                git(['clone', '--quiet', '--mirror', self.url, self.path], env=self.env)
+                return True
+        before = self.refs()
+        self.git(['fetch', '--quiet', '--prune', 'origin'], env=self.env)
+        return self.refs() != before
+
+    def save(self):
+        if not self.store:
+            return
+        with tempfile.TemporaryDirectory() as tmp:
+            if os.path.isfile(self.base_bundle):
+                base_id = self._bundle_id(self.base_bundle)
+                incremental = os.path.join(tmp, 'incremental.bundle')
+                base_heads = [line.split()[0] for line in self.git(['bundle', 'list-heads', self.base_bundle]).splitlines()]
+                created = subprocess.call(
+                    ['git', '--git-dir', self.path, 'bundle', 'create', '--quiet', incremental, '--all', '--not'] + base_heads,
+                    stderr=subprocess.DEVNULL
+                ) == 0
+                # No new objects since the base: the base still holds everything
+                if not created:
+                    return
+                if os.path.getsize(incremental) <= REBASE_RATIO * os.path.getsize(self.base_bundle):
+                    self.store.put(self._store_key(base_id + '.incremental.bundle'), incremental)
+                    return
+
+            base = os.path.join(tmp, 'base.bundle')
+            self.git(['bundle', 'create', '--quiet', base, '--all'])
+            base_id = self._bundle_id(base)
+            # The bundle goes first so HEAD never names a missing base
+            self.store.put(self._store_key(base_id + '.bundle'), base)
+            self.store.put_text(self._store_key(HEAD_KEY), base_id + '\n')
+            shutil.copyfile(base, self.base_bundle)
+
+    def _bundle_id(self, bundle):
+        heads = self.git(['bundle', 'list-heads', bundle])
+        return hashlib.sha256(heads.encode('utf-8')).hexdigest()[:16]
+
+    def export(self, dest, paths=(), ref='HEAD'):
+        # Writes the given paths of ref into dest, like a sparse checkout
+        os.makedirs(dest, exist_ok=True)
+        process = subprocess.Popen(
+            ['git', '--git-dir', self.path, 'archive', '--format=tar', ref, '--'] + list(paths),
+            stdout=subprocess.PIPE
+        )
+        with tarfile.open(fileobj=process.stdout, mode='r|') as tar:
+            tar.extractall(dest)
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, 'git archive')
+
+
+def pull(url, dest, paths=(), ref='HEAD', root=DEFAULT_ROOT, store=None, env=None):
+    mirror = GitMirror(url, root, store, env)
+    os.makedirs(root, exist_ok=True)
+    # Pulls of the same repository on one host (e.g. in a batch) take turns on its mirror
+    with open(mirror.path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if mirror.update():
+            mirror.save()
+        mirror.export(dest, paths, ref)
+    return mirror
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Incremental git mirror for repository pulls')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    pull_parser = subparsers.add_parser('pull', help='Update the mirror of a repository and export paths of it')
+    pull_parser.add_argument('url')
+    pull_parser.add_argument('--dest', required=True, help='Directory the paths are exported to')
+    pull_parser.add_argument('--path', action='append', default=[], help='Path to export, repeatable, defaults to the whole tree')
+    pull_parser.add_argument('--ref', default='HEAD', help='Ref to export, defaults to the default branch')
+    pull_parser.add_argument('--store', default=os.environ.get('GIT_MIRROR_STORE'),
+                             help='Store (s3://bucket/prefix or directory) keeping the mirror, defaults to $GIT_MIRROR_STORE')
+    pull_parser.add_argument('--root', default=DEFAULT_ROOT, help='Local directory holding the mirrors')
+    pull_parser.add_argument('--role-arn', default=None, help='Role the remote is accessed with, the store keeps the build credentials')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    store = open_store(args.store) if args.store else None
+    env = role_environment(args.role_arn, 'git-mirror') if args.role_arn else None
+    pull(args.url, args.dest, args.path, args.ref, args.root, store, env)
+    print('Pulled {} into {}'.format(args.url, args.dest))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
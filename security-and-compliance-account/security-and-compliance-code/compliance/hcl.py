@@ -0,0 +1,1121 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Minimal HCL2 reader for the static evaluation (compliance/static.py).
+#
+# Parses the terraform configuration language: blocks, attributes, comments,
+# quoted templates with ${} interpolation, heredocs, tuples, objects,
+# function calls, operators, conditionals, for expressions and splats.
+# Template directives (%{if}/%{for}) are parsed as text and left unresolved.
+#
+# Expressions are evaluated in a Scope holding the values terraform would
+# know before a plan: variables, locals, count.index, each.key/each.value,
+# path.* and terraform.workspace, plus a set of pure functions. Everything
+# else (attributes of other resources, data sources, module outputs,
+# functions reading the environment) evaluates to Unresolved. Collections
+# keep their resolved elements next to the unresolved ones.
+#
+# Usage:
+#   body = hcl.parse(text, 'main.tf')
+#   value = hcl.evaluate(body.attributes['bucket'].expression, scope)
+
+import base64
+import hashlib
+import json
+import os
+import re
+
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_-]*')
+_NUMBER = re.compile(r'[0-9]+(\.[0-9]+)?([eE][+-]?[0-9]+)?')
+_HEREDOC = re.compile(r'<<(-?)([A-Za-z_][A-Za-z0-9_-]*)[ \t]*\r?\n')
+_OPERATORS = ('==', '!=', '<=', '>=', '&&', '||', '=>', '...')
+_PUNCTUATION = '{}[]()=,.:?!+-*/%<>~'
+_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', '"': '"', '\\': '\\'}
+
+# Roots of references that are not resources
+_NON_RESOURCE_ROOTS = ('var', 'local', 'module', 'data', 'each', 'count', 'path', 'self', 'terraform')
+# Attributes of other resources assumed to hold a collection, the others are taken as scalars
+_COLLECTION_ATTRIBUTES = ('tags', 'tags_all')
+
+
+class HclError(ValueError):
+    pass
+
+
+class Unresolved:
+    # Value only known from a plan. scalar is set when it can not be a map or list holding attributes
+
+    __slots__ = ('reason', 'scalar')
+
+    def __init__(self, reason, scalar=False):
+        self.reason = reason
+        self.scalar = scalar
+
+    def __repr__(self):
+        return '(needs a plan: {})'.format(self.reason)
+
+    def __bool__(self):
+        return True
+
+
+def unresolved_reason(value):
+    # Reason of the first unresolved value in the value, None when it is fully known
+    if isinstance(value, Unresolved):
+        return value.reason
+    if isinstance(value, dict):
+        children = value.values()
+    elif isinstance(value, list):
+        children = value
+    else:
+        return None
+    for child in children:
+        reason = unresolved_reason(child)
+        if reason:
+            return reason
+    return None
+
+
+###########################################################################
+# Lexer
+###########################################################################
+class Token:
+
+    __slots__ = ('kind', 'value', 'line')
+
+    def __init__(self, kind, value, line):
+        # kind: ident, number, template, newline, punct or eof
+        self.kind = kind
+        self.value = value
+        self.line = line
+
+    def __repr__(self):
+        return 'Token({} {!r})'.format(self.kind, self.value)
+
+
+class _Lexer:
+
+    def __init__(self, text, filename, line=1):
+        self.text = text
+        self.filename = filename
+        self.pos = 0
+        self.line = line
+
+    def error(self, message):
+        return HclError('{}:{}: {}'.format(self.filename, self.line, message))
+
+    def tokens(self):
+        tokens = []
+        while True:
+            token = self.next()
+            tokens.append(token)
+            if token.kind == 'eof':
+                return tokens
+
+    def _skip_space(self):
+        text = self.text
+        while self.pos < len(text):
+            char = text[self.pos]
+            if char in ' \t\r':
+                self.pos += 1
+            elif char == '#' or text.startswith('//', self.pos):
+                end = text.find('\n', self.pos)
+                self.pos = len(text) if end == -1 else end
+            elif text.startswith('/*', self.pos):
+                end = text.find('*/', self.pos + 2)
+                if end == -1:
+                    raise self.error('unterminated comment')
+                self.line += text.count('\n', self.pos, end)
+                self.pos = end + 2
+            else:
+                return
+
+    def next(self):
+        self._skip_space()
+        text = self.text
+        if self.pos >= len(text):
+            return Token('eof', None, self.line)
+        char = text[self.pos]
+        line = self.line
+        if char == '\n':
+            while self.pos < len(text) and text[self.pos] == '\n':
+                self.pos += 1
+                self.line += 1
+                self._skip_space()
+            return Token('newline', None, line)
+        if char == '"':
+            self.pos += 1
+            return Token('template', self._template(quoted=True), line)
+        heredoc = _HEREDOC.match(text, self.pos)
+        if heredoc:
+            return Token('template', self._heredoc(heredoc), line)
+        match = _IDENTIFIER.match(text, self.pos)
+        if match:
+            self.pos = match.end()
+            return Token('ident', match.group(0), line)
+        match = _NUMBER.match(text, self.pos)
+        if match:
+            self.pos = match.end()
+            number = match.group(0)
+            return Token('number', int(number) if not match.group(1) and not match.group(2) else float(number), line)
+        for operator in _OPERATORS:
+            if text.startswith(operator, self.pos):
+                self.pos += len(operator)
+                return Token('punct', operator, line)
+        if char in _PUNCTUATION:
+            self.pos += 1
+            return Token('punct', char, line)
+        raise self.error('unexpected character {!r}'.format(char))
+
+    def _interpolation(self):
+        # Tokens of a ${ } sequence, up to its closing brace
+        tokens = []
+        depth = 0
+        while True:
+            token = self.next()
+            if token.kind == 'eof':
+                raise self.error('unterminated interpolation')
+            if token.kind == 'punct' and token.value == '{':
+                depth += 1
+            elif token.kind == 'punct' and token.value == '}':
+                if depth == 0:
+                    break
+                depth -= 1
+            if token.kind != 'newline':
+                tokens.append(token)
+        # Strip markers ${~ and ~} only change whitespace
+        tokens = [token for token in tokens if not (token.kind == 'punct' and token.value == '~')]
+        tokens.append(Token('eof', None, self.line))
+        return tokens
+
+    def _template(self, quoted):
+        # Parts of a template: literal strings, interpolation token lists and directives
+        parts = []
+        literal = []
+        text = self.text
+        while True:
+            if self.pos >= len(text):
+                if quoted:
+                    raise self.error('unterminated string')
+                break
+            char = text[self.pos]
+            if quoted and char == '"':
+                self.pos += 1
+                break
+            if quoted and char == '\n':
+                raise self.error('newline in string')
+            if quoted and char == '\\':
+                escape = text[self.pos + 1:self.pos + 2]
+                if escape in _ESCAPES:
+                    literal.append(_ESCAPES[escape])
+                    self.pos += 2
+                elif escape == 'u' or escape == 'U':
+                    size = 4 if escape == 'u' else 8
+                    literal.append(chr(int(text[self.pos + 2:self.pos + 2 + size], 16)))
+                    self.pos += 2 + size
+                else:
+                    raise self.error('invalid escape \\' + escape)
+                continue
+            if text.startswith('$${', self.pos) or text.startswith('%%{', self.pos):
+                literal.append(char + '{')
+                self.pos += 3
+                continue
+            if text.startswith('${', self.pos):
+                self.pos += 2
+                if literal:
+                    parts.append(''.join(literal))
+                    literal = []
+                parts.append(self._interpolation())
+                continue
+            if text.startswith('%{', self.pos):
+                end = text.find('}', self.pos)
+                if end == -1:
+                    raise self.error('unterminated template directive')
+                if literal:
+                    parts.append(''.join(literal))
+                    literal = []
+                parts.append(('directive', text[self.pos:end + 1]))
+                self.pos = end + 1
+                continue
+            if char == '\n':
+                self.line += 1
+            literal.append(char)
+            self.pos += 1
+        if literal or not parts:
+            parts.append(''.join(literal))
+        return parts
+
+    def _heredoc(self, match):
+        indented, marker = match.group(1), match.group(2)
+        start = match.end()
+        lines = []
+        position = start
+        while True:
+            end = self.text.find('\n', position)
+            line = self.text[position:] if end == -1 else self.text[position:end]
+            if line.strip() == marker:
+                break
+            if end == -1:
+                raise self.error('unterminated heredoc ' + marker)
+            lines.append(line + '\n')
+            position = end + 1
+        self.pos = len(self.text) if end == -1 else end
+        if indented:
+            widths = [len(line) - len(line.lstrip(' \t')) for line in lines if line.strip()]
+            width = min(widths) if widths else 0
+            lines = [line[width:] for line in lines]
+        body = _Lexer(''.join(lines), self.filename, self.line + 1)
+        self.line += len(lines) + 1
+        return body._template(quoted=False)
+
+
+###########################################################################
+# Parser
+###########################################################################
+class Attribute:
+
+    __slots__ = ('name', 'expression', 'line')
+
+    def __init__(self, name, expression, line):
+        self.name = name
+        self.expression = expression
+        self.line = line
+
+
+class Block:
+
+    __slots__ = ('type', 'labels', 'body', 'line')
+
+    def __init__(self, type, labels, body, line):
+        self.type = type
+        self.labels = labels
+        self.body = body
+        self.line = line
+
+
+class Body:
+
+    def __init__(self, filename):
+        self.filename = filename
+        # name -> Attribute, in the order written
+        self.attributes = {}
+        self.blocks = []
+
+    def blocks_of(self, block_type):
+        return [block for block in self.blocks if block.type == block_type]
+
+
+class _Parser:
+
+    def __init__(self, tokens, filename):
+        self.tokens = tokens
+        self.filename = filename
+        self.pos = 0
+        # Newlines are insignificant inside parentheses and brackets
+        self.skip_newlines = 0
+
+    def error(self, message, token=None):
+        token = token or self.peek()
+        return HclError('{}:{}: {}'.format(self.filename, token.line, message))
+
+    def peek(self):
+        if self.skip_newlines:
+            while self.tokens[self.pos].kind == 'newline':
+                self.pos += 1
+        return self.tokens[self.pos]
+
+    def take(self):
+        token = self.peek()
+        if token.kind != 'eof':
+            self.pos += 1
+        return token
+
+    def accept(self, value):
+        token = self.peek()
+        if token.kind == 'punct' and token.value == value:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, value):
+        if not self.accept(value):
+            raise self.error('expected {!r}, found {!r}'.format(value, self.peek().value))
+
+    def newlines(self):
+        while self.tokens[self.pos].kind == 'newline':
+            self.pos += 1
+
+    def body(self, closing):
+        body = Body(self.filename)
+        while True:
+            self.newlines()
+            token = self.tokens[self.pos]
+            if closing and token.kind == 'punct' and token.value == '}':
+                self.pos += 1
+                return body
+            if token.kind == 'eof':
+                if closing:
+                    raise self.error('unclosed block', token)
+                return body
+            if token.kind != 'ident':
+                raise self.error('expected an attribute or a block, found {!r}'.format(token.value), token)
+            self.pos += 1
+            if self.accept('='):
+                body.attributes[token.value] = Attribute(token.value, self.expression(), token.line)
+            else:
+                labels = []
+                while not self.accept('{'):
+                    label = self.take()
+                    if label.kind == 'ident':
+                        labels.append(label.value)
+                    elif label.kind == 'template' and all(isinstance(part, str) for part in label.value):
+                        labels.append(''.join(label.value))
+                    else:
+                        raise self.error('invalid block label', label)
+                body.blocks.append(Block(token.value, labels, self.body(True), token.line))
+            token = self.tokens[self.pos]
+            if token.kind not in ('newline', 'eof') and not (closing and token.kind == 'punct' and token.value == '}'):
+                raise self.error('expected a newline, found {!r}'.format(token.value), token)
+
+    def expression(self):
+        condition = self.binary(0)
+        if self.accept('?'):
+            self.skip_newlines += 1
+            true = self.expression()
+            self.expect(':')
+            self.skip_newlines -= 1
+            return ('cond', condition, true, self.expression())
+        return condition
+
+    _PRECEDENCE = (('||',), ('&&',), ('==', '!='), ('<', '>', '<=', '>='), ('+', '-'), ('*', '/', '%'))
+
+    def binary(self, level):
+        if level == len(self._PRECEDENCE):
+            return self.unary()
+        left = self.binary(level + 1)
+        while True:
+            token = self.peek()
+            if token.kind == 'punct' and token.value in self._PRECEDENCE[level]:
+                self.pos += 1
+                left = ('binop', token.value, left, self.binary(level + 1))
+            else:
+                return left
+
+    def unary(self):
+        if self.accept('!'):
+            return ('unop', '!', self.unary())
+        if self.accept('-'):
+            return ('unop', '-', self.unary())
+        return self.postfix(self.primary())
+
+    def postfix(self, node):
+        while True:
+            if self.accept('.'):
+                token = self.take()
+                if token.kind == 'ident':
+                    node = ('attr', node, token.value)
+                elif token.kind == 'number' and isinstance(token.value, int):
+                    node = ('index', node, ('lit', token.value))
+                elif token.kind == 'punct' and token.value == '*':
+                    node = ('splat', node, self.splat_traversal(attributes_only=True))
+                else:
+                    raise self.error('invalid attribute access', token)
+            elif self.accept('['):
+                self.skip_newlines += 1
+                if self.accept('*'):
+                    self.expect(']')
+                    self.skip_newlines -= 1
+                    node = ('splat', node, self.splat_traversal(attributes_only=False))
+                else:
+                    key = self.expression()
+                    self.expect(']')
+                    self.skip_newlines -= 1
+                    node = ('index', node, key)
+            else:
+                return node
+
+    def splat_traversal(self, attributes_only):
+        # Traversal applied to every element of a splat
+        operations = []
+        while True:
+            token = self.tokens[self.pos]
+            if token.kind == 'punct' and token.value == '.' and self.tokens[self.pos + 1].kind == 'ident':
+                operations.append(('attr', self.tokens[self.pos + 1].value))
+                self.pos += 2
+            elif not attributes_only and token.kind == 'punct' and token.value == '[':
+                self.pos += 1
+                self.skip_newlines += 1
+                operations.append(('index', self.expression()))
+                self.expect(']')
+                self.skip_newlines -= 1
+            else:
+                return operations
+
+    def primary(self):
+        token = self.take()
+        if token.kind == 'number':
+            return ('lit', token.value)
+        if token.kind == 'template':
+            return ('template', [part if isinstance(part, (str, tuple)) else _Parser(part, self.filename).interpolation()
+                                 for part in token.value])
+        if token.kind == 'ident':
+            if token.value in ('true', 'false'):
+                return ('lit', token.value == 'true')
+            if token.value == 'null':
+                return ('lit', None)
+            if self.peek().kind == 'punct' and self.peek().value == '(':
+                self.pos += 1
+                return self.call(token.value)
+            return ('var', token.value)
+        if token.kind == 'punct' and token.value == '(':
+            self.skip_newlines += 1
+            node = self.expression()
+            self.expect(')')
+            self.skip_newlines -= 1
+            return ('paren', node)
+        if token.kind == 'punct' and token.value == '[':
+            return self.tuple()
+        if token.kind == 'punct' and token.value == '{':
+            return self.object()
+        raise self.error('unexpected {!r} in expression'.format(token.value), token)
+
+    def interpolation(self):
+        self.skip_newlines += 1
+        node = self.expression()
+        if self.peek().kind != 'eof':
+            raise self.error('unexpected {!r} in interpolation'.format(self.peek().value))
+        return node
+
+    def call(self, name):
+        self.skip_newlines += 1
+        arguments = []
+        expand = False
+        while not self.accept(')'):
+            arguments.append(self.expression())
+            if self.accept('...'):
+                expand = True
+            if not self.accept(','):
+                self.expect(')')
+                break
+        self.skip_newlines -= 1
+        return ('call', name, arguments, expand)
+
+    def tuple(self):
+        self.skip_newlines += 1
+        if self.peek().kind == 'ident' and self.peek().value == 'for':
+            node = self.for_expression(']', False)
+        else:
+            items = []
+            while not self.accept(']'):
+                items.append(self.expression())
+                if not self.accept(','):
+                    self.expect(']')
+                    break
+            node = ('tuple', items)
+        self.skip_newlines -= 1
+        return node
+
+    def object(self):
+        saved = self.skip_newlines
+        self.skip_newlines = 0
+        self.newlines()
+        if self.peek().kind == 'ident' and self.peek().value == 'for':
+            self.skip_newlines = 1
+            node = self.for_expression('}', True)
+            self.skip_newlines = saved
+            return node
+        items = []
+        while True:
+            self.newlines()
+            if self.accept('}'):
+                break
+            token = self.peek()
+            if token.kind == 'ident' and self.tokens[self.pos + 1].kind == 'punct' and self.tokens[self.pos + 1].value in ('=', ':'):
+                self.pos += 1
+                key = ('lit', token.value)
+            else:
+                key = self.expression()
+            if not self.accept('='):
+                self.expect(':')
+            items.append((key, self.expression()))
+            if self.accept(','):
+                continue
+            token = self.tokens[self.pos]
+            if token.kind != 'newline' and not (token.kind == 'punct' and token.value == '}'):
+                raise self.error('expected a newline or a comma between object items', token)
+        self.skip_newlines = saved
+        return ('object', items)
+
+    def for_expression(self, closing, is_object):
+        self.take()
+        names = [self.take().value]
+        if self.accept(','):
+            names.append(self.take().value)
+        token = self.take()
+        if token.value != 'in':
+            raise self.error('expected "in" in for expression', token)
+        collection = self.expression()
+        self.expect(':')
+        key = None
+        if is_object:
+            key = self.expression()
+            self.expect('=>')
+        value = self.expression()
+        grouping = self.accept('...')
+        condition = None
+        if self.peek().kind == 'ident' and self.peek().value == 'if':
+            self.take()
+            condition = self.expression()
+        self.expect(closing)
+        key_name, value_name = (names[0], names[1]) if len(names) == 2 else (None, names[0])
+        return ('for', key_name, value_name, collection, key, value, condition, is_object, grouping)
+
+
+def parse(text, filename='<string>'):
+    # Parses a configuration file into its top level Body
+    tokens = _Lexer(text, filename).tokens()
+    return _Parser(tokens, filename).body(False)
+
+
+def parse_expression(text, filename='<string>'):
+    parser = _Parser(_Lexer(text, filename).tokens(), filename)
+    return parser.interpolation()
+
+
+def parse_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse(f.read(), path)
+
+
+###########################################################################
+# References
+###########################################################################
+def references(node):
+    # Yields the traversals (root, leading attribute names) an expression refers to
+    kind = node[0]
+    if kind in ('var', 'attr', 'index'):
+        root = node
+        while root[0] in ('attr', 'index'):
+            if root[0] == 'index':
+                yield from references(root[2])
+            root = root[1]
+        if root[0] == 'var':
+            yield _leading_traversal(node)
+        else:
+            yield from references(root)
+    elif kind == 'template':
+        for part in node[1]:
+            if not isinstance(part, str) and part[0] != 'directive':
+                yield from references(part)
+    elif kind == 'object':
+        for key, value in node[1]:
+            yield from references(key)
+            yield from references(value)
+    elif kind in ('tuple', 'call'):
+        for item in node[1] if kind == 'tuple' else node[2]:
+            yield from references(item)
+    elif kind == 'splat':
+        yield from references(node[1])
+        for operation, argument in node[2]:
+            if operation == 'index':
+                yield from references(argument)
+    elif kind == 'for':
+        for child in node[3:7]:
+            if child is not None:
+                yield from references(child)
+    elif kind in ('binop', 'unop'):
+        for child in node[2:]:
+            yield from references(child)
+    elif kind in ('paren', 'cond'):
+        for child in node[1:]:
+            yield from references(child)
+
+
+def _leading_traversal(node):
+    chain = []
+    while node[0] in ('attr', 'index'):
+        chain.append(node)
+        node = node[1]
+    names = []
+    for step in reversed(chain):
+        if step[0] != 'attr':
+            break
+        names.append(step[2])
+    return node[1], names
+
+
+def resource_reference(root, names):
+    # "type.name" of a reference to a managed resource, None for variables, locals, data sources...
+    if root in _NON_RESOURCE_ROOTS or not names:
+        return None
+    return root + '.' + names[0]
+
+
+###########################################################################
+# Evaluation
+###########################################################################
+class Scope:
+
+    def __init__(self, variables=None, locals=None, path_module='.', workspace='default', cwd='.'):
+        self.variables = variables if variables is not None else {}
+        # name -> expression, evaluated on first use
+        self.locals = locals if locals is not None else {}
+        # path.module relative to the root module, cwd the directory terraform runs in
+        self.path_module = path_module
+        self.workspace = workspace
+        self.cwd = cwd
+        self.names = {}
+        self._local_values = {}
+        self._evaluating = set()
+
+    def child(self, **names):
+        # Scope with extra names (count, each, iterators) sharing the module level values
+        scope = Scope.__new__(Scope)
+        scope.__dict__.update(self.__dict__)
+        scope.names = dict(self.names, **names)
+        return scope
+
+    def local(self, name):
+        if name in self._local_values:
+            return self._local_values[name]
+        if name not in self.locals:
+            return Unresolved('local.{} is not defined'.format(name))
+        if name in self._evaluating:
+            return Unresolved('local.{} refers to itself'.format(name))
+        self._evaluating.add(name)
+        try:
+            value = evaluate(self.locals[name], self)
+        finally:
+            self._evaluating.discard(name)
+        self._local_values[name] = value
+        return value
+
+
+def evaluate(node, scope):
+    kind = node[0]
+    if kind == 'lit':
+        return node[1]
+    if kind == 'paren':
+        return evaluate(node[1], scope)
+    if kind == 'template':
+        return _template(node[1], scope)
+    if kind in ('var', 'attr', 'index'):
+        return _traverse(node, scope)
+    if kind == 'tuple':
+        return [evaluate(item, scope) for item in node[1]]
+    if kind == 'object':
+        result = {}
+        for key_node, value_node in node[1]:
+            key = evaluate(key_node, scope)
+            if isinstance(key, Unresolved):
+                return Unresolved(key.reason)
+            if isinstance(key, bool) or key is None or isinstance(key, (list, dict)):
+                return Unresolved('object key is not a string')
+            result[_string(key)] = evaluate(value_node, scope)
+        return result
+    if kind == 'call':
+        return _call(node[1], node[2], node[3], scope)
+    if kind == 'binop':
+        return _binary(node[1], evaluate(node[2], scope), evaluate(node[3], scope))
+    if kind == 'unop':
+        value = evaluate(node[2], scope)
+        if isinstance(value, Unresolved):
+            return Unresolved(value.reason, True)
+        if node[1] == '!':
+            return not value if isinstance(value, bool) else Unresolved('! of a non boolean', True)
+        number = _number(value)
+        return -number if number is not None else Unresolved('- of a non number', True)
+    if kind == 'cond':
+        condition = evaluate(node[1], scope)
+        if isinstance(condition, bool):
+            return evaluate(node[2] if condition else node[3], scope)
+        true, false = evaluate(node[2], scope), evaluate(node[3], scope)
+        if unresolved_reason(true) is None and true == false:
+            return true
+        reason = condition.reason if isinstance(condition, Unresolved) else 'condition is not a boolean'
+        return Unresolved(reason, _scalar(true) and _scalar(false))
+    if kind == 'for':
+        return _for(node, scope)
+    if kind == 'splat':
+        return _splat(evaluate(node[1], scope), node[2], scope)
+    raise HclError('unknown expression ' + kind)
+
+
+def _scalar(value):
+    if isinstance(value, Unresolved):
+        return value.scalar
+    return not isinstance(value, (list, dict))
+
+
+def _string(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+        return int(number) if number.is_integer() and '.' not in value and 'e' not in value.lower() else number
+    return None
+
+
+def _template(parts, scope):
+    if len(parts) == 1 and isinstance(parts[0], str):
+        return parts[0]
+    if len(parts) == 1 and parts[0][0] != 'directive':
+        # A template made of a single interpolation keeps the type of its value
+        return evaluate(parts[0], scope)
+    rendered = []
+    for part in parts:
+        if isinstance(part, str):
+            rendered.append(part)
+            continue
+        if part[0] == 'directive':
+            return Unresolved('template directive ' + part[1], True)
+        value = evaluate(part, scope)
+        if isinstance(value, Unresolved):
+            return Unresolved(value.reason, True)
+        if value is None or isinstance(value, (list, dict)):
+            return Unresolved('template interpolates a {}'.format('null' if value is None else 'collection'), True)
+        rendered.append(_string(value))
+    return ''.join(rendered)
+
+
+def _reference_value(root, names):
+    # Value of a reference to something that only exists in a plan
+    if root == 'module':
+        return Unresolved('output of module.' + '.'.join(names[:2]))
+    if root == 'data':
+        label = 'data.' + '.'.join(names[:3])
+        names = names[2:]
+    else:
+        label = '.'.join([root] + names[:2])
+        names = names[1:]
+    scalar = len(names) > 0 and names[-1] not in _COLLECTION_ATTRIBUTES
+    return Unresolved('refers to ' + label, scalar)
+
+
+def _traverse(node, scope):
+    chain = []
+    while node[0] in ('attr', 'index'):
+        chain.append(node)
+        node = node[1]
+    chain.reverse()
+    if node[0] != 'var':
+        value = evaluate(node, scope)
+    else:
+        root = node[1]
+        attributes = []
+        for step in chain:
+            if step[0] != 'attr':
+                break
+            attributes.append(step[2])
+        used = 0
+        if root in scope.names:
+            value = scope.names[root]
+        elif root == 'var' and attributes:
+            value = scope.variables.get(attributes[0], Unresolved('var.{} has no value'.format(attributes[0])))
+            used = 1
+        elif root == 'local' and attributes:
+            value = scope.local(attributes[0])
+            used = 1
+        elif root == 'path' and attributes and attributes[0] in ('module', 'root', 'cwd'):
+            value = {'module': scope.path_module, 'root': '.', 'cwd': scope.cwd}[attributes[0]]
+            used = 1
+        elif root == 'terraform' and attributes and attributes[0] == 'workspace':
+            value = scope.workspace
+            used = 1
+        elif root in ('count', 'each', 'self', 'var', 'local', 'path', 'terraform'):
+            return Unresolved('{} is not available here'.format('.'.join([root] + attributes[:1])))
+        elif attributes:
+            return _reference_value(root, attributes)
+        else:
+            return Unresolved('unknown name ' + root)
+        chain = chain[used:]
+    for step in chain:
+        key = step[2] if step[0] == 'attr' else evaluate(step[2], scope)
+        value = _get(value, key)
+    return value
+
+
+def _get(value, key):
+    if isinstance(value, Unresolved):
+        return Unresolved(value.reason)
+    if isinstance(key, Unresolved):
+        return Unresolved(key.reason)
+    if isinstance(value, dict):
+        key = _string(key)
+        if key not in value:
+            return Unresolved('no attribute ' + key)
+        return value[key]
+    if isinstance(value, list):
+        index = _number(key)
+        if not isinstance(index, int) or not 0 <= index < len(value):
+            return Unresolved('index {} out of range'.format(key))
+        return value[index]
+    return Unresolved('can not index a {}'.format(type(value).__name__))
+
+
+def _splat(value, operations, scope):
+    if isinstance(value, Unresolved):
+        return Unresolved(value.reason)
+    if value is None:
+        return []
+    elements = value if isinstance(value, list) else [value]
+    results = []
+    for element in elements:
+        for operation, argument in operations:
+            element = _get(element, argument if operation == 'attr' else evaluate(argument, scope))
+        results.append(element)
+    return results
+
+
+def _for(node, scope):
+    _, key_name, value_name, collection_node, key_node, value_node, condition_node, is_object, grouping = node
+    collection = evaluate(collection_node, scope)
+    if isinstance(collection, Unresolved):
+        return Unresolved(collection.reason)
+    if isinstance(collection, dict):
+        pairs = sorted(collection.items())
+    elif isinstance(collection, list):
+        pairs = list(enumerate(collection))
+    else:
+        return Unresolved('for expression over a {}'.format(type(collection).__name__))
+    result = {} if is_object else []
+    for key, value in pairs:
+        names = {value_name: value}
+        if key_name:
+            names[key_name] = key
+        inner = scope.child(**names)
+        if condition_node is not None:
+            condition = evaluate(condition_node, inner)
+            if not isinstance(condition, bool):
+                return Unresolved('for expression condition is not known')
+            if not condition:
+                continue
+        if not is_object:
+            result.append(evaluate(value_node, inner))
+            continue
+        element_key = evaluate(key_node, inner)
+        if isinstance(element_key, Unresolved):
+            return Unresolved(element_key.reason)
+        element_key = _string(element_key)
+        if grouping:
+            result.setdefault(element_key, []).append(evaluate(value_node, inner))
+        else:
+            result[element_key] = evaluate(value_node, inner)
+    return result
+
+
+def _equal(left, right):
+    # Values of different types are never equal, numbers compare by value
+    if isinstance(left, bool) or isinstance(right, bool):
+        return isinstance(left, bool) and isinstance(right, bool) and left == right
+    if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+        return left == right
+    return type(left) is type(right) and left == right
+
+
+def _binary(operator, left, right):
+    if isinstance(left, Unresolved) or isinstance(right, Unresolved):
+        return Unresolved((left if isinstance(left, Unresolved) else right).reason, True)
+    if operator in ('==', '!='):
+        reason = unresolved_reason(left) or unresolved_reason(right)
+        if reason:
+            return Unresolved(reason, True)
+        equal = _equal(left, right)
+        return equal if operator == '==' else not equal
+    if operator in ('&&', '||'):
+        if not isinstance(left, bool) or not isinstance(right, bool):
+            return Unresolved('{} of non booleans'.format(operator), True)
+        return left and right if operator == '&&' else left or right
+    left, right = _number(left), _number(right)
+    if left is None or right is None:
+        return Unresolved('{} of non numbers'.format(operator), True)
+    if operator == '+':
+        return left + right
+    if operator == '-':
+        return left - right
+    if operator == '*':
+        return left * right
+    if operator in ('/', '%'):
+        if right == 0:
+            return Unresolved('division by zero', True)
+        result = left / right if operator == '/' else left % right
+        return int(result) if isinstance(result, float) and result.is_integer() else result
+    return {'<': left < right, '>': left > right, '<=': left <= right, '>=': left >= right}[operator]
+
+
+###########################################################################
+# Functions
+###########################################################################
+def _merge(*maps):
+    result = {}
+    for value in maps:
+        if value is None:
+            continue
+        if not isinstance(value, dict):
+            raise TypeError('merge of a non map')
+        result.update(value)
+    return result
+
+
+def _lookup(value, key, *default):
+    if key in value:
+        return value[key]
+    if default:
+        return default[0]
+    raise KeyError(key)
+
+
+def _flatten(value):
+    result = []
+    for element in value:
+        if isinstance(element, list):
+            result.extend(_flatten(element))
+        else:
+            result.append(element)
+    return result
+
+
+def _coalesce(*values):
+    for value in values:
+        if value is not None and value != '':
+            return value
+    raise ValueError('no non-null arguments')
+
+
+def _unique(values):
+    result = []
+    for value in values:
+        if value not in result:
+            result.append(value)
+    return sorted(result, key=_string) if all(not isinstance(value, (list, dict)) for value in result) else result
+
+
+def _file_reader(transform):
+    def read(path):
+        with open(path, 'rb') as f:
+            return transform(f.read())
+    return read
+
+
+def _format(spec, *values):
+    # %s, %d, %q and %% cover what configurations use, other verbs are left to the plan
+    values = list(values)
+    result = []
+    for match in re.finditer(r'%%|%([-+ #0-9.]*)([a-zA-Z])|[^%]+', spec):
+        if match.group(0) == '%%':
+            result.append('%')
+        elif match.group(2) is None:
+            result.append(match.group(0))
+        elif match.group(2) in ('s', 'v', 'd'):
+            result.append(_string(values.pop(0)))
+        elif match.group(2) == 'q':
+            result.append(json.dumps(_string(values.pop(0))))
+        else:
+            raise ValueError('unsupported format verb')
+    return ''.join(result)
+
+
+# name -> (function, whether the result is a scalar). They take resolved arguments,
+# COLLECTION_FUNCTIONS also accept collections holding unresolved elements
+FUNCTIONS = {
+    'merge': (_merge, False),
+    'concat': (lambda *lists: [element for value in lists for element in value], False),
+    'lookup': (_lookup, False),
+    'element': (lambda values, index: values[int(index) % len(values)], False),
+    'flatten': (_flatten, False),
+    'tolist': (list, False),
+    'toset': (_unique, False),
+    'tomap': (dict, False),
+    'keys': (lambda value: sorted(value), False),
+    'values': (lambda value: [value[key] for key in sorted(value)], False),
+    'length': (len, True),
+    'coalesce': (_coalesce, False),
+    'compact': (lambda values: [value for value in values if value not in (None, '')], False),
+    'distinct': (lambda values: [value for index, value in enumerate(values) if value not in values[:index]], False),
+    'contains': (lambda values, value: value in values, True),
+    'zipmap': (lambda keys, values: dict(zip([_string(key) for key in keys], values)), False),
+    'tostring': (lambda value: value if value is None else _string(value), True),
+    'tonumber': (lambda value: value if value is None else _number(value), True),
+    'tobool': (lambda value: value if isinstance(value, bool) or value is None else {'true': True, 'false': False}[value], True),
+    'lower': (lambda value: value.lower(), True),
+    'upper': (lambda value: value.upper(), True),
+    'title': (lambda value: value.title(), True),
+    'trimspace': (lambda value: value.strip(), True),
+    'trimprefix': (lambda value, prefix: value[len(prefix):] if value.startswith(prefix) else value, True),
+    'trimsuffix': (lambda value, suffix: value[:-len(suffix)] if suffix and value.endswith(suffix) else value, True),
+    'replace': (lambda value, old, new: value.replace(old, new) if not (old.startswith('/') and old.endswith('/') and len(old) > 1)
+                else re.sub(old[1:-1], re.sub(r'\$\{?(\w+)\}?', r'\\g<\1>', new), value), True),
+    'substr': (lambda value, offset, length: value[offset:] if length == -1 else value[offset:offset + length], True),
+    'join': (lambda separator, values: separator.join(_string(value) for value in values), True),
+    'split': (lambda separator, value: value.split(separator), False),
+    'format': (_format, True),
+    'min': (min, True),
+    'max': (max, True),
+    'abs': (abs, True),
+    'ceil': (lambda value: -(-value // 1), True),
+    'floor': (lambda value: value // 1, True),
+    'jsonencode': (lambda value: json.dumps(value, sort_keys=True, separators=(',', ':')), True),
+    'jsondecode': (json.loads, False),
+    'base64encode': (lambda value: base64.b64encode(value.encode('utf-8')).decode('ascii'), True),
+    'base64decode': (lambda value: base64.b64decode(value).decode('utf-8'), True),
+    'md5': (lambda value: hashlib.md5(value.encode('utf-8')).hexdigest(), True),
+    'sha1': (lambda value: hashlib.sha1(value.encode('utf-8')).hexdigest(), True),
+    'sha256': (lambda value: hashlib.sha256(value.encode('utf-8')).hexdigest(), True),
+    'base64sha256': (lambda value: base64.b64encode(hashlib.sha256(value.encode('utf-8')).digest()).decode('ascii'), True),
+    'file': (_file_reader(lambda data: data.decode('utf-8')), True),
+    'filebase64': (_file_reader(lambda data: base64.b64encode(data).decode('ascii')), True),
+    'filemd5': (_file_reader(lambda data: hashlib.md5(data).hexdigest()), True),
+    'filesha256': (_file_reader(lambda data: hashlib.sha256(data).hexdigest()), True),
+    'filebase64sha256': (_file_reader(lambda data: base64.b64encode(hashlib.sha256(data).digest()).decode('ascii')), True),
+    'fileexists': (os.path.isfile, True),
+}
+COLLECTION_FUNCTIONS = {'merge', 'concat', 'lookup', 'element', 'flatten', 'tolist', 'tomap', 'keys', 'values', 'length',
+                        'coalesce', 'compact', 'zipmap'}
+
+
+def _call(name, argument_nodes, expand, scope):
+    arguments = [evaluate(argument, scope) for argument in argument_nodes]
+    function, scalar = FUNCTIONS.get(name, (None, False))
+    if function is None:
+        return Unresolved('function {}() is evaluated by terraform'.format(name))
+    if expand and arguments:
+        if not isinstance(arguments[-1], list):
+            return Unresolved('expanded argument of {}() is not known'.format(name))
+        arguments = arguments[:-1] + arguments[-1]
+    for argument in arguments:
+        reason = argument.reason if isinstance(argument, Unresolved) else None
+        if reason is None and name not in COLLECTION_FUNCTIONS:
+            reason = unresolved_reason(argument)
+        if reason:
+            return Unresolved(reason, scalar)
+    if name.startswith('file'):
+        # Paths are relative to the directory terraform runs in
+        arguments = [os.path.join(scope.cwd, arguments[0])]
+    try:
+        return function(*arguments)
+    except Exception:
+        return Unresolved('{}() can not be evaluated here'.format(name), scalar)
@@ -0,0 +1,150 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Rule impact analysis.
+#
+# A snapshot of a rule set maps every scenario (outlines expanded) to the
+# fingerprint of its steps and tags and to the resource types its Given
+# steps select. Diffing two snapshots gives the resource types whose
+# verdicts can have changed: a scenario only evaluates when the plan has
+# resources of its Given types, so a workload holding none of them gets the
+# same result from the old and the new rules. Scenarios selecting resources
+# by something else than their type (e.g. resources that support tags) and
+# @failonskip scenarios, which fail workloads holding none of their types,
+# affect every workload. Scenarios sharing a name within a feature file are
+# told apart by the order they appear in.
+#
+# compliance/change_state.py keeps the snapshot the last check of every
+# workload ran with and the resource types of its plan, and skips
+# workloads the rule change does not affect.
+#
+# Usage:
+#   python3 -m compliance.impact diff git:main ./src --types aws_s3_bucket aws_lambda_function
+# where each side is a features directory, a rule bundle or git:<rev> of the
+# repository in the working directory.
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+
+from compliance import gherkin
+from compliance.engine import FAILONSKIP
+from compliance.incremental import keyed_scenarios, scenario_fingerprint
+from compliance.steps import scenario_resource_types
+
+ANY_TYPE = '*'
+RESOURCE_TYPE = re.compile(r'^[a-z0-9]+_[a-z0-9_]+$')
+
+
+def scenario_types(scenario):
+    given, _ = scenario_resource_types(scenario)
+    if FAILONSKIP in scenario.all_tags:
+        return [ANY_TYPE]
+    if not given or any(not RESOURCE_TYPE.match(name) for name in given):
+        return [ANY_TYPE]
+    return sorted(set(given))
+
+
+def snapshot(features):
+    scenarios = {}
+    for key, scenario in keyed_scenarios(features):
+        scenarios[key] = {
+            'hash': scenario_fingerprint(scenario),
+            'types': scenario_types(scenario)
+        }
+    return scenarios
+
+
+def directory_snapshot(features_dir):
+    return snapshot(gherkin.load_features(features_dir))
+
+
+def git_snapshot(rev, features_dir='src'):
+    names = subprocess.check_output(['git', 'ls-tree', '--name-only', rev, features_dir + '/'], universal_newlines=True).split()
+    features = []
+    for name in sorted(names):
+        if name.endswith('.feature'):
+            text = subprocess.check_output(['git', 'show', '{}:./{}'.format(rev, name)], universal_newlines=True)
+            features.append(gherkin.parse(text, name))
+    return snapshot(features)
+
+
+def fingerprint(scenarios):
+    return hashlib.sha256(json.dumps(scenarios, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def changed_scenarios(old, new):
+    # Keys of the scenarios added, removed or changed between the snapshots
+    return sorted(key for key in set(old) | set(new) if old.get(key, {}).get('hash') != new.get(key, {}).get('hash'))
+
+
+def changed_types(old, new):
+    types = set()
+    for key in changed_scenarios(old, new):
+        for scenarios in (old, new):
+            if key in scenarios:
+                types.update(scenarios[key]['types'])
+    return types
+
+
+def affects(old, new, resource_types):
+    # Whether the change from the old to the new rules can change the result for a workload with these resource types
+    types = changed_types(old, new)
+    return ANY_TYPE in types or not types.isdisjoint(resource_types)
+
+
+def bundle_snapshot(path):
+    # Rule bundles (compliance/rule_bundle.py) carry the snapshot of their rules
+    with open(path, 'r') as f:
+        return json.load(f)['scenarios']
+
+
+def load_snapshot(location):
+    if location.startswith('git:'):
+        return git_snapshot(location[len('git:'):])
+    if os.path.isfile(location):
+        return bundle_snapshot(location)
+    return directory_snapshot(location)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Resource types affected by a change of the rules')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    diff_parser = subparsers.add_parser('diff', help='List the scenarios changed between two rule sets')
+    diff_parser.add_argument('old', help='Features directory, rule bundle or git:<rev>')
+    diff_parser.add_argument('new', help='Features directory, rule bundle or git:<rev>')
+    diff_parser.add_argument('--types', nargs='*', default=None, help='Resource types of a workload to check for impact')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    old, new = load_snapshot(args.old), load_snapshot(args.new)
+    for key in changed_scenarios(old, new):
+        status = 'removed' if key not in new else 'added' if key not in old else 'changed'
+        print('{} {}: {}'.format(status, key, ' '.join(new.get(key, old.get(key))['types'])))
+    print('Affected resource types: {}'.format(' '.join(sorted(changed_types(old, new))) or 'none'))
+    if args.types is not None:
+        print('affected' if affects(old, new, args.types) else 'unaffected')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
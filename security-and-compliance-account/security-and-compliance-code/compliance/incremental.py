@@ -0,0 +1,245 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Incremental evaluation.
+#
+# The verdicts of a run are saved per scenario and per resource address
+# together with a content hash of every resource in the plan. On the next
+# run only resources whose hash changed (or that are new) are evaluated
+# again; the verdicts of unchanged resources are carried forward and the
+# step statuses are derived from the merged per-resource verdicts.
+#
+# Scenarios are always evaluated in full when
+#   - they have no saved verdicts or their steps/tags changed
+#   - they join several resource types (more than one Given, or a
+#     relationship step such as `it must contain aws_s3_bucket`), since a
+#     change to one side can change the verdict of the other
+#
+# Saved verdicts are only used by the same step library and the same code
+# of the compliance package, any change to either evaluates everything again.
+
+import hashlib
+import json
+import os
+
+from compliance import parallel
+from compliance import results
+from compliance.engine import FeatureResult, ScenarioResult, StepResult
+from compliance.steps import TAGGABLE, scenario_resource_types
+
+STATE_VERSION = 2
+DEFAULT_STATE_KEY = 'verdicts.json'
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def resource_hash(resource):
+    content = json.dumps(resource.values, sort_keys=True, default=repr)
+    return hashlib.sha256((resource.type + '\0' + content).encode('utf-8')).hexdigest()
+
+
+def scenario_key(scenario):
+    return '{}::{}'.format(os.path.basename(scenario.feature.uri), scenario.name)
+
+
+def keyed_scenarios(features):
+    # (key, scenario) of every scenario, scenarios of a feature file with the same name are numbered
+    keys = set()
+    for feature in features:
+        for outline in feature.scenarios:
+            for scenario in outline.expand():
+                key = scenario_key(scenario)
+                occurrence = 1
+                while key in keys:
+                    occurrence += 1
+                    key = '{}#{}'.format(scenario_key(scenario), occurrence)
+                keys.add(key)
+                yield key, scenario
+
+
+def scenario_identity(scenario):
+    return scenario.feature.uri, scenario.line, scenario.name
+
+
+def code_fingerprint(package_dir=PACKAGE_DIR):
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith('.py'):
+            with open(os.path.join(package_dir, name), 'rb') as f:
+                digest.update(name.encode('utf-8') + b'\0' + hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def scenario_fingerprint(scenario):
+    digest = hashlib.sha256()
+    for tag in scenario.all_tags:
+        digest.update(tag.encode('utf-8') + b'\0')
+    for step in scenario.steps:
+        digest.update('{} {}\0'.format(step.kind, step.text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def single_type(scenario, library):
+    # Only scenarios that check one resource type on its own can be evaluated
+    # per resource, anything else is evaluated in full
+    if any(library.match(step.text) is None for step in scenario.steps):
+        return None
+    given, related = scenario_resource_types(scenario)
+    return given[0] if len(given) == 1 and not related else None
+
+
+def skip_messages(scenario_result):
+    # Skip messages only depend on the step text, so they are kept per step index
+    return dict(
+        (str(index), step.message)
+        for index, step in enumerate(scenario_result.steps)
+        if step.message and not step.failures
+    )
+
+
+def derive_steps(scenario, selected, reached, failed_at, failures, durations, messages):
+    failonskip = '@failonskip' in scenario.all_tags
+    step_results = []
+    has_failed = False
+    # The step after the last one any resource survived stopped the scenario
+    stopped_at = max(reached.values()) + 1 if reached else 0
+    for index, step in enumerate(scenario.steps):
+        # Failures are listed in plan order, as a full evaluation lists them
+        step_failures = [(address, failures[address]) for address in selected if failed_at.get(address) == index]
+        if step_failures:
+            status = results.FAILED
+            has_failed = True
+        elif index < stopped_at:
+            status = results.SKIPPED if has_failed else results.PASSED
+        elif index == stopped_at and (reached or not selected):
+            message = messages.get(str(index), '')
+            status = results.FAILED if failonskip else results.SKIPPED
+            step_results.append(StepResult(step, status, durations.get(index, 0), message=message))
+            continue
+        else:
+            status = results.SKIPPED
+        step_results.append(StepResult(step, status, durations.get(index, 0), step_failures))
+    return step_results
+
+
+class IncrementalEvaluator:
+
+    def __init__(self, engine, state=None, jobs=1):
+        self.engine = engine
+        self.jobs = jobs
+        self.library = engine.library.signature()
+        self.code = code_fingerprint()
+        self.keys = dict((scenario_identity(scenario), key) for key, scenario in keyed_scenarios(engine.features))
+        state = state or {}
+        if (state.get('version'), state.get('library'), state.get('code')) != (STATE_VERSION, self.library, self.code):
+            state = {}
+        self.previous_resources = state.get('resources', {})
+        self.previous_scenarios = state.get('scenarios', {})
+        self.stats = {'full': 0, 'incremental': 0, 'changed_resources': 0, 'resources': 0}
+
+    def evaluate(self, plan):
+        hashes = {resource.address: resource_hash(resource) for resource in plan.resources}
+        changed = set(address for address, digest in hashes.items() if self.previous_resources.get(address) != digest)
+        self.stats['changed_resources'] = len(changed)
+        self.stats['resources'] = len(hashes)
+
+        # Work out what has to be evaluated first so all of it can run in one pool
+        tasks = []
+        carried = {}
+        for feature_index, (feature, scenarios) in enumerate(self.engine.selected):
+            for scenario_index, scenario in enumerate(scenarios):
+                position = (feature_index, scenario_index)
+                record = self.previous_scenarios.get(self.keys[scenario_identity(scenario)])
+                resource_type = single_type(scenario, self.engine.library)
+                if record and record.get('fingerprint') == scenario_fingerprint(scenario) and record.get('single_type') and resource_type:
+                    selected = self._selected(plan, resource_type)
+                    to_evaluate = frozenset(address for address in selected if address in changed)
+                    carried[position] = (record, selected, to_evaluate)
+                    if to_evaluate:
+                        tasks.append((feature_index, scenario_index, to_evaluate))
+                    self.stats['incremental'] += 1
+                else:
+                    tasks.append((feature_index, scenario_index, None))
+                    self.stats['full'] += 1
+        evaluated = parallel.evaluate_scenarios(self.engine, plan, tasks, self.jobs)
+
+        feature_results = []
+        scenarios_state = {}
+        for feature_index, (feature, scenarios) in enumerate(self.engine.selected):
+            scenario_results = []
+            for scenario_index, scenario in enumerate(scenarios):
+                position = (feature_index, scenario_index)
+                record = None
+                if position in carried:
+                    record, selected, to_evaluate = carried[position]
+                    result = self._merge(scenario, record, selected, to_evaluate, evaluated.get(position))
+                else:
+                    result = evaluated[position]
+                scenario_results.append(result)
+                scenarios_state[self.keys[scenario_identity(scenario)]] = {
+                    'fingerprint': scenario_fingerprint(scenario),
+                    'single_type': single_type(scenario, self.engine.library) is not None,
+                    'reached': result.reached,
+                    'failed_at': result.failed_at,
+                    'failures': result.failures,
+                    'messages': dict(record.get('messages', {}), **skip_messages(result)) if record else skip_messages(result)
+                }
+            feature_results.append(FeatureResult(feature, scenario_results))
+
+        self.state = {
+            'version': STATE_VERSION,
+            'library': self.library,
+            'code': self.code,
+            'resources': hashes,
+            'scenarios': scenarios_state
+        }
+        return feature_results
+
+    def _selected(self, plan, resource_type):
+        if resource_type in TAGGABLE:
+            return [resource.address for resource in plan.supporting_tags()]
+        return [resource.address for resource in plan.of_type(resource_type)]
+
+    def _merge(self, scenario, record, selected, to_evaluate, partial):
+        reached = {}
+        failed_at = {}
+        failures = {}
+        durations = {}
+        if partial is not None:
+            reached.update(partial.reached)
+            failed_at.update(partial.failed_at)
+            failures.update(partial.failures)
+            durations = dict((index, step.duration) for index, step in enumerate(partial.steps))
+
+        # Carry forward the verdicts of resources that did not change
+        for address in selected:
+            if address in to_evaluate:
+                continue
+            if address in record['reached']:
+                reached[address] = record['reached'][address]
+            if address in record['failed_at']:
+                failed_at[address] = record['failed_at'][address]
+                failures[address] = record['failures'][address]
+
+        steps = derive_steps(scenario, selected, reached, failed_at, failures, durations, record.get('messages', {}))
+        return ScenarioResult(scenario, steps, failures, set(selected), reached, failed_at)
+
+
+def load_state(store, key=DEFAULT_STATE_KEY):
+    text = store.get_text(key)
+    return json.loads(text) if text else None
+
+
+def save_state(store, state, key=DEFAULT_STATE_KEY):
+    store.put_text(key, json.dumps(state, separators=(',', ':')))
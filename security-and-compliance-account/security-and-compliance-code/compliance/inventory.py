@@ -0,0 +1,303 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Resource inventory of the checked workloads.
+#
+# Every check writes inventory.json next to its reports: the managed
+# resources of the plan by type and address, with the content hash used by
+# the incremental evaluation and the attribute paths that are set. The file
+# is published to the inventory store as workloads/<APP_ID>.json, the store
+# location is the pipeline bucket (INVENTORY_STORE).
+#
+# The inventories are indexed into a local SQLite database so questions about
+# the whole fleet are answered without planning anything again, e.g. which
+# workloads have a aws_cloudtrail without kms_key_id. Syncing mirrors the
+# store into <db>.workloads/ and only reindexes the inventories that changed
+# since the last sync.
+#
+# Attribute paths are dotted key names (logging.target_bucket) up to
+# MAX_DEPTH levels, list elements are merged into their parent path. An
+# attribute is set when its value is not null or empty, values only known
+# after apply count as set. Plans too large to load whole are streamed with
+# only the attributes the checks read (Plan.stream), kept_attributes then
+# lists those and the attribute paths are limited to them.
+#
+# Usage:
+#   python3 -m compliance.inventory emit plan.out.json -o reports/inventory.json --workload $APP_ID [--store $INVENTORY_STORE]
+#   python3 -m compliance.inventory sync --store s3://bucket/inventory [--db fleet.db]
+#   python3 -m compliance.inventory query --type aws_cloudtrail --missing kms_key_id [--store s3://bucket/inventory]
+#   python3 -m compliance.inventory types
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from compliance.incremental import resource_hash
+from compliance.plan import Plan
+from compliance.store import open_store
+
+INVENTORY_JSON = 'inventory.json'
+WORKLOADS_PREFIX = 'workloads'
+VERSION = 1
+MAX_DEPTH = 4
+
+DEFAULT_DB = os.path.join(os.path.expanduser('~'), '.cache', 'compliance-inventory.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS workloads (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    digest TEXT NOT NULL,
+    updated INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resources (
+    id INTEGER PRIMARY KEY,
+    workload INTEGER NOT NULL REFERENCES workloads(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    address TEXT NOT NULL,
+    module TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resources_type ON resources(type, workload);
+CREATE INDEX IF NOT EXISTS resources_workload ON resources(workload);
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS attributes (
+    resource INTEGER NOT NULL REFERENCES resources(id) ON DELETE CASCADE,
+    path INTEGER NOT NULL,
+    PRIMARY KEY (resource, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS attributes_path ON attributes(path);
+'''
+
+
+def attribute_paths(values, prefix='', depth=1, paths=None):
+    paths = set() if paths is None else paths
+    if isinstance(values, list):
+        for element in values:
+            attribute_paths(element, prefix, depth, paths)
+        return paths
+    if not isinstance(values, dict):
+        return paths
+    for key, value in values.items():
+        if value is None or value == '' or value == [] or value == {}:
+            continue
+        path = prefix + key
+        paths.add(path)
+        if depth < MAX_DEPTH:
+            attribute_paths(value, path + '.', depth + 1, paths)
+    return paths
+
+
+def build(plan, workload):
+    types = {}
+    for resource_type, resources in sorted(plan.by_type.items()):
+        types[resource_type] = dict(
+            (resource.address, {
+                'module': resource.module,
+                'hash': resource_hash(resource),
+                'attributes': sorted(attribute_paths(resource.values))
+            })
+            for resource in resources
+        )
+    kept_attributes = sorted(plan.attributes) if plan.attributes is not None else None
+    return {'version': VERSION, 'workload': workload, 'types': types, 'kept_attributes': kept_attributes}
+
+
+def write(inventory, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(inventory, f, sort_keys=True, separators=(',', ':'))
+
+
+def load(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def resource_types(path):
+    inventory = load(path)
+    return set(inventory['types']) if inventory else None
+
+
+def workload_key(workload):
+    return '{}/{}.json'.format(WORKLOADS_PREFIX, workload)
+
+
+def emit(plan, workload, path, store=None):
+    # Writes the inventory of a loaded plan and publishes it when a store is given
+    write(build(plan, workload), path)
+    if store and workload:
+        store.put(workload_key(workload), path)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class InventoryIndex:
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def digests(self):
+        return dict(self.db.execute('SELECT name, digest FROM workloads'))
+
+    def path_ids(self, paths):
+        self.db.executemany('INSERT OR IGNORE INTO paths(path) VALUES (?)', ((path,) for path in paths))
+        ids = {}
+        paths = list(paths)
+        # Stay below the SQLite limit of host parameters per statement
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            ids.update(self.db.execute(
+                'SELECT path, id FROM paths WHERE path IN ({})'.format(','.join('?' * len(chunk))), chunk))
+        return ids
+
+    def remove(self, workload):
+        self.db.execute('DELETE FROM workloads WHERE name = ?', (workload,))
+
+    def add(self, workload, inventory, digest):
+        self.remove(workload)
+        cursor = self.db.execute('INSERT INTO workloads(name, digest, updated) VALUES (?, ?, ?)', (workload, digest, int(time.time())))
+        workload_id = cursor.lastrowid
+        path_ids = self.path_ids(set(
+            path for resources in inventory['types'].values() for entry in resources.values() for path in entry['attributes']))
+        for resource_type, resources in inventory['types'].items():
+            for address, entry in resources.items():
+                cursor = self.db.execute(
+                    'INSERT INTO resources(workload, type, address, module, hash) VALUES (?, ?, ?, ?, ?)',
+                    (workload_id, resource_type, address, entry['module'], entry['hash']))
+                self.db.executemany(
+                    'INSERT INTO attributes(resource, path) VALUES (?, ?)',
+                    ((cursor.lastrowid, path_ids[path]) for path in entry['attributes']))
+
+    def sync(self, store, mirror_dir):
+        # Reindexes the workloads whose inventory changed, returns (updated, removed)
+        store.sync(WORKLOADS_PREFIX, mirror_dir)
+        known = self.digests()
+        present = {}
+        for name in os.listdir(mirror_dir):
+            if name.endswith('.json'):
+                present[name[:-len('.json')]] = os.path.join(mirror_dir, name)
+        updated = []
+        with self.db:
+            for workload, path in sorted(present.items()):
+                digest = file_digest(path)
+                if known.get(workload) == digest:
+                    continue
+                self.add(workload, load(path), digest)
+                updated.append(workload)
+            removed = sorted(workload for workload in known if workload not in present)
+            for workload in removed:
+                self.remove(workload)
+        return updated, removed
+
+    def query(self, resource_type, missing=None, having=None, workload=None):
+        # [(workload, address)] of the resources of a type, optionally without/with an attribute
+        sql = 'SELECT w.name, r.address FROM resources r JOIN workloads w ON w.id = r.workload WHERE r.type = ?'
+        parameters = [resource_type]
+        for attribute, operator in ((missing, 'NOT EXISTS'), (having, 'EXISTS')):
+            if attribute:
+                sql += (' AND {} (SELECT 1 FROM attributes a JOIN paths p ON p.id = a.path'
+                        ' WHERE a.resource = r.id AND p.path = ?)').format(operator)
+                parameters.append(attribute)
+        if workload:
+            sql += ' AND w.name = ?'
+            parameters.append(workload)
+        return list(self.db.execute(sql + ' ORDER BY w.name, r.address', parameters))
+
+    def types(self):
+        # [(type, workloads, resources)] over the whole fleet
+        return list(self.db.execute(
+            'SELECT type, COUNT(DISTINCT workload), COUNT(*) FROM resources GROUP BY type ORDER BY type'))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Resource inventory of the checked workloads')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    emit_parser = subparsers.add_parser('emit', help='Write the inventory of a terraform plan')
+    emit_parser.add_argument('plan', help='JSON form of the terraform plan')
+    emit_parser.add_argument('-o', '--output', required=True, help='File the inventory is written to')
+    emit_parser.add_argument('--workload', default=os.environ.get('TF_APP_ID'), help='Workload name, defaults to $TF_APP_ID')
+    emit_parser.add_argument('--store', default=os.environ.get('INVENTORY_STORE'),
+                             help='Store (s3://bucket/prefix or directory) the inventory is published to, defaults to $INVENTORY_STORE')
+
+    for name, help in (('sync', 'Index the inventories that changed since the last sync'),
+                       ('query', 'List the resources of a type, optionally without or with an attribute'),
+                       ('types', 'Count the resources of every type over the fleet')):
+        subparser = subparsers.add_parser(name, help=help)
+        subparser.add_argument('--db', default=os.environ.get('INVENTORY_DB', DEFAULT_DB), help='Index database, defaults to $INVENTORY_DB')
+        subparser.add_argument('--store', default=os.environ.get('INVENTORY_STORE') if name == 'sync' else None,
+                               help='Inventory store to sync from first')
+        if name == 'query':
+            subparser.add_argument('--type', required=True, help='Resource type, e.g. aws_cloudtrail')
+            subparser.add_argument('--missing', default=None, help='Attribute path the resources do not set, e.g. kms_key_id')
+            subparser.add_argument('--having', default=None, help='Attribute path the resources set')
+            subparser.add_argument('--workload', default=None, help='Only this workload')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'emit':
+        store = open_store(args.store) if args.store else None
+        emit(Plan.load(args.plan), args.workload, args.output, store)
+        return 0
+
+    if args.command == 'sync' and not args.store:
+        print('No inventory store given')
+        return 1
+    index = InventoryIndex(args.db)
+    try:
+        if args.store:
+            started = time.time()
+            # The downloaded inventories are kept next to the database so only changed ones are fetched again
+            updated, removed = index.sync(open_store(args.store), args.db + '.workloads')
+            print('Synced in {:.2f}s: {} updated, {} removed'.format(time.time() - started, len(updated), len(removed)), file=sys.stderr)
+        if args.command == 'query':
+            for workload, address in index.query(args.type, args.missing, args.having, args.workload):
+                print('{} {}'.format(workload, address))
+        elif args.command == 'types':
+            for resource_type, workloads, resources in index.types():
+                print('{} {} workloads {} resources'.format(resource_type, workloads, resources))
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Incremental JSON reader.
+#
+# Reports and plans can be far larger than the memory of a SMALL CodeBuild
+# instance, so instead of json.load() the document is walked one value at a
+# time. Containers are entered with items()/members() and every value the
+# caller is interested in is decoded with value(); everything else is passed
+# over with skip() which never materializes the skipped subtree.
+#
+# Example:
+#   stream = JsonStream(f)
+#   for _ in stream.items():
+#       for key in stream.members():
+#           if key == 'elements':
+#               for _ in stream.items():
+#                   scenario = stream.value()
+#           else:
+#               stream.skip()
+
+import json
+import re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[,\]} \t\n\r]')
+
+_decoder = json.JSONDecoder()
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+class JsonStream:
+
+    def __init__(self, fp, chunk_size=1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        # Drop the consumed part of the buffer and append the next chunk
+        if self.eof:
+            return False
+        chunk = self.fp.read(size or self.chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf-8')
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Next non whitespace character, or '' at the end of the document
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        if self.peek() != char:
+            raise JsonStreamError('Expected {!r} at offset {} but found {!r}'.format(char, self.pos, self.peek()))
+        self.pos += 1
+
+    def value(self):
+        if self.peek() not in '"[{':
+            # Numbers and literals have no closing character, make sure the whole token is buffered
+            while not _SCALAR_END.search(self.buffer, self.pos) and self._fill():
+                pass
+        size = self.chunk_size
+        while True:
+            try:
+                result, end = _decoder.raw_decode(self.buffer, self.pos)
+                self.pos = end
+                return result
+            except json.JSONDecodeError as error:
+                if self.eof:
+                    raise JsonStreamError(str(error)) from error
+            # Grow the read size so very large values are not re-decoded once per chunk
+            self._fill(size)
+            size *= 2
+
+    def skip(self):
+        if self.peek() not in '[{':
+            self.value()
+            return
+        depth = 0
+        in_string = False
+        while True:
+            buffer = self.buffer
+            i = self.pos
+            while i < len(buffer):
+                if in_string:
+                    match = _STRING_SPECIAL.search(buffer, i)
+                    if not match:
+                        i = len(buffer)
+                        break
+                    i = match.start()
+                    if buffer[i] == '\\':
+                        if i + 1 >= len(buffer):
+                            break
+                        i += 2
+                        continue
+                    in_string = False
+                    i += 1
+                else:
+                    match = _STRUCTURE.search(buffer, i)
+                    if not match:
+                        i = len(buffer)
+                        break
+                    char = match.group()
+                    i = match.end()
+                    if char == '"':
+                        in_string = True
+                    elif char in '[{':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            self.pos = i
+                            return
+            self.pos = i
+            if not self._fill():
+                raise JsonStreamError('Unexpected end of document')
+
+    def items(self):
+        # Yields once per array element; the caller must consume each element
+        self._expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise JsonStreamError('Expected "," or "]" at offset {} but found {!r}'.format(self.pos - 1, char))
+
+    def members(self):
+        # Yields each object key; the caller must consume the matching value
+        self._expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise JsonStreamError('Expected object key at offset {}'.format(self.pos))
+            key = self.value()
+            self._expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise JsonStreamError('Expected "," or "}}" at offset {} but found {!r}'.format(self.pos - 1, char))
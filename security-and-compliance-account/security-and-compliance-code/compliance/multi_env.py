@@ -0,0 +1,277 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Multi-environment compliance check.
+#
+# Checks one terraform workload for several environments in one run instead
+# of one compliance-check.sh run per environment. Each target is a set of var
+# files and a workspace. The feature files are parsed once into an Engine
+# shared by every environment, the plans run in a bounded pool and each plan
+# is evaluated as soon as it is ready, like the workloads of
+# compliance/batch.py. Every environment plans from the same source directory
+# with its own terraform data directory, see compliance/terraform.py.
+#
+# Targets are given as a space separated list of
+#   <VAR_FILE>[,<VAR_FILE>...][@<WORKSPACE>]
+# with var files relative to the source directory. The environment is named
+# after its workspace, or after its first var file for the default workspace,
+# e.g. "env/dev.tfvars@dev env/prod.tfvars@prod".
+#
+# Every environment gets its own reports under <reports>/<ENVIRONMENT>/. The
+# combined report (test.json, test.xml, summary.json and the html report)
+# holds the scenarios of every environment, with the feature names prefixed by
+# the environment, and <reports>/environments-summary.json the breakdown per
+# environment.
+#
+# The plan of every passing environment is handed off to the deployment
+# under <handoff>/<ENVIRONMENT>/ (compliance/plan_handoff.py). The
+# deployment deploys one checked environment, named by DEPLOY_ENVIRONMENT,
+# with the var files and workspace it was checked with: `env` prints them as
+# shell assignments and fails for an environment that is not checked.
+#
+# `static` runs the static evaluation (compliance/static.py) of every
+# environment with its var files and workspace, so a default that the
+# environments override does not decide the scenarios.
+#
+# Usage:
+#   python3 -m compliance.multi_env static -f ./src/ -d ./src -o ./reports [--tags @security]
+#   python3 -m compliance.multi_env check -f ./src/ -d ./src -o ./reports --handoff ./handoff [--tags @security]
+#   eval "$(python3 -m compliance.multi_env env $DEPLOY_ENVIRONMENT)"
+# with the targets taken from --targets or $COMPLIANCE_ENVIRONMENTS.
+
+import argparse
+import concurrent.futures
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+
+from compliance import batch
+from compliance import plan_handoff
+from compliance import report
+from compliance import results
+from compliance import rule_bundle
+from compliance import runner
+from compliance import static
+from compliance import terraform
+from compliance.store import open_store
+
+ENVIRONMENTS_SUMMARY_JSON = 'environments-summary.json'
+
+
+class Target:
+
+    def __init__(self, name, var_files=(), workspace=terraform.DEFAULT_WORKSPACE):
+        self.name = name
+        self.var_files = list(var_files)
+        self.workspace = workspace
+
+
+def parse_targets(targets):
+    parsed = []
+    for target in targets.split():
+        var_files, _, workspace = target.partition('@')
+        var_files = [var_file for var_file in var_files.split(',') if var_file]
+        workspace = workspace or terraform.DEFAULT_WORKSPACE
+        if workspace != terraform.DEFAULT_WORKSPACE or not var_files:
+            name = workspace
+        else:
+            name = os.path.basename(var_files[0]).split('.')[0]
+        if any(name == other.name for other in parsed):
+            raise ValueError('Environment {} is given twice in {}'.format(name, targets))
+        parsed.append(Target(name, var_files, workspace))
+    return parsed
+
+
+def plan_environment(target, tf_dir, work_dir, reports_dir, region, backend_bucket, cache_store, version, mirror_store, init_lock):
+    out_dir = os.path.join(work_dir, target.name)
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(reports_dir, target.name, batch.TERRAFORM_LOG), 'w') as log:
+        return terraform.plan_json(
+            tf_dir, region, backend_bucket, log, cache_store, version, mirror_store,
+            target.var_files, target.workspace, out_dir, init_lock
+        )
+
+
+def handoff_plan(target, tf_dir, plan_path, handoff_dir, region, backend_bucket):
+    # Plans restored from the plan cache have no binary plan to apply, the deployment plans those again
+    plan_out = os.path.join(os.path.dirname(os.path.abspath(plan_path)), terraform.PLAN_OUT)
+    if not os.path.isfile(plan_out):
+        return False
+    plan_handoff.publish(
+        tf_dir, os.path.join(handoff_dir, target.name), ['region={}'.format(region)], backend_bucket,
+        plan=plan_out, var_files=target.var_files, workspace=target.workspace
+    )
+    return True
+
+
+def combine_reports(environments, reports_dir):
+    # One cucumber JSON for every environment, the feature names and ids carry the environment
+    combined = []
+    for name in environments:
+        for feature in results.load_features(os.path.join(reports_dir, name, runner.CUCUMBER_JSON)):
+            feature['name'] = '[{}] {}'.format(name, feature['name'])
+            feature['id'] = '{};{}'.format(name, feature['id'])
+            for scenario in feature.get('elements', []):
+                scenario['id'] = '{};{}'.format(name, scenario['id'])
+            combined.append(feature)
+    cucumber_json = os.path.join(reports_dir, runner.CUCUMBER_JSON)
+    results.write_cucumber_json(combined, cucumber_json)
+    summary = results.summarize(combined)
+    results.write_bdd_xml(combined, os.path.join(reports_dir, runner.BDD_XML), summary)
+    results.write_summary(summary, os.path.join(reports_dir, runner.SUMMARY_JSON))
+    report.generate(cucumber_json, reports_dir)
+    return summary
+
+
+def failed_scenarios(reports_dir, name):
+    with open(os.path.join(reports_dir, name, runner.SUMMARY_JSON)) as f:
+        return sorted(set(failure['scenario'] for failure in json.load(f)['failures']))
+
+
+def check(targets, tf_dir, features_dir, reports_dir, tags=None, plan_jobs=4, region=None, backend_bucket=None, cache_store=None, mirror_store=None,
+          handoff_dir=None):
+    # The rules are parsed once and every environment is evaluated against the same Engine
+    engine = rule_bundle.load_engine(features_dir, tags)
+    version = terraform.terraform_version()
+    mirror_store = open_store(mirror_store) if mirror_store else None
+    init_lock = threading.Lock()
+    environments_summary = {}
+    for target in targets:
+        os.makedirs(os.path.join(reports_dir, target.name), exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as work_dir, concurrent.futures.ThreadPoolExecutor(plan_jobs) as executor:
+        futures = dict(
+            (executor.submit(plan_environment, target, tf_dir, work_dir, reports_dir, region, backend_bucket, cache_store, version, mirror_store, init_lock), target)
+            for target in targets
+        )
+        for future in concurrent.futures.as_completed(futures):
+            target = futures[future]
+            entry = {'var_files': target.var_files, 'workspace': target.workspace}
+            environments_summary[target.name] = entry
+            try:
+                plan_path = future.result()
+            except (terraform.TerraformError, OSError, subprocess.CalledProcessError) as e:
+                print('{}: plan failed, see {}/{}: {}'.format(target.name, target.name, batch.TERRAFORM_LOG, e))
+                entry.update(status='error', error=str(e))
+                continue
+            summary, resp_code, _ = batch.evaluate_workload(engine, target.name, plan_path, reports_dir)
+            entry.update(
+                status=results.PASSED if resp_code == 0 else results.FAILED,
+                scenarios=summary['scenarios'],
+                failed_scenarios=failed_scenarios(reports_dir, target.name)
+            )
+            if handoff_dir and resp_code == 0:
+                entry['handoff'] = handoff_plan(target, tf_dir, plan_path, handoff_dir, region, backend_bucket)
+            print('{}: {}, scenarios {passed} passed, {failed} failed, {skipped} skipped'.format(
+                target.name, entry['status'], **summary['scenarios']))
+
+    evaluated = [target.name for target in targets if environments_summary[target.name]['status'] != 'error']
+    summary = combine_reports(evaluated, reports_dir)
+    with open(os.path.join(reports_dir, ENVIRONMENTS_SUMMARY_JSON), 'w') as f:
+        json.dump(environments_summary, f, indent=2, sort_keys=True)
+    print(results.format_summary(summary))
+    failed = [target.name for target in targets if environments_summary[target.name]['status'] != results.PASSED]
+    print('{} environments: {} passed, {} failed {}'.format(len(targets), len(targets) - len(failed), len(failed), ' '.join(failed)))
+    return 1 if failed else 0
+
+
+def static_check(targets, tf_dir, features_dir, reports_dir, tags=None, region=None):
+    variables = ['region={}'.format(region)] if region else []
+    resp_codes = []
+    for target in targets:
+        print('{}:'.format(target.name))
+        resp_codes.append(static.run(
+            features_dir, tf_dir, os.path.join(reports_dir, target.name), tags, variables,
+            [os.path.join(tf_dir, var_file) for var_file in target.var_files], target.workspace
+        ))
+    combine_reports([target.name for target in targets], reports_dir)
+    return 1 if any(resp_codes) else 0
+
+
+def environment_variables(target):
+    # Shell assignments of the var files and workspace the deployment of an environment uses
+    return {
+        'TF_WORKSPACE': target.workspace,
+        'deployVarFiles': ' '.join(target.var_files)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compliance check of one terraform workload for several environments')
+    parser.add_argument('--targets', default=os.environ.get('COMPLIANCE_ENVIRONMENTS'),
+                        help='Environments as <VAR_FILE>[,<VAR_FILE>...][@<WORKSPACE>], defaults to $COMPLIANCE_ENVIRONMENTS')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    check_parser = subparsers.add_parser('check', help='Plan and evaluate every environment')
+    check_parser.add_argument('-f', '--features', required=True, help='Directory holding the .feature files, or a rule bundle')
+    check_parser.add_argument('-d', '--tf-dir', required=True, help='Terraform source directory of the workload')
+    check_parser.add_argument('-o', '--reports-dir', required=True, help='Directory the combined and per environment reports are written to')
+    check_parser.add_argument('--handoff', default=None, help='Directory the plans of the passing environments are handed off to')
+    check_parser.add_argument('--tags', default=None, help='Only run features/scenarios matching the tag')
+    check_parser.add_argument('--plan-jobs', type=int, default=int(os.environ.get('TF_PLAN_JOBS', 4)),
+                              help='Terraform plans run at the same time, defaults to $TF_PLAN_JOBS or 4')
+    check_parser.add_argument('--region', default=os.environ.get('AWS_DEFAULT_REGION'))
+    check_parser.add_argument('--backend-bucket', default=os.environ.get('WORLOAD_STATEFILE_BUCKET_NAME'))
+    check_parser.add_argument('--plan-cache-store', default=os.environ.get('PLAN_CACHE_STORE'))
+    check_parser.add_argument('--provider-mirror-store', default=os.environ.get('PROVIDER_MIRROR_STORE'))
+
+    static_parser = subparsers.add_parser('static', help='Decide the scenarios of every environment from the terraform sources')
+    static_parser.add_argument('-f', '--features', required=True, help='Directory holding the .feature files, or a rule bundle')
+    static_parser.add_argument('-d', '--tf-dir', required=True, help='Terraform source directory of the workload')
+    static_parser.add_argument('-o', '--reports-dir', required=True, help='Directory the combined and per environment reports are written to')
+    static_parser.add_argument('--tags', default=None, help='Only run features/scenarios matching the tag')
+    static_parser.add_argument('--region', default=os.environ.get('AWS_DEFAULT_REGION'))
+
+    env_parser = subparsers.add_parser('env', help='Print the var files and workspace of a checked environment')
+    env_parser.add_argument('name', help='Environment name')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.targets:
+        print('No environments given', file=sys.stderr)
+        return 1
+    try:
+        targets = parse_targets(args.targets)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if args.command == 'env':
+        target = next((target for target in targets if target.name == args.name), None)
+        if target is None:
+            print('{} is not one of the checked environments {}'.format(args.name, ' '.join(target.name for target in targets)), file=sys.stderr)
+            return 1
+        for name, value in sorted(environment_variables(target).items()):
+            print('{}={}'.format(name, shlex.quote(value)))
+        return 0
+
+    if args.command == 'static':
+        return static_check(targets, args.tf_dir, args.features, args.reports_dir, args.tags, args.region)
+
+    return check(
+        targets, args.tf_dir, args.features, args.reports_dir, args.tags, args.plan_jobs,
+        args.region, args.backend_bucket, args.plan_cache_store, args.provider_mirror_store, args.handoff
+    )
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Process pool evaluation.
+#
+# The engine and the parsed plan are put in module globals before the pool
+# is forked, so every worker shares them copy-on-write instead of receiving
+# a pickled copy. gc.freeze() moves them out of the collector's reach so the
+# workers do not dirty those pages when they collect.
+#
+# Workers evaluate one scenario per task, or all rows of a Scenario Outline
+# together when the rows are consecutive tasks, and send back a compact result
+# (statuses, durations and per-resource verdicts). The parent rebuilds the
+# results in the order of Engine.selected, so the reports are identical to a
+# serial run whatever order the scenarios finished in.
+
+import gc
+import multiprocessing
+import os
+
+from compliance.engine import FeatureResult, ScenarioResult, StepResult
+from compliance.plan import PlanSubset
+
+_ENGINE = None
+_PLAN = None
+
+
+def default_jobs():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def can_fork():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def scenario_at(engine, feature_index, scenario_index):
+    return engine.selected[feature_index][1][scenario_index]
+
+
+def group_tasks(engine, tasks):
+    # task is (feature index, scenario index, addresses or None for all of them).
+    # Consecutive rows of one outline checking the same addresses form one group.
+    groups = []
+    for task in tasks:
+        if groups:
+            last = groups[-1][-1]
+            outline = scenario_at(engine, task[0], task[1]).outline
+            if (outline is not None and last[0] == task[0] and last[1] + 1 == task[1] and last[2] == task[2]
+                    and scenario_at(engine, last[0], last[1]).outline is outline):
+                groups[-1].append(task)
+                continue
+        groups.append([task])
+    return groups
+
+
+def evaluate_group(engine, plan, group):
+    feature_index, _, addresses = group[0]
+    if addresses is not None:
+        plan = PlanSubset(plan, addresses)
+    return engine.evaluate_rows(plan, [scenario_at(engine, feature_index, scenario_index) for _, scenario_index, _ in group])
+
+
+def pack(result):
+    steps = [(step.status, step.duration, step.failures, step.message) for step in result.steps]
+    return steps, result.failures, sorted(result.resources), result.reached, result.failed_at
+
+
+def unpack(scenario, packed):
+    steps, failures, resources, reached, failed_at = packed
+    step_results = [
+        StepResult(step, status, duration, step_failures, message)
+        for step, (status, duration, step_failures, message) in zip(scenario.steps, steps)
+    ]
+    return ScenarioResult(scenario, step_results, failures, set(resources), reached, failed_at)
+
+
+def _worker(group):
+    return [pack(result) for result in evaluate_group(_ENGINE, _PLAN, group)]
+
+
+def evaluate_scenarios(engine, plan, tasks, jobs=1):
+    # Returns {(feature index, scenario index): ScenarioResult}
+    global _ENGINE, _PLAN
+    groups = group_tasks(engine, tasks)
+    jobs = min(jobs, len(groups))
+    if jobs <= 1 or not can_fork():
+        return dict(
+            (task[:2], result)
+            for group in groups
+            for task, result in zip(group, evaluate_group(engine, plan, group))
+        )
+
+    _ENGINE, _PLAN = engine, plan
+    gc.collect()
+    gc.freeze()
+    try:
+        with multiprocessing.get_context('fork').Pool(jobs) as pool:
+            # Small chunks keep the workers busy when a few scenarios are much slower than the rest
+            chunksize = max(1, len(groups) // (jobs * 8))
+            packed = pool.map(_worker, groups, chunksize)
+    finally:
+        gc.unfreeze()
+        _ENGINE = _PLAN = None
+
+    return dict(
+        (task[:2], unpack(scenario_at(engine, task[0], task[1]), result))
+        for group, group_packed in zip(groups, packed)
+        for task, result in zip(group, group_packed)
+    )
+
+
+def evaluate(engine, plan, jobs=1):
+    tasks = [
+        (feature_index, scenario_index, None)
+        for feature_index, (_, scenarios) in enumerate(engine.selected)
+        for scenario_index in range(len(scenarios))
+    ]
+    evaluated = evaluate_scenarios(engine, plan, tasks, jobs)
+    return [
+        FeatureResult(feature, [evaluated[(feature_index, scenario_index)] for scenario_index in range(len(scenarios))])
+        for feature_index, (feature, scenarios) in enumerate(engine.selected)
+    ]
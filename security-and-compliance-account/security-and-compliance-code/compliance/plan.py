@@ -0,0 +1,370 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Terraform plan model used by the evaluation engine.
+#
+# The plan JSON (`terraform show -json plan.out`) is loaded once and indexed
+#   - by resource type, so `Given I have <type> defined` is a dict lookup
+#   - by address (with and without the count/for_each index)
+#   - for resources that support tags
+# instead of scanning every resource for every scenario.
+#
+# Plans larger than STREAM_THRESHOLD bytes are not decoded whole when the
+# caller knows which attributes it reads (Engine.referenced_attributes()).
+# Plan.stream() walks planned_values, resource_changes and configuration one
+# element at a time and only keeps, per resource, the top level attributes
+# that are read or hold a read attribute below them, plus tags. Memory then
+# grows with the kept attributes instead of the size of the document.
+
+import copy
+import json
+import os
+import re
+import sys
+
+from compliance.jsonstream import JsonStream
+
+_INDEX = re.compile(r'\[[^\]]*\]')
+
+STREAM_THRESHOLD = int(os.environ.get('COMPLIANCE_STREAM_PLAN_BYTES', 256 << 20))
+# Kept by the streaming loader whatever the steps read, Plan.taggable depends on it
+ALWAYS_KEPT = frozenset(['tags'])
+
+
+class _Unknown:
+    # Placeholder for attributes whose value is only known after apply
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return '(known after apply)'
+
+    def __bool__(self):
+        return True
+
+
+UNKNOWN = _Unknown()
+
+
+def base_address(address):
+    # aws_instance.web[0] -> aws_instance.web, module.a["x"].aws_s3_bucket.b -> module.a.aws_s3_bucket.b
+    return _INDEX.sub('', address)
+
+
+def mark_unknown(values, after_unknown):
+    if not isinstance(after_unknown, dict) or not isinstance(values, dict):
+        return
+    for key, unknown in after_unknown.items():
+        if unknown is True:
+            if values.get(key) is None:
+                values[key] = UNKNOWN
+        elif isinstance(unknown, dict):
+            mark_unknown(values.get(key), unknown)
+        elif isinstance(unknown, list) and isinstance(values.get(key), list):
+            for value, element in zip(values[key], unknown):
+                mark_unknown(value, element)
+
+
+class Resource:
+
+    __slots__ = ('address', 'base_address', 'module', 'mode', 'type', 'name', 'index', 'values')
+
+    def __init__(self, address, mode, type, name, index=None, module='', values=None):
+        self.address = address
+        self.base_address = base_address(address)
+        self.module = module
+        self.mode = mode
+        self.type = type
+        self.name = name
+        self.index = index
+        self.values = values if values is not None else {}
+
+    @property
+    def supports_tags(self):
+        return 'tags' in self.values
+
+    def __repr__(self):
+        return 'Resource({})'.format(self.address)
+
+
+class Plan:
+
+    def __init__(self):
+        self.resources = []
+        self.by_type = {}
+        self.by_address = {}
+        self.by_base_address = {}
+        self.taggable = []
+        # Configuration address (indexes removed) -> referenced "type.name" relative to its module
+        self.references = {}
+        # Indexes the steps derive from the resources, built on first use (compliance.exposure)
+        self.indexes = {}
+        # Top level attributes kept by the streaming loader, None when the values are complete
+        self.attributes = None
+
+    def add(self, resource):
+        self.resources.append(resource)
+        self.by_address[resource.address] = resource
+        self.by_base_address.setdefault(resource.base_address, []).append(resource)
+        if resource.mode != 'managed':
+            return
+        self.by_type.setdefault(resource.type, []).append(resource)
+        if resource.supports_tags:
+            self.taggable.append(resource)
+
+    def of_type(self, resource_type):
+        return self.by_type.get(resource_type, [])
+
+    def supporting_tags(self):
+        return self.taggable
+
+    def get(self, address):
+        return self.by_address.get(address)
+
+    def has_type(self, resource_type):
+        return resource_type in self.by_type
+
+    def referenced(self, resource, resource_type):
+        # Resources of the given type that the resource's configuration refers to
+        found = []
+        for reference in self.references.get(base_address(resource.address), ()):
+            if reference.split('.', 1)[0] != resource_type:
+                continue
+            prefix = resource.module + '.' if resource.module else ''
+            found.extend(self.by_base_address.get(prefix + reference, ()))
+        return found
+
+    @classmethod
+    def from_dict(cls, data):
+        plan = cls()
+        after_unknown = {}
+        for change in data.get('resource_changes', []):
+            after_unknown[change['address']] = change.get('change', {}).get('after_unknown')
+
+        root = data.get('planned_values', {}).get('root_module', {})
+        for resource in _module_resources(root):
+            values = resource.get('values') or {}
+            mark_unknown(values, after_unknown.get(resource['address']))
+            plan.add(Resource(
+                address=resource['address'],
+                mode=resource.get('mode', 'managed'),
+                type=resource['type'],
+                name=resource['name'],
+                index=resource.get('index'),
+                module=_module_address(resource['address']),
+                values=values
+            ))
+
+        configuration = data.get('configuration', {}).get('root_module', {})
+        for address, expressions in _config_resources(configuration, ''):
+            plan.references[address] = set(_expression_references(expressions))
+        return plan
+
+    @classmethod
+    def load(cls, path, attributes=None):
+        # attributes: the attributes the caller reads, lets plans above STREAM_THRESHOLD be streamed
+        if attributes is not None and os.path.getsize(path) > STREAM_THRESHOLD:
+            return cls.stream(path, attributes)
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def stream(cls, path, attributes):
+        plan = cls()
+        plan.attributes = frozenset(attributes) | ALWAYS_KEPT
+        resources = []
+        after_unknown = {}
+        references = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            stream = JsonStream(f)
+            for key in stream.members():
+                if key == 'planned_values':
+                    for planned_key in stream.members():
+                        if planned_key == 'root_module':
+                            resources = _stream_module_resources(stream, plan.attributes, {})
+                        else:
+                            stream.skip()
+                elif key == 'resource_changes':
+                    for _ in stream.items():
+                        address, unknown = _stream_change(stream)
+                        if address and isinstance(unknown, dict):
+                            unknown = prune_values(unknown, plan.attributes)
+                            if unknown:
+                                after_unknown[address] = unknown
+                elif key == 'configuration':
+                    for configuration_key in stream.members():
+                        if configuration_key == 'root_module':
+                            _stream_config_references(stream, '', references)
+                        else:
+                            stream.skip()
+                else:
+                    stream.skip()
+
+        for resource in resources:
+            if resource['address'] in after_unknown:
+                # The kept values are shared between resources, only marked ones get their own copy
+                resource['values'] = copy.deepcopy(resource['values'])
+                mark_unknown(resource['values'], after_unknown[resource['address']])
+            plan.add(Resource(
+                address=resource['address'],
+                mode=resource.get('mode', 'managed'),
+                type=resource['type'],
+                name=resource['name'],
+                index=resource.get('index'),
+                module=_module_address(resource['address']),
+                values=resource['values']
+            ))
+        plan.references = references
+        return plan
+
+
+class PlanSubset:
+    # Restricts the Given lookups of a plan to a set of addresses
+
+    def __init__(self, plan, addresses):
+        self.plan = plan
+        self.addresses = addresses
+
+    def of_type(self, resource_type):
+        return [resource for resource in self.plan.of_type(resource_type) if resource.address in self.addresses]
+
+    def supporting_tags(self):
+        return [resource for resource in self.plan.supporting_tags() if resource.address in self.addresses]
+
+    def __getattr__(self, name):
+        return getattr(self.plan, name)
+
+
+def _module_resources(module):
+    for resource in module.get('resources', []):
+        yield resource
+    for child in module.get('child_modules', []):
+        yield from _module_resources(child)
+
+
+def _module_address(address):
+    # module.a.module.b.aws_x.y -> module.a.module.b
+    parts = address.split('.')
+    module = []
+    while len(parts) > 2 and parts[0] == 'module':
+        module += parts[:2]
+        parts = parts[2:]
+    return '.'.join(module)
+
+
+def _config_resources(module, prefix):
+    for resource in module.get('resources', []):
+        yield prefix + resource['address'], resource.get('expressions', {})
+    for name, call in module.get('module_calls', {}).items():
+        yield from _config_resources(call.get('module', {}), '{}module.{}.'.format(prefix, name))
+
+
+def _expression_references(expression):
+    if isinstance(expression, dict):
+        for reference in expression.get('references', []):
+            parts = reference.split('.')
+            if len(parts) >= 2 and parts[0] not in ('var', 'local', 'module', 'data', 'each', 'count', 'path', 'self'):
+                yield parts[0] + '.' + _INDEX.sub('', parts[1])
+        for key, value in expression.items():
+            if key != 'references':
+                yield from _expression_references(value)
+    elif isinstance(expression, list):
+        for value in expression:
+            yield from _expression_references(value)
+
+
+def _holds_attribute(value, attributes):
+    # Whether one of the attributes is a key anywhere below the value (or the key of a {key, value} tag)
+    if isinstance(value, dict):
+        if not attributes.isdisjoint(value):
+            return True
+        if value.get('key') in attributes and 'value' in value:
+            return True
+        return any(_holds_attribute(child, attributes) for child in value.values())
+    if isinstance(value, list):
+        return any(_holds_attribute(child, attributes) for child in value)
+    return False
+
+
+def prune_values(values, attributes, shared=None):
+    # Keeps the top level attributes that are read or hold a read attribute below them.
+    # Equal values are stored once when a shared cache is given, they must not be modified in place.
+    kept = {}
+    for key, value in values.items():
+        if key not in attributes and not _holds_attribute(value, attributes):
+            continue
+        if shared is not None:
+            if isinstance(value, (dict, list)):
+                value = shared.setdefault(json.dumps(value, sort_keys=True), value)
+            elif isinstance(value, str):
+                value = sys.intern(value)
+        kept[sys.intern(key)] = value
+    return kept
+
+
+def _stream_module_resources(stream, attributes, shared):
+    # Resources of a planned_values module, its own ones before those of its child modules as in _module_resources
+    own = []
+    children = []
+    for key in stream.members():
+        if key == 'resources':
+            for _ in stream.items():
+                resource = stream.value()
+                resource['values'] = prune_values(resource.get('values') or {}, attributes, shared)
+                for name in ('type', 'mode'):
+                    if name in resource:
+                        resource[name] = sys.intern(resource[name])
+                own.append(resource)
+        elif key == 'child_modules':
+            for _ in stream.items():
+                children += _stream_module_resources(stream, attributes, shared)
+        else:
+            stream.skip()
+    return own + children
+
+
+def _stream_change(stream):
+    # (address, after_unknown) of a resource_changes element, before and after are skipped
+    address = None
+    unknown = None
+    for key in stream.members():
+        if key == 'address':
+            address = stream.value()
+        elif key == 'change':
+            for change_key in stream.members():
+                if change_key == 'after_unknown':
+                    unknown = stream.value()
+                else:
+                    stream.skip()
+        else:
+            stream.skip()
+    return address, unknown
+
+
+def _stream_config_references(stream, prefix, references):
+    for key in stream.members():
+        if key == 'resources':
+            for _ in stream.items():
+                resource = stream.value()
+                references[prefix + resource['address']] = set(_expression_references(resource.get('expressions', {})))
+        elif key == 'module_calls':
+            for name in stream.members():
+                for call_key in stream.members():
+                    if call_key == 'module':
+                        _stream_config_references(stream, '{}module.{}.'.format(prefix, name), references)
+                    else:
+                        stream.skip()
+        else:
+            stream.skip()
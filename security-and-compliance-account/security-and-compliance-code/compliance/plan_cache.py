@@ -0,0 +1,200 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Content addressed terraform plan cache.
+#
+# The cache key is a hash of everything that can change a plan:
+#   - every file of the terraform source directory (.tf, .tfvars, the provider
+#     lock file and local files such as lambda sources fed to archive_file)
+#   - the variables passed on the command line
+#   - the lineage and serial of the remote state
+#   - any extra identity supplied by the caller (e.g. the terraform version)
+# When the key is found in the store the plan JSON is restored and
+# `terraform init` / `terraform plan` can be skipped entirely.
+#
+# Usage:
+#   key=$(python3 -m compliance.plan_cache key ./src --var region=us-east-1 --backend-bucket my-bucket)
+#   python3 -m compliance.plan_cache get --store s3://bucket/plan-cache --key $key --dest plan.out.json
+#   python3 -m compliance.plan_cache put --store s3://bucket/plan-cache --key $key --plan plan.out.json
+
+import argparse
+import hashlib
+import os
+import re
+import subprocess
+import sys
+
+from compliance.jsonstream import JsonStream
+from compliance.store import open_store
+
+# Files and directories produced by terraform itself that must not change the key
+EXCLUDED_DIRS = {'.terraform', '.git'}
+# .compliance-source.json is written next to the sources by compliance/change_state.py
+EXCLUDED_FILES = re.compile(r'(^terraform\.tfstate.*|.*\.out|.*\.out\.json|.*\.tfplan|^\.compliance-source\.json)$')
+
+BACKEND_BLOCK = re.compile(r'backend\s+"s3"\s*\{([^}]*)\}')
+BACKEND_KEY = re.compile(r'\bkey\s*=\s*"([^"]*)"')
+DEFAULT_STATE_KEY = 'terraform.tfstate'
+# The S3 backend keeps the state of other workspaces under env:/<workspace>/<key>
+WORKSPACE_KEY_PREFIX = 'env:'
+
+NO_STATE = 'no-state'
+
+
+def source_files(src_dir, exclude=()):
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs if d not in EXCLUDED_DIRS)
+        for name in sorted(files):
+            if not EXCLUDED_FILES.match(name) and os.path.relpath(os.path.join(root, name), src_dir) not in exclude:
+                yield os.path.join(root, name)
+
+
+def hash_sources(src_dir, digest, exclude=()):
+    for path in source_files(src_dir, exclude):
+        relpath = os.path.relpath(path, src_dir).replace(os.sep, '/')
+        digest.update(b'file\0' + relpath.encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+
+
+def read_state_identity(fp):
+    # Only the top level lineage and serial are needed, stop reading as soon as both are seen
+    identity = {}
+    stream = JsonStream(fp)
+    for key in stream.members():
+        if key in ('lineage', 'serial'):
+            identity[key] = stream.value()
+            if len(identity) == 2:
+                break
+        else:
+            stream.skip()
+    return '{}:{}'.format(identity.get('lineage', ''), identity.get('serial', ''))
+
+
+def backend_state_key(src_dir):
+    for path in source_files(src_dir):
+        if not path.endswith('.tf'):
+            continue
+        with open(path, 'r') as f:
+            block = BACKEND_BLOCK.search(f.read())
+        if block:
+            key = BACKEND_KEY.search(block.group(1))
+            return key.group(1) if key else DEFAULT_STATE_KEY
+    return DEFAULT_STATE_KEY
+
+
+def remote_state_identity(src_dir, bucket, workspace='default'):
+    state_key = backend_state_key(src_dir)
+    if workspace != 'default':
+        state_key = '{}/{}/{}'.format(WORKSPACE_KEY_PREFIX, workspace, state_key)
+    url = 's3://{}/{}'.format(bucket, state_key)
+    process = subprocess.Popen(
+        ['aws', 's3', 'cp', url, '-', '--only-show-errors'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    try:
+        return read_state_identity(process.stdout)
+    except ValueError:
+        process.wait()
+        error = process.stderr.read()
+        # Nothing deployed yet. Any other failure must not be cached as "no state"
+        if '404' in error or 'Not Found' in error or not error:
+            return NO_STATE
+        raise RuntimeError('Unable to read remote state {}: {}'.format(url, error.strip()))
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def local_state_identity(state_file):
+    if not os.path.isfile(state_file):
+        return NO_STATE
+    with open(state_file, 'r') as f:
+        return read_state_identity(f)
+
+
+def compute_key(src_dir, variables=(), state_identity=NO_STATE, extra=()):
+    digest = hashlib.sha256()
+    hash_sources(src_dir, digest)
+    for variable in sorted(variables):
+        digest.update(b'var\0' + variable.encode('utf-8') + b'\0')
+    digest.update(b'state\0' + state_identity.encode('utf-8') + b'\0')
+    for value in extra:
+        digest.update(b'extra\0' + value.encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+
+def object_key(key):
+    return '{}/plan.json'.format(key)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Content addressed terraform plan cache')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    key_parser = commands.add_parser('key', help='Print the cache key of a terraform source directory')
+    key_parser.add_argument('src_dir')
+    key_parser.add_argument('--var', action='append', default=[], help='Variable passed to terraform plan as name=value')
+    key_parser.add_argument('--backend-bucket', default=None, help='S3 backend bucket holding the remote state')
+    key_parser.add_argument('--state-file', default=None, help='Local state file, stands in for the remote state')
+    key_parser.add_argument('--extra', action='append', default=[], help='Additional value to include in the key')
+
+    get_parser = commands.add_parser('get', help='Restore a cached plan JSON, exits 1 on a cache miss')
+    get_parser.add_argument('--store', required=True)
+    get_parser.add_argument('--key', required=True)
+    get_parser.add_argument('--dest', required=True)
+
+    put_parser = commands.add_parser('put', help='Store a plan JSON under a cache key')
+    put_parser.add_argument('--store', required=True)
+    put_parser.add_argument('--key', required=True)
+    put_parser.add_argument('--plan', required=True)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'key':
+        if args.state_file:
+            state_identity = local_state_identity(args.state_file)
+        elif args.backend_bucket:
+            state_identity = remote_state_identity(args.src_dir, args.backend_bucket)
+        else:
+            state_identity = NO_STATE
+        print(compute_key(args.src_dir, args.var, state_identity, args.extra))
+        return 0
+
+    store = open_store(args.store)
+    if args.command == 'get':
+        if store.get(object_key(args.key), args.dest):
+            print('Plan cache hit for {}'.format(args.key), file=sys.stderr)
+            return 0
+        print('Plan cache miss for {}'.format(args.key), file=sys.stderr)
+        return 1
+
+    store.put(object_key(args.key), args.plan)
+    print('Plan cached as {}'.format(args.key), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Handoff of the compliance-checked plan to the deployment.
+#
+# The compliance check publishes the plan it evaluated: the binary plan,
+# its JSON form and a manifest holding the sha256 of both, a hash of the
+# terraform sources, the variables, var files and workspace of the plan and
+# the lineage:serial of the remote state the plan was made against. The deployment applies that
+# exact plan instead of planning again, so what gets applied is what was
+# checked.
+#
+# The provider lock file is left out of the source hash: terraform init
+# writes it when the sources do not commit one, which happens after the
+# check hashed the sources but before the deployment does. It is handed off
+# with the plan instead, and the deployment restores it before its init so
+# the providers are the ones the plan was made with. A lock file in the
+# sources must match the handed off one.
+#
+# Before applying, verify checks that the files still match their digests
+# and the sources, and compares the remote state with the one recorded at
+# plan time. When the state has moved since (another apply ran in between)
+# the saved plan is stale and the deployment plans again. terraform apply
+# makes the same lineage/serial check on a saved plan, this only lets the
+# deployment fall back instead of failing.
+#
+# verify exits with:
+#   0  the plan can be applied
+#   1  no plan was handed off or the state has moved, plan again
+#   2  the handoff does not match its digests or the sources
+#
+# Usage:
+#   python3 -m compliance.plan_handoff publish ./src --dest ./handoff --var region=us-east-1 --backend-bucket my-bucket
+#   python3 -m compliance.plan_handoff verify ./src --handoff ./handoff --var region=us-east-1 --backend-bucket my-bucket
+#                                      [--var-file env/prod.tfvars --workspace prod]
+#   python3 -m compliance.plan_handoff restore-lock ./src --handoff ./handoff
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+from compliance import plan_cache
+from compliance.inventory import file_digest
+from compliance.runner import plan_json
+
+MANIFEST = 'handoff.json'
+PLAN_OUT = 'plan.out'
+PLAN_JSON = 'plan.out.json'
+LOCK_FILE = '.terraform.lock.hcl'
+# Not a dot file in the handoff, so artifact globs pick it up
+HANDOFF_LOCK_FILE = 'terraform.lock.hcl'
+VERSION = 2
+DEFAULT_WORKSPACE = 'default'
+
+FRESH = 0
+STALE = 1
+INVALID = 2
+
+
+def source_digest(src_dir):
+    digest = hashlib.sha256()
+    plan_cache.hash_sources(src_dir, digest, exclude=(LOCK_FILE,))
+    return digest.hexdigest()
+
+
+def lock_digest(directory, name=LOCK_FILE):
+    path = os.path.join(directory, name)
+    return file_digest(path) if os.path.isfile(path) else None
+
+
+def var_file_digests(src_dir, var_files):
+    return dict((var_file, file_digest(os.path.join(src_dir, var_file))) for var_file in var_files)
+
+
+def state_identity(src_dir, backend_bucket=None, state_file=None, workspace=DEFAULT_WORKSPACE):
+    if state_file:
+        return plan_cache.local_state_identity(state_file)
+    if backend_bucket:
+        return plan_cache.remote_state_identity(src_dir, backend_bucket, workspace)
+    return plan_cache.NO_STATE
+
+
+def publish(src_dir, dest, variables=(), backend_bucket=None, state_file=None, plan=PLAN_OUT, var_files=(), workspace=DEFAULT_WORKSPACE):
+    plan_path = os.path.join(src_dir, plan)
+    # The runner leaves the JSON form next to the plan, convert it when it did not run
+    json_path = plan_path + '.json'
+    if not os.path.isfile(json_path):
+        json_path = plan_json(plan_path)
+
+    os.makedirs(dest, exist_ok=True)
+    shutil.copyfile(plan_path, os.path.join(dest, PLAN_OUT))
+    shutil.copyfile(json_path, os.path.join(dest, PLAN_JSON))
+    if os.path.isfile(os.path.join(src_dir, LOCK_FILE)):
+        shutil.copyfile(os.path.join(src_dir, LOCK_FILE), os.path.join(dest, HANDOFF_LOCK_FILE))
+    manifest = {
+        'version': VERSION,
+        'plan_sha256': file_digest(os.path.join(dest, PLAN_OUT)),
+        'plan_json_sha256': file_digest(os.path.join(dest, PLAN_JSON)),
+        'source_sha256': source_digest(src_dir),
+        'lock_sha256': lock_digest(src_dir),
+        'variables': sorted(variables),
+        'var_files': var_file_digests(src_dir, var_files),
+        'workspace': workspace,
+        'state': state_identity(src_dir, backend_bucket, state_file, workspace)
+    }
+    with open(os.path.join(dest, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(handoff_dir):
+    path = os.path.join(handoff_dir, MANIFEST)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    return manifest if manifest.get('version') == VERSION else None
+
+
+def verify(src_dir, handoff_dir, variables=(), backend_bucket=None, state_file=None, var_files=(), workspace=DEFAULT_WORKSPACE):
+    # Returns (status, reason)
+    manifest = load_manifest(handoff_dir) if handoff_dir else None
+    if manifest is None:
+        return STALE, 'no plan handed off'
+
+    for name, key in ((PLAN_OUT, 'plan_sha256'), (PLAN_JSON, 'plan_json_sha256')):
+        path = os.path.join(handoff_dir, name)
+        if not os.path.isfile(path) or file_digest(path) != manifest[key]:
+            return INVALID, '{} does not match the digest of the checked plan'.format(name)
+    if lock_digest(handoff_dir, HANDOFF_LOCK_FILE) != manifest['lock_sha256']:
+        return INVALID, '{} does not match the digest of the checked plan'.format(LOCK_FILE)
+    if source_digest(src_dir) != manifest['source_sha256']:
+        return INVALID, 'terraform sources differ from the checked sources'
+    source_lock = lock_digest(src_dir)
+    if source_lock is not None and source_lock != manifest['lock_sha256']:
+        return INVALID, 'provider lock file differs from the one the plan was made with'
+    if sorted(variables) != manifest['variables']:
+        return INVALID, 'variables differ from the checked plan'
+    if workspace != manifest['workspace']:
+        return INVALID, 'workspace {} is not the workspace {} of the checked plan'.format(workspace, manifest['workspace'])
+    if var_file_digests(src_dir, var_files) != manifest['var_files']:
+        return INVALID, 'var files differ from the ones of the checked plan'
+
+    current = state_identity(src_dir, backend_bucket, state_file, workspace)
+    if current != manifest['state']:
+        return STALE, 'state moved from {} to {} since the plan'.format(manifest['state'], current)
+    return FRESH, 'plan {} is current'.format(manifest['plan_sha256'][:12])
+
+
+def restore_lock(src_dir, handoff_dir):
+    # Puts the handed off lock file into sources that do not commit one, returns whether it did
+    source = os.path.join(handoff_dir, HANDOFF_LOCK_FILE)
+    target = os.path.join(src_dir, LOCK_FILE)
+    if os.path.isfile(target) or not os.path.isfile(source):
+        return False
+    shutil.copyfile(source, target)
+    return True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Hand the compliance-checked plan off to the deployment')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    for name, help_text in (('publish', 'Copy the checked plan and its manifest to the handoff directory'),
+                            ('verify', 'Check that the handed off plan can be applied')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('src_dir', help='Terraform source directory')
+        command.add_argument('--var', action='append', default=[], help='Variable passed to terraform plan as name=value')
+        command.add_argument('--backend-bucket', default=None, help='S3 backend bucket holding the remote state')
+        command.add_argument('--state-file', default=None, help='Local state file, stands in for the remote state')
+        command.add_argument('--var-file', action='append', default=[], help='Var file passed to terraform plan, repeatable')
+        command.add_argument('--workspace', default=DEFAULT_WORKSPACE, help='Workspace of the plan')
+
+    commands.choices['publish'].add_argument('--dest', required=True, help='Handoff directory')
+    commands.choices['publish'].add_argument('--plan', default=PLAN_OUT, help='Plan file in the source directory')
+    commands.choices['verify'].add_argument('--handoff', default=None, help='Handoff directory written by publish')
+
+    lock_parser = commands.add_parser('restore-lock', help='Copy the handed off provider lock file into the sources')
+    lock_parser.add_argument('src_dir', help='Terraform source directory')
+    lock_parser.add_argument('--handoff', required=True, help='Handoff directory written by publish')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'publish':
+        manifest = publish(args.src_dir, args.dest, args.var, args.backend_bucket, args.state_file, args.plan, args.var_file, args.workspace)
+        print('Plan {} handed off at state {}'.format(manifest['plan_sha256'][:12], manifest['state']), file=sys.stderr)
+        return 0
+    if args.command == 'restore-lock':
+        if restore_lock(args.src_dir, args.handoff):
+            print('Restored {} of the checked plan'.format(LOCK_FILE), file=sys.stderr)
+        return 0
+
+    status, reason = verify(args.src_dir, args.handoff, args.var, args.backend_bucket, args.state_file, args.var_file, args.workspace)
+    print(reason, file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
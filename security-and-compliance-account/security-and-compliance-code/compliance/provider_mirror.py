@@ -0,0 +1,386 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Shared terraform provider mirror.
+#
+# The providers a workload needs are read from its .terraform.lock.hcl when
+# there is one (exact versions). Terraform 0.13 configurations have no lock
+# file; for those they are read from required_providers, the version of the
+# provider blocks and the resource type prefixes.
+#
+# The requirements are hashed into a key. The mirror of that key is built
+# once with `terraform providers mirror` and unpacked under
+# <root>/<key>/. Concurrent checks on the same host wait on a lock file
+# instead of downloading again. With a store the mirror is also kept as
+# provider-mirror/<key>.tar.gz, so other builds restore it instead of
+# downloading.
+#
+# The generated CLI config (<root>/<key>.tfrc) installs the mirrored
+# providers from the mirror only, so `terraform init` needs no network. The
+# mirror is also the plugin cache directory, so every init on the host links
+# to one copy of each provider.
+#
+# Usage:
+#   eval "$(python3 -m compliance.provider_mirror env ./src --store s3://bucket/provider-mirror)"
+#   python3 -m compliance.provider_mirror key ./src
+
+import argparse
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import zipfile
+
+from compliance.store import open_store
+
+DEFAULT_ROOT = os.path.join(os.path.expanduser('~'), '.terraform.d', 'provider-mirror')
+DEFAULT_PLATFORM = 'linux_amd64'
+DEFAULT_HOST = 'registry.terraform.io'
+DEFAULT_NAMESPACE = 'hashicorp'
+LOCK_FILE = '.terraform.lock.hcl'
+# Providers built into terraform itself
+BUILTIN_PROVIDERS = {'terraform'}
+
+LOCKED_PROVIDER = re.compile(r'provider\s+"([^"]+)"\s*\{(.*?)\n\}', re.S)
+VERSION_ATTRIBUTE = re.compile(r'^\s*version\s*=\s*"([^"]*)"', re.M)
+SOURCE_ATTRIBUTE = re.compile(r'^\s*source\s*=\s*"([^"]*)"', re.M)
+BLOCK_START = re.compile(r'\b(provider|resource|data|required_providers)\b(?:\s+"([^"]+)")?(?:\s+"[^"]+")?\s*\{')
+OBJECT_ENTRY = re.compile(r'([A-Za-z][\w-]*)\s*=\s*\{([^{}]*)\}')
+STRING_ENTRY = re.compile(r'([A-Za-z][\w-]*)\s*=\s*"([^"]*)"')
+PROVIDER_ZIP = re.compile(r'^terraform-provider-[^_]+_(.+)_([^_]+_[^_]+)\.zip$')
+
+
+def strip_comments(text):
+    # Drops #, // and /* */ comments outside of strings
+    out = []
+    index = 0
+    in_string = False
+    while index < len(text):
+        char = text[index]
+        if in_string:
+            out.append(char)
+            if char == '\\':
+                out.append(text[index + 1:index + 2])
+                index += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif char == '#' or text.startswith('//', index):
+            end = text.find('\n', index)
+            index = len(text) if end == -1 else end
+            continue
+        elif text.startswith('/*', index):
+            end = text.find('*/', index + 2)
+            index = len(text) if end == -1 else end + 2
+            continue
+        else:
+            out.append(char)
+        index += 1
+    return ''.join(out)
+
+
+def block_body(text, start):
+    # Body of the block whose opening brace is at text[start - 1]
+    depth = 1
+    index = start
+    in_string = False
+    while index < len(text) and depth:
+        char = text[index]
+        if in_string:
+            if char == '\\':
+                index += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        index += 1
+    return text[start:index - 1]
+
+
+def normalize_source(source):
+    parts = source.split('/')
+    if len(parts) == 1:
+        parts = [DEFAULT_NAMESPACE] + parts
+    if len(parts) == 2:
+        parts = [DEFAULT_HOST] + parts
+    return '/'.join(parts).lower()
+
+
+class Requirements:
+    # provider source -> set of version constraints
+
+    def __init__(self):
+        self.providers = {}
+        self.local_names = {}
+
+    def add(self, name, source=None, constraint=None):
+        source = normalize_source(source or self.local_names.get(name, name))
+        self.local_names.setdefault(name, source)
+        constraints = self.providers.setdefault(source, set())
+        if constraint:
+            constraints.add(constraint.strip())
+
+    def __bool__(self):
+        return bool(self.providers)
+
+    def items(self):
+        return sorted((source, sorted(constraints)) for source, constraints in self.providers.items())
+
+
+def lock_file_requirements(path):
+    requirements = Requirements()
+    with open(path, 'r') as f:
+        text = f.read()
+    for source, body in LOCKED_PROVIDER.findall(text):
+        version = VERSION_ATTRIBUTE.search(body)
+        requirements.add(source.split('/')[-1], source, '= ' + version.group(1) if version else None)
+    return requirements
+
+
+def configuration_requirements(tf_dir):
+    requirements = Requirements()
+    referenced = []
+    for name in sorted(os.listdir(tf_dir)):
+        if not name.endswith('.tf'):
+            continue
+        with open(os.path.join(tf_dir, name), 'r') as f:
+            text = strip_comments(f.read())
+        for match in BLOCK_START.finditer(text):
+            kind, label = match.group(1), match.group(2)
+            if kind == 'required_providers':
+                body = block_body(text, match.end())
+                for local_name, entry in OBJECT_ENTRY.findall(body):
+                    source = SOURCE_ATTRIBUTE.search(entry)
+                    version = VERSION_ATTRIBUTE.search(entry)
+                    requirements.add(local_name, source.group(1) if source else None, version.group(1) if version else None)
+                # Terraform 0.12 style: name = "constraint"
+                for local_name, constraint in STRING_ENTRY.findall(OBJECT_ENTRY.sub('', body)):
+                    requirements.add(local_name, None, constraint)
+            elif kind == 'provider' and label:
+                version = VERSION_ATTRIBUTE.search(block_body(text, match.end()))
+                referenced.append((label, version.group(1) if version else None))
+            elif label:
+                # Resources and data sources imply the provider named by their type prefix
+                referenced.append((label.split('_', 1)[0], None))
+    for local_name, constraint in referenced:
+        if local_name not in BUILTIN_PROVIDERS:
+            requirements.add(local_name, None, constraint)
+    return requirements
+
+
+def workload_requirements(tf_dir):
+    lock_file = os.path.join(tf_dir, LOCK_FILE)
+    if os.path.isfile(lock_file):
+        return lock_file_requirements(lock_file)
+    return configuration_requirements(tf_dir)
+
+
+def mirror_key(requirements, platform=DEFAULT_PLATFORM):
+    digest = hashlib.sha256(platform.encode('utf-8') + b'\0')
+    for source, constraints in requirements.items():
+        digest.update('{}\0{}\0'.format(source, ','.join(constraints)).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def archive_key(key):
+    return '{}.tar.gz'.format(key)
+
+
+def mirror_configuration(requirements):
+    lines = ['terraform {', '  required_providers {']
+    used_names = set()
+    for source, constraints in requirements.items():
+        name = source.split('/')[-1]
+        if name in used_names:
+            name = source.replace('/', '-').replace('.', '-')
+        used_names.add(name)
+        lines.append('    {} = {{'.format(name))
+        lines.append('      source = "{}"'.format(source))
+        if constraints:
+            lines.append('      version = "{}"'.format(', '.join(constraints)))
+        lines.append('    }')
+    lines += ['  }', '}', '']
+    return '\n'.join(lines)
+
+
+def unpack_mirror(packed_dir, target):
+    # Converts the packed layout written by `terraform providers mirror` into
+    # the unpacked layout <host>/<namespace>/<type>/<version>/<platform>/
+    for dirpath, _, filenames in os.walk(packed_dir):
+        for filename in filenames:
+            match = PROVIDER_ZIP.match(filename)
+            if not match:
+                continue
+            version, platform = match.groups()
+            provider_path = os.path.relpath(dirpath, packed_dir)
+            destination = os.path.join(target, provider_path, version, platform)
+            os.makedirs(destination, exist_ok=True)
+            with zipfile.ZipFile(os.path.join(dirpath, filename)) as archive:
+                for info in archive.infolist():
+                    extracted = archive.extract(info, destination)
+                    # zipfile drops the permission bits, the provider binaries must stay executable
+                    mode = (info.external_attr >> 16) & 0o777
+                    if mode:
+                        os.chmod(extracted, mode)
+
+
+def build_mirror(requirements, target, platform=DEFAULT_PLATFORM):
+    work_dir = tempfile.mkdtemp(prefix='provider-mirror-')
+    try:
+        with open(os.path.join(work_dir, 'providers.tf'), 'w') as f:
+            f.write(mirror_configuration(requirements))
+        packed_dir = os.path.join(work_dir, 'packed')
+        subprocess.check_call(
+            ['terraform', 'providers', 'mirror', '-platform={}'.format(platform), packed_dir],
+            cwd=work_dir,
+            stdout=sys.stderr
+        )
+        unpack_mirror(packed_dir, target)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def restore_mirror(store, key, target):
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = os.path.join(tmp, archive_key(key))
+        if not store.get(archive_key(key), archive):
+            return False
+        with tarfile.open(archive, 'r:gz') as tar:
+            tar.extractall(target)
+    return True
+
+
+def save_mirror(store, key, mirror_dir):
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = os.path.join(tmp, archive_key(key))
+        with tarfile.open(archive, 'w:gz') as tar:
+            for name in sorted(os.listdir(mirror_dir)):
+                tar.add(os.path.join(mirror_dir, name), name)
+        store.put(archive_key(key), archive)
+
+
+def ensure_mirror(requirements, root=DEFAULT_ROOT, store=None, platform=DEFAULT_PLATFORM):
+    # Returns the mirror directory of the requirements, building it when needed
+    key = mirror_key(requirements, platform)
+    mirror_dir = os.path.join(root, key)
+    if os.path.isdir(mirror_dir):
+        return mirror_dir
+
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, key + '.lock'), 'w') as lock:
+        # Parallel checks needing the same providers wait for the first one to finish
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.isdir(mirror_dir):
+            return mirror_dir
+        staging = tempfile.mkdtemp(prefix=key + '.', dir=root)
+        try:
+            if store and restore_mirror(store, key, staging):
+                print('Provider mirror {} restored from {}'.format(key, store), file=sys.stderr)
+            else:
+                build_mirror(requirements, staging, platform)
+                print('Provider mirror {} built'.format(key), file=sys.stderr)
+                if store:
+                    save_mirror(store, key, staging)
+            # The mirror only becomes visible once complete
+            os.rename(staging, mirror_dir)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    return mirror_dir
+
+
+def cli_configuration(requirements, mirror_dir):
+    sources = ', '.join('"{}"'.format(source) for source, _ in requirements.items())
+    return '\n'.join([
+        'plugin_cache_dir = "{}"'.format(mirror_dir),
+        'provider_installation {',
+        '  filesystem_mirror {',
+        '    path    = "{}"'.format(mirror_dir),
+        '    include = [{}]'.format(sources),
+        '  }',
+        '  direct {',
+        '    exclude = [{}]'.format(sources),
+        '  }',
+        '}',
+        ''
+    ])
+
+
+def write_cli_configuration(requirements, mirror_dir):
+    path = mirror_dir + '.tfrc'
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(mirror_dir))
+    with os.fdopen(fd, 'w') as f:
+        f.write(cli_configuration(requirements, mirror_dir))
+    os.replace(tmp, path)
+    return path
+
+
+def terraform_environment(tf_dir, root=DEFAULT_ROOT, store=None, platform=DEFAULT_PLATFORM):
+    # Environment variables pointing terraform at the mirror of tf_dir, empty when it needs no providers
+    requirements = workload_requirements(tf_dir)
+    if not requirements:
+        return {}
+    mirror_dir = ensure_mirror(requirements, root, store, platform)
+    return {'TF_CLI_CONFIG_FILE': write_cli_configuration(requirements, mirror_dir)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Shared terraform provider mirror')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    key_parser = subparsers.add_parser('key', help='Print the mirror key of a terraform directory')
+    key_parser.add_argument('tf_dir')
+    key_parser.add_argument('--platform', default=DEFAULT_PLATFORM)
+
+    env_parser = subparsers.add_parser('env', help='Ensure the mirror exists and print the shell exports using it')
+    env_parser.add_argument('tf_dir')
+    env_parser.add_argument('--root', default=os.environ.get('TF_PROVIDER_MIRROR_ROOT', DEFAULT_ROOT),
+                            help='Local mirror directory, defaults to $TF_PROVIDER_MIRROR_ROOT or ~/.terraform.d/provider-mirror')
+    env_parser.add_argument('--store', default=None, help='Store (s3://bucket/prefix or directory) keeping the mirror between builds')
+    env_parser.add_argument('--platform', default=DEFAULT_PLATFORM)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'key':
+        print(mirror_key(workload_requirements(args.tf_dir), args.platform))
+        return 0
+
+    store = open_store(args.store) if args.store else None
+    try:
+        environment = terraform_environment(args.tf_dir, args.root, store, args.platform)
+    except (subprocess.CalledProcessError, OSError) as e:
+        # terraform falls back to downloading the providers itself
+        print('Provider mirror unavailable: {}'.format(e), file=sys.stderr)
+        return 1
+    for name, value in sorted(environment.items()):
+        print('export {}={}'.format(name, value))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
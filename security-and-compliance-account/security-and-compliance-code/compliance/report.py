@@ -0,0 +1,258 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Report stage.
+#
+# Streams the cucumber JSON written by the runner one scenario at a time and,
+# in that single pass, writes
+#   - the HTML report under <reports>/cucumber-html-reports/
+#   - the cucumber JSON consumed by the CodeBuild report group, with step
+#     durations normalized to integer nanoseconds (rounded, not truncated)
+#   - timing.json and slowest.txt (compliance/timing.py)
+# Only one scenario is held in memory at a time so report size is bounded by
+# disk, not by the build instance.
+#
+# Usage:
+#   python3 -m compliance.report -f ./reports/test.json -o ./reports
+
+import argparse
+import html
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+from compliance import results
+from compliance import timing
+from compliance.jsonstream import JsonStream
+
+HTML_REPORT_DIR = 'cucumber-html-reports'
+HTML_REPORT = 'overview-features.html'
+
+STATUSES = (results.PASSED, results.FAILED, results.SKIPPED, results.UNDEFINED)
+
+STYLE = '''
+body { font-family: Arial, Helvetica, sans-serif; margin: 2em; color: #222; }
+table { border-collapse: collapse; margin-bottom: 2em; width: 100%; }
+th, td { border: 1px solid #ccc; padding: 4px 8px; text-align: left; vertical-align: top; }
+th { background: #eee; }
+.passed { background: #c5f7c5; }
+.failed { background: #f7c5c5; }
+.skipped { background: #f7f1c5; }
+.undefined { background: #e0e0e0; }
+pre { white-space: pre-wrap; margin: 0; }
+'''
+
+
+def normalize_step(step):
+    # CodeBuild expects integer nanosecond durations, round instead of dropping the fraction
+    result = step.get('result')
+    if result and isinstance(result.get('duration'), float):
+        result['duration'] = int(round(result['duration']))
+    return step
+
+
+def _milliseconds(nanoseconds):
+    return '{:.3f}'.format(nanoseconds / 10 ** 6)
+
+
+class FeatureTotals:
+
+    def __init__(self, name='', uri=''):
+        self.name = name
+        self.uri = uri
+        self.scenarios = dict.fromkeys(STATUSES, 0)
+        self.steps = dict.fromkeys(STATUSES, 0)
+        self.duration = 0
+
+    def add(self, other):
+        for status in STATUSES:
+            self.scenarios[status] += other.scenarios[status]
+            self.steps[status] += other.steps[status]
+        self.duration += other.duration
+
+    @property
+    def status(self):
+        for status in (results.FAILED, results.UNDEFINED, results.PASSED):
+            if self.scenarios[status]:
+                return status
+        return results.SKIPPED
+
+
+class ReportWriter:
+
+    def __init__(self, json_out, html_body, timings=None):
+        self.json_out = json_out
+        self.html_body = html_body
+        self.timings = timings
+        self.features = []
+
+    def write_feature(self, stream, first):
+        # Copies one feature object member by member, streaming its scenarios
+        totals = FeatureTotals()
+        self.json_out.write('' if first else ',\n')
+        self.json_out.write('{')
+        self.html_body.write('<h2 id="feature-{}">'.format(len(self.features)))
+        header_written = False
+        member_count = 0
+        for key in stream.members():
+            self.json_out.write('{}{}: '.format(', ' if member_count else '', json.dumps(key)))
+            member_count += 1
+            if key == 'elements':
+                if not header_written:
+                    self._write_feature_header(totals)
+                    header_written = True
+                self._write_scenarios(stream, totals)
+                continue
+            value = stream.value()
+            if key == 'name':
+                totals.name = value
+            elif key == 'uri':
+                totals.uri = value
+            self.json_out.write(json.dumps(value))
+        if not header_written:
+            self._write_feature_header(totals)
+        self.json_out.write('}')
+        self.html_body.write('</tbody></table>\n')
+        self.html_body.write('<p class="{}">{}: {} scenarios passed, {} failed, {} skipped in {} ms</p>\n'.format(
+            totals.status, totals.status.upper(), totals.scenarios[results.PASSED],
+            totals.scenarios[results.FAILED], totals.scenarios[results.SKIPPED], _milliseconds(totals.duration)
+        ))
+        self.features.append(totals)
+
+    def _write_feature_header(self, totals):
+        self.html_body.write('{}</h2>\n<p>{}</p>\n'.format(html.escape(totals.name), html.escape(totals.uri)))
+        self.html_body.write('<table><thead><tr><th>Scenario</th><th>Status</th><th>Duration (ms)</th><th>Details</th></tr></thead><tbody>\n')
+
+    def _write_scenarios(self, stream, totals):
+        self.json_out.write('[')
+        first = True
+        for _ in stream.items():
+            scenario = stream.value()
+            for step in scenario.get('steps', []):
+                normalize_step(step)
+            self.json_out.write('' if first else ', ')
+            self.json_out.write(json.dumps(scenario))
+            first = False
+            self._write_scenario_row(scenario, totals)
+            if self.timings is not None:
+                self.timings.add(totals.name, totals.uri, scenario)
+        self.json_out.write(']')
+
+    def _write_scenario_row(self, scenario, totals):
+        status = results.scenario_status(scenario)
+        duration = 0
+        totals.scenarios[status] += 1
+        for step in scenario.get('steps', []):
+            totals.steps[results.step_status(step)] += 1
+            duration += results.step_duration(step)
+        totals.duration += duration
+        details = ''
+        if status == results.FAILED:
+            details = '<pre>{}</pre>'.format(html.escape(results.failure_message(scenario)))
+        self.html_body.write('<tr class="{0}"><td>{1}</td><td>{0}</td><td>{2}</td><td>{3}</td></tr>\n'.format(
+            status, html.escape(scenario.get('name', '')), _milliseconds(duration), details
+        ))
+
+    def write_overview(self, out):
+        overall = FeatureTotals()
+        for totals in self.features:
+            overall.add(totals)
+        out.write('<h1>Compliance Report</h1>\n')
+        out.write('<table><thead><tr><th></th>{}</tr></thead><tbody>\n'.format(
+            ''.join('<th>{}</th>'.format(status) for status in STATUSES)
+        ))
+        for label, counts in (('Scenarios', overall.scenarios), ('Steps', overall.steps)):
+            out.write('<tr><td>{}</td>{}</tr>\n'.format(label, ''.join('<td>{}</td>'.format(counts[status]) for status in STATUSES)))
+        out.write('</tbody></table>\n')
+        out.write('<table><thead><tr><th>Feature</th><th>Status</th><th>Passed</th><th>Failed</th><th>Skipped</th><th>Duration (ms)</th></tr></thead><tbody>\n')
+        for index, totals in enumerate(self.features):
+            out.write('<tr class="{0}"><td><a href="#feature-{1}">{2}</a></td><td>{0}</td><td>{3}</td><td>{4}</td><td>{5}</td><td>{6}</td></tr>\n'.format(
+                totals.status, index, html.escape(totals.name), totals.scenarios[results.PASSED],
+                totals.scenarios[results.FAILED], totals.scenarios[results.SKIPPED], _milliseconds(totals.duration)
+            ))
+        out.write('</tbody></table>\n')
+        return overall
+
+
+def _file_mode(path):
+    # Mode a plain open() would give the file: its current mode, or 0666 less the umask
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def generate(cucumber_json, reports_dir, json_out_path=None):
+    json_out_path = json_out_path or cucumber_json
+    html_dir = os.path.join(reports_dir, HTML_REPORT_DIR)
+    os.makedirs(html_dir, exist_ok=True)
+
+    # The JSON output may replace the input, so it is written next to it and renamed at the end
+    json_tmp = tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(json_out_path)), delete=False)
+    html_body = tempfile.TemporaryFile('w+')
+    timings = timing.TimingCollector()
+    try:
+        with open(cucumber_json, 'r') as f, json_tmp:
+            writer = ReportWriter(json_tmp, html_body, timings)
+            stream = JsonStream(f)
+            json_tmp.write('[')
+            for index, _ in enumerate(stream.items()):
+                writer.write_feature(stream, index == 0)
+            json_tmp.write(']\n')
+        # NamedTemporaryFile creates the file 0600, readers running as another user need the usual mode
+        os.chmod(json_tmp.name, _file_mode(json_out_path))
+        os.replace(json_tmp.name, json_out_path)
+
+        with open(os.path.join(html_dir, HTML_REPORT), 'w') as out:
+            out.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Compliance Report</title>')
+            out.write('<style>{}</style></head><body>\n'.format(STYLE))
+            overall = writer.write_overview(out)
+            html_body.seek(0)
+            shutil.copyfileobj(html_body, out)
+            out.write('</body></html>\n')
+        timings.write(reports_dir)
+    finally:
+        html_body.close()
+        if os.path.exists(json_tmp.name):
+            os.remove(json_tmp.name)
+    return overall
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the HTML and CodeBuild JSON compliance reports')
+    parser.add_argument('-f', '--cucumber-json', required=True, help='Cucumber JSON written by the runner')
+    parser.add_argument('-o', '--reports-dir', required=True, help='Directory the HTML report is written to')
+    parser.add_argument('--json-out', default=None, help='Normalized cucumber JSON output, defaults to rewriting the input')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.cucumber_json):
+        print('No cucumber report found at {}'.format(args.cucumber_json))
+        return 1
+    generate(args.cucumber_json, args.reports_dir, args.json_out)
+    with open(os.path.join(args.reports_dir, timing.SLOWEST_TXT)) as f:
+        print(f.read(), end='')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
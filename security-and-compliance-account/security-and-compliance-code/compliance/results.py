@@ -0,0 +1,180 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Result set shared by every output format.
+#
+# A compliance run produces a single list of features in cucumber JSON shape
+# (feature -> elements (scenarios) -> steps -> result). The cucumber JSON,
+# BDD XML and summary outputs are all rendered from that one structure so a
+# plan only ever has to be evaluated once.
+
+import json
+import socket
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+PASSED = 'passed'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+UNDEFINED = 'undefined'
+
+NANOSECONDS = 10 ** 9
+
+
+def load_features(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_cucumber_json(features, path):
+    with open(path, 'w') as f:
+        json.dump(features, f, indent=2)
+
+
+def step_status(step):
+    return step.get('result', {}).get('status', SKIPPED)
+
+
+def step_duration(step):
+    # Durations are nanoseconds in cucumber JSON
+    return step.get('result', {}).get('duration', 0) or 0
+
+
+def scenario_status(scenario):
+    statuses = [step_status(step) for step in scenario.get('steps', [])]
+    if FAILED in statuses:
+        return FAILED
+    if UNDEFINED in statuses:
+        return UNDEFINED
+    if statuses and all(status == PASSED for status in statuses):
+        return PASSED
+    return SKIPPED
+
+
+def feature_status(feature):
+    statuses = [scenario_status(scenario) for scenario in feature.get('elements', [])]
+    if FAILED in statuses:
+        return FAILED
+    if UNDEFINED in statuses:
+        return UNDEFINED
+    if PASSED in statuses:
+        return PASSED
+    return SKIPPED
+
+
+def failure_message(scenario):
+    for step in scenario.get('steps', []):
+        if step_status(step) == FAILED:
+            return step.get('result', {}).get('error_message', '')
+    return ''
+
+
+def summarize(features):
+    summary = {
+        'features': {PASSED: 0, FAILED: 0, SKIPPED: 0, UNDEFINED: 0},
+        'scenarios': {PASSED: 0, FAILED: 0, SKIPPED: 0, UNDEFINED: 0},
+        'steps': {PASSED: 0, FAILED: 0, SKIPPED: 0, UNDEFINED: 0},
+        'duration': 0,
+        'failures': []
+    }
+    for feature in features:
+        summary['features'][feature_status(feature)] += 1
+        for scenario in feature.get('elements', []):
+            status = scenario_status(scenario)
+            summary['scenarios'][status] += 1
+            for step in scenario.get('steps', []):
+                summary['steps'][step_status(step)] += 1
+                summary['duration'] += step_duration(step)
+            if status == FAILED:
+                summary['failures'].append({
+                    'feature': feature.get('name', ''),
+                    'scenario': scenario.get('name', ''),
+                    'uri': feature.get('uri', ''),
+                    'line': scenario.get('line', 0),
+                    'message': failure_message(scenario)
+                })
+    return summary
+
+
+def write_summary(summary, path):
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+def format_summary(summary):
+    lines = []
+    for name in ('features', 'scenarios', 'steps'):
+        counts = summary[name]
+        lines.append('{} {} ({} passed, {} failed, {} skipped)'.format(
+            sum(counts.values()), name, counts[PASSED], counts[FAILED], counts[SKIPPED]
+        ))
+    for failure in summary['failures']:
+        lines.append('FAILED: {} -> {}'.format(failure['feature'], failure['scenario']))
+    return '\n'.join(lines)
+
+
+def _seconds(nanoseconds):
+    return '{:.6f}'.format(nanoseconds / NANOSECONDS)
+
+
+def write_bdd_xml(features, path, summary=None):
+    # Same layout as the radish BDD XML writer used by terraform-compliance
+    summary = summary or summarize(features)
+    timestamp = datetime.now(timezone.utc).isoformat()
+    testrun = ET.Element('testrun', {
+        'agent': 'compliance@' + socket.gethostname(),
+        'starttime': timestamp,
+        'endtime': timestamp,
+        'duration': _seconds(summary['duration']),
+        'passed': str(summary['features'][PASSED]),
+        'failed': str(summary['features'][FAILED]),
+        'skipped': str(summary['features'][SKIPPED]),
+        'totalfeatures': str(len(features))
+    })
+    for feature_index, feature in enumerate(features, 1):
+        scenarios = feature.get('elements', [])
+        feature_element = ET.SubElement(testrun, 'feature', {
+            'sentence': feature.get('name', ''),
+            'id': str(feature_index),
+            'result': feature_status(feature),
+            'testfile': feature.get('uri', ''),
+            'duration': _seconds(sum(step_duration(step) for scenario in scenarios for step in scenario.get('steps', [])))
+        })
+        ET.SubElement(feature_element, 'description').text = feature.get('description', '')
+        scenarios_element = ET.SubElement(feature_element, 'scenarios')
+        for scenario_index, scenario in enumerate(scenarios, 1):
+            steps = scenario.get('steps', [])
+            scenario_element = ET.SubElement(scenarios_element, 'scenario', {
+                'sentence': scenario.get('name', ''),
+                'id': str(scenario_index),
+                'result': scenario_status(scenario),
+                'testfile': feature.get('uri', ''),
+                'duration': _seconds(sum(step_duration(step) for step in steps))
+            })
+            for step_index, step in enumerate(steps, 1):
+                step_element = ET.SubElement(scenario_element, 'step', {
+                    'sentence': '{} {}'.format(step.get('keyword', '').strip(), step.get('name', '')),
+                    'id': str(step_index),
+                    'result': step_status(step),
+                    'duration': _seconds(step_duration(step))
+                })
+                if step_status(step) == FAILED:
+                    message = step.get('result', {}).get('error_message', '')
+                    failure = ET.SubElement(step_element, 'failure', {
+                        'message': message.splitlines()[0] if message else '',
+                        'type': 'Failure'
+                    })
+                    failure.text = message
+    ET.ElementTree(testrun).write(path, encoding='utf-8', xml_declaration=True)
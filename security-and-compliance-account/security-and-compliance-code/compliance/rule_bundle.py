@@ -0,0 +1,291 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Precompiled, content addressed rule bundle.
+#
+# MergeCode publishes the rules it just merged as one JSON document:
+#   - the parsed features (Background steps merged into the scenarios,
+#     Examples tables kept so outlines expand as usual)
+#   - the step binding of every step text: the sentence of the step library
+#     it matches and its arguments, so no step needs regex matching at load
+#   - the regular expressions written in the features, validated when
+#     building so an invalid one fails the merge instead of the workloads
+#   - the resource type metadata of every scenario (compliance/impact.py
+#     snapshot)
+# The bundle is stored as <sha256>.json and never rewritten. LATEST holds
+# the digest of the last bundle published.
+#
+# Workload checks pin a digest. fetch keeps the bundles it downloaded in a
+# local cache directory and checks the digest of every bundle it hands
+# out. A local directory also works as the store.
+#
+# Bindings are only used when the step library has the same signature as
+# the library that built the bundle, otherwise the steps are matched again.
+#
+# Usage:
+#   python3 -m compliance.rule_bundle publish ./src --store s3://bucket/rule-bundles
+#   python3 -m compliance.rule_bundle fetch $RULE_BUNDLE_DIGEST --store s3://bucket/rule-bundles --dest rule-bundle.json
+#   python3 -m compliance.rule_bundle latest --store s3://bucket/rule-bundles
+#   python3 -m compliance.runner -f rule-bundle.json -p plan.out -o ./reports
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from compliance import gherkin
+from compliance import impact
+from compliance.engine import Engine
+from compliance.steps import LIBRARY, MATCH_REGEX
+from compliance.store import open_store
+
+VERSION = 1
+LATEST = 'LATEST'
+DEFAULT_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'compliance-rule-bundles')
+DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+class RuleBundleError(Exception):
+    pass
+
+
+class RuleBundle:
+
+    def __init__(self, document, digest=None):
+        self.digest = digest
+        self.library = document['library']
+        self.bindings = document['bindings']
+        self.regexes = document['regexes']
+        # scenario key -> fingerprint and resource types, see compliance/impact.py
+        self.scenarios = document['scenarios']
+        self.features = [_load_feature(feature) for feature in document['features']]
+
+
+def _dump_step(step):
+    return [step.keyword, step.text, step.line, step.kind]
+
+
+def _load_step(data):
+    return gherkin.Step(*data)
+
+
+def _dump_feature(feature):
+    return {
+        'name': feature.name,
+        'line': feature.line,
+        'tags': feature.tags,
+        'uri': os.path.normpath(feature.uri).replace(os.sep, '/'),
+        'description': feature.description,
+        'background': [_dump_step(step) for step in feature.background],
+        'scenarios': [{
+            'keyword': scenario.keyword,
+            'name': scenario.name,
+            'line': scenario.line,
+            'tags': scenario.tags,
+            'steps': [_dump_step(step) for step in scenario.steps],
+            'examples': [{
+                'line': examples.line,
+                'tags': examples.tags,
+                'header': examples.header,
+                'rows': examples.rows
+            } for examples in scenario.examples]
+        } for scenario in feature.scenarios]
+    }
+
+
+def _load_feature(data):
+    feature = gherkin.Feature(data['name'], data['line'], data['tags'], data['uri'])
+    feature.description = data['description']
+    feature.background = [_load_step(step) for step in data['background']]
+    for scenario_data in data['scenarios']:
+        scenario = gherkin.Scenario(scenario_data['keyword'], scenario_data['name'], scenario_data['line'], scenario_data['tags'], feature)
+        scenario.steps = [_load_step(step) for step in scenario_data['steps']]
+        for examples_data in scenario_data['examples']:
+            examples = gherkin.Examples(examples_data['line'], examples_data['tags'])
+            examples.header = examples_data['header']
+            examples.rows = [(line, values) for line, values in examples_data['rows']]
+            scenario.examples.append(examples)
+        feature.scenarios.append(scenario)
+    return feature
+
+
+def build(features_dir, library=LIBRARY):
+    features = gherkin.load_features(features_dir)
+    bindings = {}
+    regexes = set()
+    for feature in features:
+        for outline in feature.scenarios:
+            for scenario in outline.expand():
+                for step in scenario.steps:
+                    if step.text in bindings:
+                        continue
+                    binding = bindings[step.text] = library.binding(step.text)
+                    if binding is None or binding[0] != MATCH_REGEX:
+                        continue
+                    try:
+                        re.compile(binding[1][1])
+                    except re.error as error:
+                        raise gherkin.GherkinError('{}:{}: invalid regex {!r}: {}'.format(feature.uri, step.line, binding[1][1], error))
+                    regexes.add(binding[1][1])
+    return {
+        'version': VERSION,
+        'library': library.signature(),
+        'features': [_dump_feature(feature) for feature in features],
+        'bindings': bindings,
+        'regexes': sorted(regexes),
+        'scenarios': impact.snapshot(features)
+    }
+
+
+def encode(document):
+    # Canonical form, the same rules always give the same digest
+    return json.dumps(document, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def object_key(digest):
+    return '{}.json'.format(digest)
+
+
+def publish(features_dir, store):
+    data = encode(build(features_dir))
+    digest = hashlib.sha256(data).hexdigest()
+    if object_key(digest) not in store.list(''):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, object_key(digest))
+            with open(path, 'wb') as f:
+                f.write(data)
+            store.put(object_key(digest), path)
+    store.put_text(LATEST, digest + '\n')
+    return digest
+
+
+def _read_verified(path, digest):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != digest:
+        return None
+    return data
+
+
+def fetch(digest, store=None, cache_dir=DEFAULT_CACHE):
+    # Returns the path of the cached bundle, downloading it on a cache miss
+    if not DIGEST.match(digest):
+        raise RuleBundleError('Not a rule bundle digest: {}'.format(digest))
+    path = os.path.join(cache_dir, object_key(digest))
+    if os.path.isfile(path) and _read_verified(path, digest) is not None:
+        return path
+    if store is None:
+        raise RuleBundleError('Rule bundle {} is not cached and no store was given'.format(digest))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir)
+    os.close(fd)
+    try:
+        if not store.get(object_key(digest), tmp):
+            raise RuleBundleError('Rule bundle {} not found in {}'.format(digest, store))
+        if _read_verified(tmp, digest) is None:
+            raise RuleBundleError('Rule bundle {} does not match its digest'.format(digest))
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    document = json.loads(data.decode('utf-8'))
+    if document.get('version') != VERSION:
+        raise RuleBundleError('{}: unsupported rule bundle version {}'.format(path, document.get('version')))
+    return RuleBundle(document, hashlib.sha256(data).hexdigest())
+
+
+def load_rules(path, library=LIBRARY):
+    # Parsed features of a features directory or of a rule bundle file
+    if os.path.isdir(path):
+        return gherkin.load_features(path)
+    bundle = load(path)
+    if bundle.library == library.signature():
+        library.preload(bundle.bindings)
+    return bundle.features
+
+
+def load_engine(path, tags=None, library=LIBRARY):
+    return Engine(load_rules(path, library), tags, library)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Precompiled, content addressed rule bundle')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    publish_parser = commands.add_parser('publish', help='Build the bundle of a features directory and store it, prints its digest')
+    publish_parser.add_argument('features_dir')
+    publish_parser.add_argument('--store', required=True)
+
+    build_parser = commands.add_parser('build', help='Build the bundle of a features directory into a file, prints its digest')
+    build_parser.add_argument('features_dir')
+    build_parser.add_argument('--dest', required=True)
+
+    fetch_parser = commands.add_parser('fetch', help='Fetch a bundle by digest through the local cache')
+    fetch_parser.add_argument('digest')
+    fetch_parser.add_argument('--store', default=os.environ.get('RULE_BUNDLE_STORE'), help='Defaults to $RULE_BUNDLE_STORE')
+    fetch_parser.add_argument('--cache-dir', default=os.environ.get('COMPLIANCE_RULE_BUNDLE_CACHE', DEFAULT_CACHE))
+    fetch_parser.add_argument('--dest', default=None, help='Copy the bundle there, otherwise its cached path is printed')
+
+    latest_parser = commands.add_parser('latest', help='Print the digest of the last published bundle')
+    latest_parser.add_argument('--store', default=os.environ.get('RULE_BUNDLE_STORE'), help='Defaults to $RULE_BUNDLE_STORE')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'publish':
+        print(publish(args.features_dir, open_store(args.store)))
+        return 0
+
+    if args.command == 'build':
+        data = encode(build(args.features_dir))
+        with open(args.dest, 'wb') as f:
+            f.write(data)
+        print(hashlib.sha256(data).hexdigest())
+        return 0
+
+    if args.command == 'latest':
+        digest = open_store(args.store).get_text(LATEST)
+        if digest is None:
+            print('No rule bundle published in {}'.format(args.store), file=sys.stderr)
+            return 1
+        print(digest.strip())
+        return 0
+
+    try:
+        path = fetch(args.digest, open_store(args.store) if args.store else None, args.cache_dir)
+    except RuleBundleError as error:
+        print(error, file=sys.stderr)
+        return 1
+    if args.dest:
+        shutil.copyfile(path, args.dest)
+        path = args.dest
+    print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
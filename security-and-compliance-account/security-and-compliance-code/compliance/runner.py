@@ -0,0 +1,182 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Single pass compliance runner.
+#
+# Evaluates the feature files against a terraform plan exactly once and
+# renders cucumber JSON, BDD XML and a summary from that one result set.
+# The process exit code is the exit code of the evaluation so the calling
+# scripts keep their success/failure handling. The resource inventory of the
+# plan (compliance/inventory.py) is written with the reports and published to
+# the inventory store when one is given.
+#
+# Two engines are available:
+#   native                 indexed in-process engine (compliance.engine), default
+#   terraform-compliance   the terraform-compliance CLI
+#
+# The native engine also takes a rule bundle (compliance/rule_bundle.py) in
+# place of the features directory.
+#
+# Usage:
+#   python3 -m compliance.runner -f ./src/ -p plan.out.json -o ./reports [--tags @security] [--jobs N]
+#                                [--workload $TF_APP_ID --inventory-store $INVENTORY_STORE]
+
+import argparse
+import os
+import subprocess
+import sys
+
+from compliance import incremental
+from compliance import inventory
+from compliance import rule_bundle
+from compliance import parallel
+from compliance import results
+from compliance.engine import Engine, exit_code, to_cucumber
+from compliance.plan import Plan
+from compliance.store import open_store
+
+CUCUMBER_JSON = 'test.json'
+BDD_XML = 'test.xml'
+SUMMARY_JSON = 'summary.json'
+
+NATIVE = 'native'
+TERRAFORM_COMPLIANCE = 'terraform-compliance'
+
+
+def run_terraform_compliance(features_dir, plan, cucumber_json, tags=None):
+    command = [
+        'terraform-compliance',
+        '-f', features_dir,
+        '-p', plan,
+        '--cucumber-json=' + cucumber_json
+    ]
+    if tags:
+        command += ['--tags', tags]
+    return subprocess.call(command)
+
+
+def plan_json(plan):
+    # The native engine reads the JSON form of the plan, convert binary plans once
+    if plan.endswith('.json'):
+        return plan
+    converted = plan + '.json'
+    with open(converted, 'w') as f:
+        subprocess.check_call(
+            ['terraform', 'show', '-json', os.path.basename(plan)],
+            cwd=os.path.dirname(os.path.abspath(plan)),
+            stdout=f
+        )
+    return converted
+
+
+def run_native(features_dir, plan, tags=None, verdict_store=None, jobs=1, on_plan=None):
+    return evaluate_native(rule_bundle.load_engine(features_dir, tags), plan, verdict_store, jobs, on_plan)
+
+
+def evaluate_native(engine, plan, verdict_store=None, jobs=1, on_plan=None):
+    # Very large plans are streamed, keeping only the attributes the selected scenarios read
+    plan = Plan.load(plan_json(plan), engine.referenced_attributes())
+    if on_plan:
+        on_plan(plan)
+    if not verdict_store:
+        feature_results = parallel.evaluate(engine, plan, jobs)
+        return to_cucumber(feature_results), exit_code(feature_results)
+
+    # Only resources that changed since the saved verdicts are evaluated again
+    store = open_store(verdict_store)
+    evaluator = incremental.IncrementalEvaluator(engine, incremental.load_state(store), jobs)
+    feature_results = evaluator.evaluate(plan)
+    incremental.save_state(store, evaluator.state)
+    print('Incremental evaluation: {changed_resources}/{resources} resources changed, '
+          '{incremental} scenarios incremental, {full} evaluated in full'.format(**evaluator.stats))
+    return to_cucumber(feature_results), exit_code(feature_results)
+
+
+def write_reports(features, reports_dir):
+    summary = results.summarize(features)
+    results.write_bdd_xml(features, os.path.join(reports_dir, BDD_XML), summary)
+    results.write_summary(summary, os.path.join(reports_dir, SUMMARY_JSON))
+    print(results.format_summary(summary))
+    return summary
+
+
+def inventory_emitter(reports_dir, workload=None, inventory_store=None):
+    inventory_store = open_store(inventory_store) if inventory_store else None
+
+    def emit_inventory(loaded_plan):
+        inventory.emit(loaded_plan, workload, os.path.join(reports_dir, inventory.INVENTORY_JSON), inventory_store)
+    return emit_inventory
+
+
+def run_engine(engine, plan, reports_dir, verdict_store=None, jobs=1, workload=None, inventory_store=None):
+    # Native run with rules already loaded into an Engine, see compliance/server.py
+    os.makedirs(reports_dir, exist_ok=True)
+    # The inventory comes from the plan the engine already loaded
+    emit_inventory = inventory_emitter(reports_dir, workload, inventory_store)
+    features, resp_code = evaluate_native(engine, plan, verdict_store, jobs, emit_inventory)
+    results.write_cucumber_json(features, os.path.join(reports_dir, CUCUMBER_JSON))
+    write_reports(features, reports_dir)
+    return resp_code
+
+
+def run(features_dir, plan, reports_dir, tags=None, engine=NATIVE, verdict_store=None, jobs=1, workload=None, inventory_store=None):
+    if engine == NATIVE:
+        return run_engine(rule_bundle.load_engine(features_dir, tags), plan, reports_dir, verdict_store, jobs, workload, inventory_store)
+
+    if not os.path.isdir(features_dir):
+        raise ValueError('terraform-compliance needs a features directory, not a rule bundle: ' + features_dir)
+    os.makedirs(reports_dir, exist_ok=True)
+    cucumber_json = os.path.join(reports_dir, CUCUMBER_JSON)
+    resp_code = run_terraform_compliance(features_dir, plan, cucumber_json, tags)
+
+    # terraform-compliance does not write a report when it cannot load the plan,
+    # its exit code is returned whether or not the inventory can be built
+    if os.path.exists(plan):
+        try:
+            inventory_emitter(reports_dir, workload, inventory_store)(Plan.load(plan_json(plan), ()))
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            print('Resource inventory not written: {}'.format(e))
+    if os.path.exists(cucumber_json):
+        write_reports(results.load_features(cucumber_json), reports_dir)
+    return resp_code
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run compliance checks once and write all report formats')
+    parser.add_argument('-f', '--features', required=True, help='Directory holding the .feature files, or a rule bundle')
+    parser.add_argument('-p', '--plan', required=True, help='Terraform plan file (plan.out or its JSON form)')
+    parser.add_argument('-o', '--reports-dir', required=True, help='Directory the reports are written to')
+    parser.add_argument('--tags', default=None, help='Only run features/scenarios matching the tag')
+    parser.add_argument('--engine', choices=[NATIVE, TERRAFORM_COMPLIANCE], default=os.environ.get('COMPLIANCE_ENGINE', NATIVE),
+                        help='Evaluation engine, defaults to $COMPLIANCE_ENGINE or native')
+    parser.add_argument('--verdict-store', default=None,
+                        help='Store (s3://bucket/prefix or directory) of the previous verdicts, enables incremental evaluation')
+    parser.add_argument('-j', '--jobs', type=int, default=int(os.environ.get('COMPLIANCE_JOBS', 0)),
+                        help='Worker processes for the native engine, defaults to $COMPLIANCE_JOBS or 0 for all cores')
+    parser.add_argument('--workload', default=os.environ.get('TF_APP_ID'), help='Workload name of the inventory, defaults to $TF_APP_ID')
+    parser.add_argument('--inventory-store', default=os.environ.get('INVENTORY_STORE'),
+                        help='Store (s3://bucket/prefix or directory) the resource inventory is published to, defaults to $INVENTORY_STORE')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    jobs = args.jobs or parallel.default_jobs()
+    return run(args.features, args.plan, args.reports_dir, args.tags, args.engine, args.verdict_store, jobs,
+               args.workload, args.inventory_store)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
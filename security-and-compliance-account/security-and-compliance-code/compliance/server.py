@@ -0,0 +1,449 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Compliance evaluation server.
+#
+# A long running process that loads the rules once (a features directory, a
+# rule bundle file or the latest bundle of a rule bundle store, see
+# compliance/rule_bundle.py) and evaluates plans sent to it over HTTP on a
+# unix socket or a localhost port. Every check gets the same reports as
+# compliance.runner, without the interpreter start, the imports and the
+# rule parsing.
+#
+# Plans are evaluated concurrently by a pool of worker processes forked
+# after the rules are loaded, so the workers share the parsed rules copy-on-
+# write. The rules are polled for changes. Changed rules are loaded into a
+# new pool that takes the following checks, while the old pool finishes the
+# checks it already started. Rules that fail to load leave the current rules
+# in place.
+#
+# API:
+#   GET  /health   rules fingerprint, number of features and workers
+#   POST /reload   reload the rules now when they changed
+#   POST /check    evaluate a plan. The plan JSON is the request body, or a
+#                  plan path on the server host is given as ?plan=. With
+#                  ?reports_dir= the reports are written there as by the
+#                  runner, otherwise the cucumber features are returned.
+#                  tags, verdict_store, workload and inventory_store are
+#                  passed as query parameters as well. With ?rules= (the
+#                  fingerprint of the rules, see compliance/impact.py) a
+#                  check is refused with 409 when the server holds other
+#                  rules.
+#
+# `check` is a client with the arguments of compliance.runner. It sends the
+# fingerprint of its -f rules and evaluates locally when the server can not
+# be reached or holds other rules, so a change to the rules is always
+# checked with the changed rules.
+#
+# Usage:
+#   python3 -m compliance.server serve -f ./src --socket /tmp/compliance.sock [--workers N] [--poll 5]
+#   python3 -m compliance.server serve --rule-bundle-store s3://bucket/rule-bundles --port 8787
+#   python3 -m compliance.server check --server unix:/tmp/compliance.sock -f ./src/ -p plan.out -o ./reports [--tags @security]
+#   curl --unix-socket /tmp/compliance.sock --data-binary @plan.out.json http://localhost/check
+
+import argparse
+import contextlib
+import gc
+import http.client
+import http.server
+import io
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from compliance import impact
+from compliance import parallel
+from compliance import rule_bundle
+from compliance import runner
+from compliance.engine import Engine
+from compliance.store import open_store
+
+DEFAULT_PORT = 8787
+POLL_SECONDS = 5
+CHECK_PARAMETERS = ('plan', 'reports_dir', 'tags', 'verdict_store', 'workload', 'inventory_store', 'rules')
+
+# Rules of the pool being forked, inherited by its workers
+_FEATURES = None
+_ENGINES = {}
+
+
+class ServerError(Exception):
+    pass
+
+
+class RulesMismatch(ServerError):
+    pass
+
+
+def rules_fingerprint(features):
+    return impact.fingerprint(impact.snapshot(features))
+
+
+def _engine(tags):
+    # One Engine per tag selection, built in the worker from the inherited rules
+    engine = _ENGINES.get(tags)
+    if engine is None:
+        engine = _ENGINES[tags] = Engine(_FEATURES, tags)
+    return engine
+
+
+def _check(request):
+    # Runs in a pool worker, the runner output is sent back with the result
+    output = io.StringIO()
+    features = None
+    with contextlib.redirect_stdout(output):
+        engine = _engine(request.get('tags'))
+        if request.get('reports_dir'):
+            resp_code = runner.run_engine(engine, request['plan'], request['reports_dir'], request.get('verdict_store'), 1,
+                                          request.get('workload'), request.get('inventory_store'))
+        else:
+            features, resp_code = runner.evaluate_native(engine, request['plan'], request.get('verdict_store'))
+    return {'exit_code': resp_code, 'output': output.getvalue(), 'features': features}
+
+
+class RuleSource:
+
+    def __init__(self, path=None, bundle_store=None, cache_dir=rule_bundle.DEFAULT_CACHE):
+        self.path = path
+        self.store = open_store(bundle_store) if bundle_store else None
+        self.cache_dir = cache_dir
+
+    def version(self):
+        # Changes whenever the rules change
+        if self.store:
+            digest = self.store.get_text(rule_bundle.LATEST)
+            if not digest:
+                raise ServerError('No rule bundle published in {}'.format(self.store))
+            return digest.strip()
+        if os.path.isdir(self.path):
+            stats = []
+            for name in sorted(os.listdir(self.path)):
+                if name.endswith('.feature'):
+                    stat = os.stat(os.path.join(self.path, name))
+                    stats.append((name, stat.st_size, stat.st_mtime_ns))
+            return tuple(stats)
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def load(self, version):
+        if self.store:
+            return rule_bundle.load_rules(rule_bundle.fetch(version, self.store, self.cache_dir))
+        return rule_bundle.load_rules(self.path)
+
+
+class Evaluator:
+
+    def __init__(self, source, workers):
+        self.source = source
+        self.workers = workers
+        self.pool = None
+        self.version = None
+        # Rules that failed to load are not tried again until they change
+        self.failed_version = None
+        self.status = {}
+        # Held while submitting, so no check goes to a pool that is being retired
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+
+    def reload(self):
+        # Returns whether new rules were loaded
+        global _FEATURES, _ENGINES
+        with self.reload_lock:
+            version = self.source.version()
+            if version in (self.version, self.failed_version):
+                return False
+            try:
+                features = self.source.load(version)
+            except Exception:
+                self.failed_version = version
+                raise
+            with self.lock:
+                _FEATURES, _ENGINES = features, {}
+                # Keep the rules out of the collector so the workers do not copy their pages
+                gc.unfreeze()
+                gc.collect()
+                gc.freeze()
+                pool = multiprocessing.get_context('fork').Pool(self.workers)
+                retired, self.pool = self.pool, pool
+                self.version = version
+                self.status = {
+                    'rules': rules_fingerprint(features),
+                    'features': len(features),
+                    'workers': self.workers,
+                    'loaded': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+                }
+            if retired:
+                retired.close()
+                threading.Thread(target=retired.join, daemon=True).start()
+            log('Rules {} loaded, {} features'.format(self.status['rules'][:12], len(features)))
+            return True
+
+    def watch(self, poll):
+        while True:
+            time.sleep(poll)
+            try:
+                self.reload()
+            except Exception as error:
+                log('Rules not reloaded: {}'.format(error))
+
+    def check(self, request):
+        rules = request.pop('rules', None)
+        with self.lock:
+            if rules and rules != self.status['rules']:
+                raise RulesMismatch('rules {} requested, the server holds rules {}'.format(rules[:12], self.status['rules'][:12]))
+            result = self.pool.apply_async(_check, (request,))
+        return result.get()
+
+    def close(self):
+        with self.lock:
+            if self.pool:
+                self.pool.terminate()
+
+
+def log(message):
+    print('{} {}'.format(time.strftime('%Y-%m-%d %H:%M:%S'), message), file=sys.stderr, flush=True)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    server_version = 'compliance-server'
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _spool_body(self, length):
+        # The plan is written to a file so the worker can stream it like a plan on disk
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'wb') as f:
+            while length > 0:
+                chunk = self.rfile.read(min(length, 1 << 20))
+                if not chunk:
+                    break
+                f.write(chunk)
+                length -= len(chunk)
+        return path
+
+    def do_GET(self):
+        if urllib.parse.urlparse(self.path).path != '/health':
+            self._reply(404, {'error': 'not found'})
+            return
+        self._reply(200, dict(self.server.evaluator.status, status='ok'))
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        if url.path == '/reload':
+            self.rfile.read(length)
+            try:
+                reloaded = self.server.evaluator.reload()
+            except Exception as error:
+                self._reply(500, {'error': str(error)})
+                return
+            self._reply(200, dict(self.server.evaluator.status, reloaded=reloaded))
+            return
+        if url.path != '/check':
+            self.rfile.read(length)
+            self._reply(404, {'error': 'not found'})
+            return
+
+        request = dict((key, value) for key, value in urllib.parse.parse_qsl(url.query) if key in CHECK_PARAMETERS)
+        spooled = self._spool_body(length) if length else None
+        if spooled:
+            request['plan'] = spooled
+        try:
+            if 'plan' not in request:
+                self._reply(400, {'error': 'no plan: send the plan JSON as the body or its path as ?plan='})
+                return
+            result = self.server.evaluator.check(request)
+        except RulesMismatch as error:
+            self._reply(409, {'error': str(error), 'rules': self.server.evaluator.status['rules']})
+            return
+        except Exception as error:
+            self._reply(500, {'error': '{}: {}'.format(type(error).__name__, error)})
+            return
+        finally:
+            if spooled:
+                os.remove(spooled)
+        self._reply(200, result)
+
+    def log_message(self, format, *args):
+        # client_address is empty on a unix socket
+        log(format % args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def connection(server, timeout=None):
+    # server is unix:<socket path> or [http://]host:port
+    if server.startswith('unix:'):
+        return UnixHTTPConnection(server[len('unix:'):], timeout)
+    url = urllib.parse.urlparse(server if '://' in server else 'http://' + server)
+    return http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT, timeout=timeout)
+
+
+def call(server, method, path, query=None, body=None, timeout=None):
+    client = connection(server, timeout)
+    try:
+        client.request(method, path + ('?' + urllib.parse.urlencode(query) if query else ''), body)
+        response = client.getresponse()
+        result = json.loads(response.read().decode('utf-8'))
+    finally:
+        client.close()
+    if response.status == 409:
+        raise RulesMismatch(result.get('error'))
+    if response.status != 200:
+        raise ServerError(result.get('error'))
+    return result
+
+
+def serve(source, workers, socket_path=None, host='127.0.0.1', port=DEFAULT_PORT, poll=POLL_SECONDS):
+    evaluator = Evaluator(source, workers)
+    evaluator.reload()
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, Handler)
+        log('Listening on unix:{}'.format(socket_path))
+    else:
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        log('Listening on {}:{}'.format(host, server.server_address[1]))
+    server.evaluator = evaluator
+    if poll > 0:
+        threading.Thread(target=evaluator.watch, args=(poll,), daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        evaluator.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+    return 0
+
+
+def check(server, features_dir, plan, reports_dir, tags=None, verdict_store=None, workload=None, inventory_store=None, jobs=1):
+    query = {
+        'plan': os.path.abspath(plan),
+        'reports_dir': os.path.abspath(reports_dir),
+        'tags': tags,
+        'verdict_store': verdict_store,
+        'workload': workload,
+        'inventory_store': inventory_store,
+        # The server only evaluates with the rules given here
+        'rules': rules_fingerprint(rule_bundle.load_rules(features_dir))
+    }
+    try:
+        result = call(server, 'POST', '/check', dict((key, value) for key, value in query.items() if value))
+    except (OSError, http.client.HTTPException, RulesMismatch) as error:
+        print('Compliance server {} unavailable ({}), evaluating locally'.format(server, error), file=sys.stderr)
+        return runner.run(features_dir, plan, reports_dir, tags, runner.NATIVE, verdict_store, jobs, workload, inventory_store)
+    except ServerError as error:
+        print('Compliance check failed on {}: {}'.format(server, error), file=sys.stderr)
+        return 1
+    sys.stdout.write(result['output'])
+    return result['exit_code']
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compliance evaluation server')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    serve_parser = commands.add_parser('serve', help='Run the server')
+    serve_parser.add_argument('-f', '--features', default=None, help='Directory holding the .feature files, or a rule bundle')
+    serve_parser.add_argument('--rule-bundle-store', default=None, help='Follow the latest bundle published to this rule bundle store')
+    serve_parser.add_argument('--cache-dir', default=os.environ.get('COMPLIANCE_RULE_BUNDLE_CACHE', rule_bundle.DEFAULT_CACHE))
+    serve_parser.add_argument('--socket', default=None, help='Unix socket to listen on, otherwise --host and --port')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--workers', type=int, default=parallel.default_jobs(), help='Plans evaluated at the same time')
+    serve_parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='Seconds between checks for changed rules, 0 disables reloading')
+
+    check_parser = commands.add_parser('check', help='Evaluate a plan on the server, same arguments as compliance.runner')
+    check_parser.add_argument('--server', default=os.environ.get('COMPLIANCE_SERVER'), help='unix:<socket> or host:port, defaults to $COMPLIANCE_SERVER')
+    check_parser.add_argument('-f', '--features', required=True, help='Rules used when the server can not be reached')
+    check_parser.add_argument('-p', '--plan', required=True)
+    check_parser.add_argument('-o', '--reports-dir', required=True)
+    check_parser.add_argument('--tags', default=None)
+    check_parser.add_argument('--verdict-store', default=None)
+    check_parser.add_argument('-j', '--jobs', type=int, default=int(os.environ.get('COMPLIANCE_JOBS', 0)),
+                              help='Processes used when evaluating locally')
+    check_parser.add_argument('--workload', default=os.environ.get('TF_APP_ID'))
+    check_parser.add_argument('--inventory-store', default=os.environ.get('INVENTORY_STORE'))
+
+    for name, help_text in (('health', 'Print the status of the server'), ('reload', 'Reload changed rules now')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--server', default=os.environ.get('COMPLIANCE_SERVER'), help='unix:<socket> or host:port, defaults to $COMPLIANCE_SERVER')
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve' and bool(args.features) == bool(args.rule_bundle_store):
+        parser.error('serve needs one of -f/--features and --rule-bundle-store')
+    if args.command != 'serve' and not args.server:
+        parser.error('--server or $COMPLIANCE_SERVER is required')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'serve':
+        source = RuleSource(args.features, args.rule_bundle_store, args.cache_dir)
+        return serve(source, args.workers, args.socket, args.host, args.port, args.poll)
+
+    if args.command == 'check':
+        return check(args.server, args.features, args.plan, args.reports_dir, args.tags, args.verdict_store,
+                     args.workload, args.inventory_store, args.jobs or parallel.default_jobs())
+
+    try:
+        result = call(args.server, 'GET' if args.command == 'health' else 'POST', '/' + args.command)
+    except (OSError, http.client.HTTPException, ServerError) as error:
+        print('Compliance server {}: {}'.format(args.server, error), file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
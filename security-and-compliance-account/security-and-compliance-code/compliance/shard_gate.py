@@ -0,0 +1,85 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Fan-in of sibling pipelines.
+#
+# When the workloads are sharded over several pipelines (see SHARDING in the
+# pipeline stack parameters), every pipeline checks its own workloads for the
+# same commit of the compliance code, and the code may only be merged once all
+# of them passed. Each pipeline records its pass in the store under
+# <commit>/<shard id> when it reaches its merge stage. Pipelines finishing
+# together can all see the complete set, so every one of them that does tries
+# to create <commit>/merge, and only the one that creates it merges. The
+# owner of the claim keeps it, so a retry of its merge stage merges again.
+#
+#   python3 -m compliance.shard_gate record --commit <commit id> --shard 0 --count 3
+#
+# prints "complete" when this shard merges, "claimed" when another shard does
+# and "pending" while shards are missing. A failing pipeline never records its
+# pass, so the commit is not merged until it is fixed and all shards pass again.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from compliance.store import open_store
+
+
+MERGE_CLAIM = 'merge'
+
+COMPLETE = 'complete'
+CLAIMED = 'claimed'
+PENDING = 'pending'
+
+
+def record(store, commit, shard, count):
+    # Records the pass of shard for commit, returns whether this shard merges it
+    store.put_text('{}/{}'.format(commit, shard), json.dumps({'shard': shard, 'time': int(time.time())}))
+    passed = set(store.list(commit))
+    if not all(str(index) in passed for index in range(count)):
+        return PENDING
+    claim = '{}/{}'.format(commit, MERGE_CLAIM)
+    if store.create_text(claim, json.dumps({'shard': shard, 'time': int(time.time())})):
+        return COMPLETE
+    return COMPLETE if json.loads(store.get_text(claim))['shard'] == shard else CLAIMED
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Fan-in of the compliance checks of sibling pipelines')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    record_parser = subparsers.add_parser('record', help='Record the pass of a shard and report whether all shards passed')
+    record_parser.add_argument('--store', default=os.environ.get('SHARD_GATE_STORE'),
+                               help='Store (s3://bucket/prefix or directory) of the passes, defaults to $SHARD_GATE_STORE')
+    record_parser.add_argument('--commit', default=os.environ.get('CODEBUILD_RESOLVED_SOURCE_VERSION'),
+                               help='Commit of the compliance code, defaults to $CODEBUILD_RESOLVED_SOURCE_VERSION')
+    record_parser.add_argument('--shard', type=int, default=os.environ.get('SHARD_ID'), help='Shard id, defaults to $SHARD_ID')
+    record_parser.add_argument('--count', type=int, default=os.environ.get('SHARD_COUNT'), help='Number of shards, defaults to $SHARD_COUNT')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if None in (args.store, args.commit, args.shard, args.count):
+        print('--store, --commit, --shard and --count are required', file=sys.stderr)
+        return 2
+    print(record(open_store(args.store), args.commit, args.shard, args.count))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
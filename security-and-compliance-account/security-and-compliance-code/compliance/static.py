@@ -0,0 +1,586 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Static evaluation of the compliance rules against the terraform sources.
+#
+# Reads the .tf files of a workload (compliance/hcl.py) without terraform
+# init or plan and builds a Plan from the resource blocks: nested blocks
+# become lists of objects as in the plan JSON, literal values, variables,
+# locals and pure functions are resolved, count/for_each are expanded and
+# local modules (or the ones `terraform init` downloaded) are followed.
+# Values that only a plan knows (attributes of other resources, data
+# sources, module outputs) stay unresolved.
+#
+# Every scenario is decided from the configuration when it can be:
+#   - a resource failing a step on resolved values fails the scenario
+#   - the scenario passes (or is skipped) when all the resources its steps
+#     select are known and every attribute they read is resolved
+# Everything else is reported as needing a plan, with the reason. Providers
+# give attributes the configuration leaves out a default, so an attribute
+# that is not written is only decided when a provider schema
+# (`terraform providers schema -json`) is given: blocks left out are then
+# empty and resources support tags when their schema has them. Without a
+# schema a resource without tags may support them; the scenarios on
+# resources that support tags are only decided when it would not matter.
+#
+# Decided scenarios carry the verdict a plan would give. The reports are
+# those of compliance.runner and static.json lists the scenarios that need a
+# plan. The exit code is 1 when a decided scenario fails, so the check can
+# run before terraform in a pre-commit hook or as the first pipeline step.
+#
+# Usage:
+#   python3 -m compliance.static -f ./src/ -d ./workload/src -o ./reports/static [--var region=us-east-1]
+#                                [--var-file prod.tfvars] [--workspace prod] [--schema schema.json] [--tags @security]
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+
+from compliance import hcl
+from compliance import results
+from compliance import rule_bundle
+from compliance import runner
+from compliance import steps
+from compliance.engine import FAILONSKIP, FeatureResult, ScenarioResult, StepResult, exit_code, to_cucumber
+from compliance.plan import Plan, PlanSubset, Resource, base_address
+
+STATIC_JSON = 'static.json'
+NEEDS_PLAN = 'Needs a plan: '
+AUTO_VARIABLE_FILES = ('terraform.tfvars', 'terraform.tfvars.json', '*.auto.tfvars', '*.auto.tfvars.json')
+MODULES_MANIFEST = os.path.join('.terraform', 'modules', 'modules.json')
+# Arguments and blocks of a resource that terraform does not hand to the provider
+META_ARGUMENTS = ('count', 'for_each', 'depends_on', 'provider')
+META_BLOCKS = ('lifecycle', 'provisioner', 'connection')
+MODULE_ARGUMENTS = ('source', 'version', 'count', 'for_each', 'depends_on', 'providers')
+
+_MISSING = object()
+
+
+class ModuleConfig:
+    # The blocks of one module directory the static evaluation uses
+
+    def __init__(self, directory):
+        self.directory = directory
+        # name -> default expression, None when the variable has no default
+        self.variables = {}
+        self.locals = {}
+        self.resources = []
+        self.modules = []
+        self.errors = []
+
+
+def load_module(directory):
+    config = ModuleConfig(directory)
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.tf'):
+            continue
+        path = os.path.join(directory, name)
+        if name == 'override.tf' or name.endswith('_override.tf'):
+            config.errors.append('{} overrides other files, it is merged by terraform'.format(path))
+            continue
+        try:
+            body = hcl.parse_file(path)
+        except (hcl.HclError, UnicodeDecodeError) as error:
+            config.errors.append(str(error))
+            continue
+        for block in body.blocks:
+            if block.type == 'variable' and len(block.labels) == 1:
+                default = block.body.attributes.get('default')
+                config.variables[block.labels[0]] = default.expression if default else None
+            elif block.type == 'locals':
+                config.locals.update((local, attribute.expression) for local, attribute in block.body.attributes.items())
+            elif block.type == 'resource' and len(block.labels) == 2:
+                config.resources.append(block)
+            elif block.type == 'module' and len(block.labels) == 1:
+                config.modules.append(block)
+    return config
+
+
+###########################################################################
+# Variables
+###########################################################################
+def variable_value(text):
+    # -var values are strings, lists and maps are written in HCL
+    if text.lstrip()[:1] in ('[', '{'):
+        return hcl.evaluate(hcl.parse_expression(text), hcl.Scope())
+    return text
+
+
+def read_variable_file(path):
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            return json.load(f)
+    body = hcl.parse_file(path)
+    return dict((name, hcl.evaluate(attribute.expression, hcl.Scope())) for name, attribute in body.attributes.items())
+
+
+def root_variables(src_dir, var_files=(), variables=()):
+    # Values in terraform's order of precedence: TF_VAR_ environment variables, terraform.tfvars,
+    # *.auto.tfvars, then the -var-file and -var options
+    values = dict((name[len('TF_VAR_'):], value) for name, value in os.environ.items() if name.startswith('TF_VAR_'))
+    names = sorted(os.listdir(src_dir))
+    for pattern in AUTO_VARIABLE_FILES:
+        for name in names:
+            if fnmatch.fnmatch(name, pattern):
+                values.update(read_variable_file(os.path.join(src_dir, name)))
+    for path in var_files:
+        values.update(read_variable_file(path))
+    for assignment in variables:
+        name, _, value = assignment.partition('=')
+        values[name] = variable_value(value)
+    return values
+
+
+def module_manifest(root):
+    # Module key ("a.b") -> directory of the modules `terraform init` downloaded
+    path = os.path.join(root, MODULES_MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        modules = json.load(f).get('Modules', [])
+    return dict((module['Key'], os.path.join(root, module['Dir'])) for module in modules if module.get('Key'))
+
+
+###########################################################################
+# Provider schema
+###########################################################################
+def load_schema(path):
+    # Resource type -> block schema, from `terraform providers schema -json`
+    with open(path, 'r') as f:
+        data = json.load(f)
+    schemas = {}
+    for provider in data.get('provider_schemas', {}).values():
+        for resource_type, schema in provider.get('resource_schemas', {}).items():
+            schemas.setdefault(resource_type, schema.get('block', {}))
+    return schemas
+
+
+def apply_schema(values, block):
+    # Completes the values the way the plan shows them: blocks left out are empty, attributes left out
+    # get a value from the provider (a default or a computed one) and stay unresolved
+    for name, attribute in block.get('attributes', {}).items():
+        if name not in values:
+            values[name] = hcl.Unresolved('{} is not set, its value comes from the provider'.format(name),
+                                          isinstance(attribute.get('type'), str))
+    for name, nested in block.get('block_types', {}).items():
+        single = nested.get('nesting_mode') in ('single', 'group')
+        elements = values.get(name, [])
+        if not isinstance(elements, list):
+            continue
+        for element in elements:
+            if isinstance(element, dict):
+                apply_schema(element, nested.get('block', {}))
+        values[name] = (elements[0] if elements else None) if single else elements
+
+
+###########################################################################
+# Configuration to plan
+###########################################################################
+def _index_suffix(index):
+    if index is None:
+        return ''
+    return '[{}]'.format(json.dumps(index))
+
+
+def _instances(body, scope):
+    # [(index, scope)] of a resource or module block, or (None, reason) when count/for_each are not known
+    if 'count' in body.attributes:
+        count = hcl.evaluate(body.attributes['count'].expression, scope)
+        number = count if isinstance(count, int) and not isinstance(count, bool) else None
+        if isinstance(count, str) and count.isdigit():
+            number = int(count)
+        if number is None:
+            return None, 'count {}'.format(count.reason if isinstance(count, hcl.Unresolved) else 'is not a number')
+        return [(index, scope.child(count={'index': index})) for index in range(number)], None
+    if 'for_each' in body.attributes:
+        for_each = hcl.evaluate(body.attributes['for_each'].expression, scope)
+        if isinstance(for_each, dict):
+            items = sorted(for_each.items())
+        elif isinstance(for_each, list) and all(isinstance(key, str) for key in for_each):
+            items = [(key, key) for key in sorted(set(for_each))]
+        else:
+            return None, 'for_each {}'.format(for_each.reason if isinstance(for_each, hcl.Unresolved) else 'is not known')
+        return [(key, scope.child(each={'key': key, 'value': value})) for key, value in items], None
+    return [(None, scope)], None
+
+
+def _dynamic(block, scope):
+    # Blocks generated by a dynamic block, Unresolved when its for_each is not known
+    for_each = hcl.evaluate(block.body.attributes['for_each'].expression, scope) if 'for_each' in block.body.attributes else None
+    if isinstance(for_each, dict):
+        items = sorted(for_each.items())
+    elif isinstance(for_each, list):
+        items = list(enumerate(for_each))
+    else:
+        return hcl.Unresolved('dynamic {} {}'.format(block.labels[0], for_each.reason if isinstance(for_each, hcl.Unresolved)
+                                                      else 'has no for_each'))
+    iterator = block.labels[0]
+    if 'iterator' in block.body.attributes:
+        iterator = block.body.attributes['iterator'].expression[1]
+    generated = []
+    for content in block.body.blocks_of('content'):
+        for key, value in items:
+            generated.append(body_values(content.body, scope.child(**{iterator: {'key': key, 'value': value}})))
+    return generated
+
+
+def body_values(body, scope):
+    values = {}
+    for name, attribute in body.attributes.items():
+        if name not in META_ARGUMENTS:
+            values[name] = hcl.evaluate(attribute.expression, scope)
+    for block in body.blocks:
+        if block.type in META_BLOCKS:
+            continue
+        if block.type == 'dynamic' and block.labels:
+            generated = _dynamic(block, scope)
+            existing = values.get(block.labels[0], [])
+            values[block.labels[0]] = generated if isinstance(generated, hcl.Unresolved) or isinstance(existing, hcl.Unresolved) \
+                else existing + generated
+            continue
+        existing = values.setdefault(block.type, [])
+        if isinstance(existing, list):
+            existing.append(body_values(block.body, scope))
+    return values
+
+
+def sorted_values(value):
+    # The plan JSON has the keys of every object in sorted order, which decides what find_key finds first
+    if isinstance(value, dict):
+        return dict((key, sorted_values(value[key])) for key in sorted(value))
+    if isinstance(value, list):
+        return [sorted_values(element) for element in value]
+    return value
+
+
+def configuration_references(body):
+    # "type.name" of the resources the arguments of a resource refer to, as the plan configuration lists them
+    found = set()
+    for name, attribute in body.attributes.items():
+        if name in META_ARGUMENTS:
+            continue
+        for root, names in hcl.references(attribute.expression):
+            reference = hcl.resource_reference(root, names)
+            if reference:
+                found.add(reference)
+    for block in body.blocks:
+        if block.type not in META_BLOCKS:
+            found |= configuration_references(block.body)
+    return found
+
+
+class StaticPlan(Plan):
+    # Plan built from the configuration, with what it does not know
+
+    def __init__(self):
+        super().__init__()
+        # Resource type -> block schema of the provider
+        self.schemas = {}
+        # Resources without tags whose type may support them (no schema)
+        self.maybe_taggable = set()
+        # Base address -> (type, reason) of the resources whose instances are not known
+        self.pending = {}
+        # Reasons the configuration may hold resources of any type
+        self.incomplete = []
+
+    @classmethod
+    def load(cls, src_dir, variables=None, workspace='default', schemas=None):
+        plan = cls()
+        plan.schemas = schemas or {}
+        root = os.path.abspath(src_dir)
+        plan._add_module(load_module(root), variables or {}, '', '', root, workspace, module_manifest(root))
+        return plan
+
+    def _add_module(self, config, values, prefix, key, root, workspace, manifest):
+        self.incomplete += ['could not read ' + error for error in config.errors]
+        variables = {}
+        for name, default in config.variables.items():
+            if name in values:
+                variables[name] = values[name]
+            elif default is not None:
+                variables[name] = hcl.evaluate(default, hcl.Scope(cwd=root))
+        scope = hcl.Scope(variables, config.locals, os.path.relpath(config.directory, root), workspace, root)
+        module = prefix[:-1]
+
+        for block in config.resources:
+            resource_type, name = block.labels
+            base = base_address(prefix) + resource_type + '.' + name
+            self.references[base] = configuration_references(block.body)
+            instances, reason = _instances(block.body, scope)
+            if instances is None:
+                self.pending[base] = (resource_type, '{} {}'.format(base, reason))
+                continue
+            for index, instance_scope in instances:
+                address = prefix + resource_type + '.' + name + _index_suffix(index)
+                resource_values = body_values(block.body, instance_scope)
+                if resource_type in self.schemas:
+                    apply_schema(resource_values, self.schemas[resource_type])
+                elif 'tags' not in resource_values:
+                    resource_values['tags'] = None
+                    self.maybe_taggable.add(address)
+                self.add(Resource(address, 'managed', resource_type, name, index, module, sorted_values(resource_values)))
+
+        for block in config.modules:
+            name = block.labels[0]
+            module_key = key + '.' + name if key else name
+            source = hcl.evaluate(block.body.attributes['source'].expression, scope) if 'source' in block.body.attributes else None
+            if isinstance(source, str) and (source.startswith('./') or source.startswith('../')):
+                directory = os.path.normpath(os.path.join(config.directory, source))
+            else:
+                directory = manifest.get(module_key)
+            if not directory or not os.path.isdir(directory):
+                self.incomplete.append('module.{} ({}) is not downloaded'.format(module_key, source))
+                continue
+            instances, reason = _instances(block.body, scope)
+            if instances is None:
+                self.incomplete.append('module.{} {}'.format(module_key, reason))
+                continue
+            child = load_module(directory)
+            for index, instance_scope in instances:
+                arguments = dict((argument, hcl.evaluate(attribute.expression, instance_scope))
+                                 for argument, attribute in block.body.attributes.items() if argument not in MODULE_ARGUMENTS)
+                self._add_module(child, arguments, '{}module.{}{}.'.format(prefix, name, _index_suffix(index)), module_key,
+                                 root, workspace, manifest)
+
+    def pending_reason(self, name):
+        # Why resources selected by `I have <name> defined` may be missing, None when all are known
+        if self.incomplete:
+            return self.incomplete[0]
+        for resource_type, reason in self.pending.values():
+            if name in steps.TAGGABLE or resource_type == name:
+                return reason
+        return None
+
+    def unsettled(self, resource, keys):
+        # Why one of the keys on the resource needs a plan, None when the configuration decides it.
+        # keys maps each key to whether its value is read, or only whether it is there, in the order the
+        # steps read them: the first key the configuration does not settle is the one the decision waits on
+        for key in keys:
+            if key == 'tags' and resource.address in self.maybe_taggable:
+                return '{} has no tags, {} may support them'.format(resource.address, resource.type)
+            found, reason = find(resource.values, key)
+            if not reason and found is not _MISSING:
+                reason = hcl.unresolved_reason(found) if keys[key] else getattr(found, 'reason', None)
+            if reason:
+                return '{} {}: {}'.format(resource.address, key, reason)
+            if key not in resource.values and key[:1].islower() and resource.type not in self.schemas:
+                return '{} does not set {}, its value comes from the provider'.format(resource.address, key)
+        return None
+
+
+def find(value, key):
+    # steps.find_key over values holding unresolved parts, returns (found value, why it can not be looked up)
+    if isinstance(value, hcl.Unresolved):
+        return _MISSING, None if value.scalar else value.reason
+    if isinstance(value, dict):
+        if key in value:
+            return value[key], None
+        children = value.values()
+    elif isinstance(value, list):
+        for element in value:
+            if isinstance(element, dict) and isinstance(element.get('key'), hcl.Unresolved):
+                return _MISSING, element['key'].reason
+            if isinstance(element, dict) and element.get('key') == key and 'value' in element:
+                return element['value'], None
+        children = value
+    else:
+        return _MISSING, None
+    for child in children:
+        found, reason = find(child, key)
+        if reason or found is not _MISSING:
+            return found, reason
+    return _MISSING, None
+
+
+###########################################################################
+# Scenarios
+###########################################################################
+# Steps that only test whether a value is there, the others read the value they find
+PRESENCE_STEPS = (steps.it_has_something, steps.it_must_contain_something, steps.it_must_not_contain_something)
+
+
+def scenario_targets(scenario, library):
+    # [(given, keys, [(related type, keys)...])] in step order: the attributes read on the resources a Given
+    # selects and on the resources they refer to, each mapped to whether its value is read or only its presence.
+    # None when a step does not declare the attributes it reads
+    _, related = steps.scenario_resource_types(scenario)
+    targets = []
+    keys = None
+    last = None
+    for step in scenario.steps:
+        match = library.match(step.text)
+        if match is None:
+            continue
+        function, arguments = match
+        if function not in library.attributes:
+            return None
+        read = library.attributes[function](*arguments)
+        if function is steps.i_have_resource_defined:
+            targets.append((arguments[0], dict.fromkeys(read, True), []))
+            keys = targets[-1][1]
+            last = None
+        elif function is steps.it_must_contain_something and arguments[0] in related and targets:
+            targets[-1][2].append((arguments[0], {}))
+            keys = targets[-1][2][-1][1]
+            last = None
+        elif keys is None:
+            continue
+        elif not read:
+            # Value steps read the value the previous step found
+            if last is not None:
+                keys[last] = True
+        else:
+            for key in read:
+                keys[key] = keys.get(key, False) or function not in PRESENCE_STEPS
+            last = read[-1]
+    return targets
+
+
+def _settle(plan, resource, keys, chain):
+    reason = plan.unsettled(resource, keys)
+    if reason or not chain:
+        return reason
+    related_type, related_keys = chain[0]
+    prefix = base_address(resource.module) + '.' if resource.module else ''
+    for reference in plan.references.get(resource.base_address, ()):
+        if reference.split('.', 1)[0] == related_type and prefix + reference in plan.pending:
+            return '{} refers to {}'.format(resource.address, plan.pending[prefix + reference][1])
+    for referenced in plan.referenced(resource, related_type):
+        reason = _settle(plan, referenced, related_keys, chain[1:])
+        if reason:
+            return reason
+    return None
+
+
+def decide(engine, plan, scenario):
+    # (ScenarioResult, None) when the configuration decides the scenario, (None, reason) when it needs a plan
+    targets = scenario_targets(scenario, engine.library)
+    if targets is None:
+        return None, 'a step does not declare the attributes it reads'
+    certain, maybe, reasons = set(), set(), []
+    for given, keys, chain in targets:
+        taggable = given in steps.TAGGABLE
+        reason = plan.pending_reason(given)
+        if reason:
+            reasons.append(reason)
+        for resource in plan.supporting_tags() if taggable else plan.of_type(given):
+            assumed = taggable and resource.address in plan.maybe_taggable
+            reason = _settle(plan, resource, dict((key, keys[key]) for key in keys if key != 'tags') if assumed else keys, chain)
+            if reason:
+                reasons.append(reason)
+            elif assumed:
+                maybe.add(resource.address)
+            else:
+                certain.add(resource.address)
+
+    # Failures of resources whose values are known are failures in the plan as well
+    result = engine.evaluate_scenario(PlanSubset(plan, certain), scenario)
+    if result.failures:
+        return result, None
+    if reasons:
+        return None, reasons[0]
+    if maybe:
+        # Resources without tags only change the verdict when they fail once taken as supporting tags
+        assumed = engine.evaluate_scenario(PlanSubset(plan, certain | maybe), scenario)
+        if assumed.failures:
+            address = sorted(assumed.failures)[0]
+            return None, '{} has no tags, {} may support them'.format(address, plan.get(address).type)
+        if not certain:
+            if FAILONSKIP in scenario.all_tags:
+                return None, 'the resources that support tags are only known from a plan'
+            return assumed, None
+    return result, None
+
+
+def needs_plan(scenario, reason):
+    step_results = [StepResult(step, results.SKIPPED) for step in scenario.steps]
+    if step_results:
+        step_results[0].message = NEEDS_PLAN + reason
+    return ScenarioResult(scenario, step_results, {}, set())
+
+
+def evaluate(engine, plan):
+    # Feature results of the selected scenarios and the (feature, scenario, reason) of those that need a plan
+    feature_results = []
+    undecided = []
+    for feature, scenarios in engine.selected:
+        scenario_results = []
+        for scenario in scenarios:
+            result, reason = decide(engine, plan, scenario)
+            if result is None:
+                result = needs_plan(scenario, reason)
+                undecided.append((feature, scenario, reason))
+            scenario_results.append(result)
+        feature_results.append(FeatureResult(feature, scenario_results))
+    return feature_results, undecided
+
+
+def write_static_summary(feature_results, undecided, path):
+    total = sum(len(feature_result.scenarios) for feature_result in feature_results)
+    with open(path, 'w') as f:
+        json.dump({
+            'scenarios': total,
+            'decided': total - len(undecided),
+            'needs_plan': [
+                {'feature': feature.name, 'scenario': scenario.name, 'line': scenario.line, 'reason': reason}
+                for feature, scenario, reason in undecided
+            ]
+        }, f, indent=2)
+
+
+def run(features_dir, src_dir, reports_dir, tags=None, variables=(), var_files=(), workspace='default', schema=None):
+    start = time.perf_counter()
+    engine = rule_bundle.load_engine(features_dir, tags)
+    plan = StaticPlan.load(src_dir, root_variables(src_dir, var_files, variables), workspace,
+                           load_schema(schema) if schema else None)
+    feature_results, undecided = evaluate(engine, plan)
+
+    os.makedirs(reports_dir, exist_ok=True)
+    features = to_cucumber(feature_results)
+    results.write_cucumber_json(features, os.path.join(reports_dir, runner.CUCUMBER_JSON))
+    runner.write_reports(features, reports_dir)
+    write_static_summary(feature_results, undecided, os.path.join(reports_dir, STATIC_JSON))
+    total = sum(len(feature_result.scenarios) for feature_result in feature_results)
+    print('Static evaluation: {} of {} scenarios decided from the configuration in {:.2f}s, {} need a plan'.format(
+        total - len(undecided), total, time.perf_counter() - start, len(undecided)))
+    for _, scenario, reason in undecided:
+        print('  {}: {}'.format(scenario.name, reason))
+    return exit_code(feature_results)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Decide the compliance scenarios from the terraform sources, without a plan')
+    parser.add_argument('-f', '--features', required=True, help='Directory holding the .feature files, or a rule bundle')
+    parser.add_argument('-d', '--src-dir', required=True, help='Terraform root module directory')
+    parser.add_argument('-o', '--reports-dir', required=True, help='Directory the reports are written to')
+    parser.add_argument('--tags', default=None, help='Only run features/scenarios matching the tag')
+    parser.add_argument('--var', action='append', default=[], help='Variable passed to terraform plan as name=value')
+    parser.add_argument('--var-file', action='append', default=[], help='Variable file passed to terraform plan')
+    parser.add_argument('--workspace', default=os.environ.get('TF_WORKSPACE', 'default'), help='Value of terraform.workspace')
+    parser.add_argument('--schema', default=os.environ.get('COMPLIANCE_PROVIDER_SCHEMA'),
+                        help='Output of `terraform providers schema -json`, defaults to $COMPLIANCE_PROVIDER_SCHEMA')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    return run(args.features, args.src_dir, args.reports_dir, args.tags, args.var, args.var_file, args.workspace, args.schema)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,390 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Step library of the native evaluation engine.
+#
+# Each step works on the scenario stash, a list of Items. An Item pairs the
+# resource being checked with the value currently in focus (the resource
+# values after a Given, the value of a property after `it must contain`).
+# A step returns the items that carry on to the next step and reports a
+# failure per item through ctx.fail(), so every verdict is attributable to
+# a resource address.
+#
+# The sentences follow the terraform-compliance step grammar used by the
+# feature files under src/.
+#
+# A step can also have a batch implementation, used for the rows of a
+# Scenario Outline that reach the step with the same stash. It takes the
+# argument lists of all rows and returns one (stash, failures) or Skip per
+# row from a single pass over the stash.
+#
+# Every step declares the resource attributes it reads, as a function of its
+# arguments. Plans too large to load whole keep only those attributes (see
+# Plan.stream); a step registered without the declaration keeps them all.
+
+import hashlib
+import re
+
+from compliance import exposure
+from compliance.plan import UNKNOWN
+
+
+class Skip(Exception):
+    pass
+
+
+class Item:
+
+    __slots__ = ('resource', 'value')
+
+    def __init__(self, resource, value):
+        self.resource = resource
+        self.value = value
+
+
+_MISSING = object()
+_EMPTY = ([], {}, '')
+
+TAGGABLE = ('resource that supports tags', 'resources that support tags')
+
+
+
+def describe(resource):
+    return '{} ({})'.format(resource.address, resource.type)
+
+
+def find_key(value, key):
+    # Looks for the key in the value itself first and then anywhere below it
+    if isinstance(value, dict):
+        if key in value:
+            return value[key]
+        children = value.values()
+    elif isinstance(value, list):
+        # Tags given as a list of {key, value} maps
+        for element in value:
+            if isinstance(element, dict) and element.get('key') == key and 'value' in element:
+                return element['value']
+        children = value
+    else:
+        return _MISSING
+    for child in children:
+        found = find_key(child, key)
+        if found is not _MISSING:
+            return found
+    return _MISSING
+
+
+def normalize(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def as_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def scalars(value):
+    # Lists are checked element by element
+    return value if isinstance(value, list) else [value]
+
+
+def looks_like_resource_type(name, resource):
+    return '_' in name and name.split('_', 1)[0] == resource.type.split('_', 1)[0]
+
+
+###########################################################################
+# Given
+###########################################################################
+def i_have_resource_defined(ctx, name):
+    if name in TAGGABLE:
+        resources = ctx.plan.supporting_tags()
+    else:
+        resources = ctx.plan.of_type(name)
+    if not resources:
+        raise Skip('Can not find any {} defined in the plan'.format(name))
+    return [Item(resource, resource.values) for resource in resources]
+
+
+###########################################################################
+# When
+###########################################################################
+def it_has_something(ctx, name):
+    stash = []
+    for item in ctx.stash:
+        found = find_key(item.value, name)
+        if found is not _MISSING and found is not None and not any(found == empty for empty in _EMPTY):
+            stash.append(item)
+    if not stash:
+        raise Skip('Can not find any resource with {} property'.format(name))
+    return stash
+
+
+def its_key_is_value(ctx, key, value):
+    stash = []
+    for item in ctx.stash:
+        found = find_key(item.value, key)
+        if found is _MISSING:
+            continue
+        if any(normalize(element) == value for element in scalars(found)):
+            stash.append(item)
+    if not stash:
+        raise Skip('Can not find any resource with {} set to {}'.format(key, value))
+    return stash
+
+
+def its_key_is_value_batch(ctx, arguments):
+    # The stash is partitioned once per key by the normalized values, every row takes its partition
+    partitions = {}
+    for key in set(key for key, _ in arguments):
+        partition = partitions[key] = {}
+        for item in ctx.stash:
+            found = find_key(item.value, key)
+            if found is _MISSING:
+                continue
+            for value in set(normalize(element) for element in scalars(found)):
+                partition.setdefault(value, []).append(item)
+    outcomes = []
+    for key, value in arguments:
+        stash = partitions[key].get(value)
+        outcomes.append((stash, []) if stash else Skip('Can not find any resource with {} set to {}'.format(key, value)))
+    return outcomes
+
+
+###########################################################################
+# Then
+###########################################################################
+def it_must_contain_something(ctx, name):
+    stash = []
+    for item in ctx.stash:
+        found = find_key(item.value, name)
+        if found is _MISSING and item.value is item.resource.values and looks_like_resource_type(name, item.resource):
+            # Relationship between resources, e.g. the aws_s3_bucket an aws_cloudtrail writes to
+            referenced = ctx.plan.referenced(item.resource, name)
+            if not referenced:
+                ctx.fail(item, '{} does not refer to any {} resource.'.format(describe(item.resource), name))
+            stash += [Item(resource, resource.values) for resource in referenced]
+            continue
+        if found is _MISSING or any(found == empty for empty in _EMPTY):
+            ctx.fail(item, '{} does not have {} property.'.format(describe(item.resource), name))
+            continue
+        stash.append(Item(item.resource, found))
+    return stash
+
+
+def it_must_not_contain_something(ctx, name):
+    for item in ctx.stash:
+        found = find_key(item.value, name)
+        if found is not _MISSING and found is not None and not any(found == empty for empty in _EMPTY):
+            ctx.fail(item, '{} should not have {} property.'.format(describe(item.resource), name))
+    return ctx.stash
+
+
+def its_value_must_be_null(ctx, negate):
+    for item in ctx.stash:
+        is_null = item.value is None
+        if negate and is_null:
+            ctx.fail(item, '{} has a null value.'.format(describe(item.resource)))
+        elif not negate and not is_null:
+            ctx.fail(item, '{} has a non null value ({}).'.format(describe(item.resource), normalize(item.value)))
+    return ctx.stash
+
+
+def its_value_must_be(ctx, negate, expected):
+    for item in ctx.stash:
+        if item.value is UNKNOWN:
+            if not negate:
+                ctx.fail(item, '{} value is only known after apply, expected {}.'.format(describe(item.resource), expected))
+            continue
+        values = [normalize(value) for value in scalars(item.value)]
+        equal = bool(values) and all(value.lower() == expected.lower() for value in values)
+        if negate and equal:
+            ctx.fail(item, '{} value must not be {}.'.format(describe(item.resource), expected))
+        elif not negate and not equal:
+            ctx.fail(item, '{} value {} is not {}.'.format(describe(item.resource), ', '.join(values), expected))
+    return ctx.stash
+
+
+def its_value_must_be_equal_to(ctx, negate, expected):
+    number = as_number(expected)
+    for item in ctx.stash:
+        value = as_number(item.value)
+        equal = value is not None and value == number
+        if negate and equal:
+            ctx.fail(item, '{} value must not be equal to {}.'.format(describe(item.resource), expected))
+        elif not negate and not equal:
+            ctx.fail(item, '{} value {} is not equal to {}.'.format(describe(item.resource), normalize(item.value), expected))
+    return ctx.stash
+
+
+def its_value_must_match_regex(ctx, negate, pattern):
+    regex = ctx.regex(pattern)
+    for item in ctx.stash:
+        if item.value is UNKNOWN:
+            continue
+        values = [normalize(value) for value in scalars(item.value)]
+        for value in values:
+            matched = regex.match(value) is not None
+            if negate and matched:
+                ctx.fail(item, '{} value {} matches the "{}" regex.'.format(describe(item.resource), value, pattern))
+                break
+            if not negate and not matched:
+                ctx.fail(item, '{} value {} does not match the "{}" regex.'.format(describe(item.resource), value, pattern))
+                break
+    return ctx.stash
+
+
+def it_must_not_have_proto_protocol_and_port_for_cidr(ctx, protocol, ports, cidr):
+    # The ingress rules of the whole plan are indexed once, see compliance/exposure.py
+    exposed = exposure.index(ctx.plan).exposed(protocol, exposure.parse_ports(ports), cidr)
+    for item in ctx.stash:
+        if item.resource.address in exposed:
+            low, high = exposed[item.resource.address]
+            ctx.fail(item, '{} has {} protocol with port(s) {}-{} open to {}, forbidden range is {}.'.format(
+                describe(item.resource), protocol, low, high, cidr, ports
+            ))
+    return ctx.stash
+
+
+###########################################################################
+# Static analysis
+###########################################################################
+_GIVEN_SENTENCE = re.compile(r'I have (.+) (?:defined|configured)')
+_CONTAIN_SENTENCE = re.compile(r'it must contain (\S+)')
+# Provider prefixes assumed when a scenario does not name a resource type
+DEFAULT_PROVIDER_PREFIXES = ('aws',)
+
+
+def scenario_resource_types(scenario):
+    # Returns the resource types selected by the Given steps and the ones reached through relationships
+    given = []
+    for step in scenario.steps:
+        match = _GIVEN_SENTENCE.fullmatch(step.text)
+        if match and step.kind == 'Given':
+            given.append(match.group(1))
+    prefixes = set(name.split('_', 1)[0] for name in given if name not in TAGGABLE) or set(DEFAULT_PROVIDER_PREFIXES)
+    related = []
+    for step in scenario.steps:
+        match = _CONTAIN_SENTENCE.fullmatch(step.text)
+        if match and '_' in match.group(1) and match.group(1).split('_', 1)[0] in prefixes:
+            related.append(match.group(1))
+    return given, related
+
+
+class StepLibrary:
+
+    def __init__(self):
+        self.definitions = []
+        self.batches = {}
+        self.attributes = {}
+        # step text -> (function, arguments) or None, filled on first match or from a rule bundle
+        self.matches = {}
+
+    def register(self, pattern, function, batch=None, attributes=None):
+        self.definitions.append((re.compile(pattern), function))
+        self.matches.clear()
+        if batch:
+            self.batches[function] = batch
+        if attributes:
+            self.attributes[function] = attributes
+
+    def batch(self, function):
+        return self.batches.get(function)
+
+    def referenced_attributes(self, texts):
+        # Top level attribute names the steps read, None when a step does not declare them
+        referenced = set()
+        for text in texts:
+            match = self.match(text)
+            if match is None:
+                continue
+            function, arguments = match
+            if function not in self.attributes:
+                return None
+            referenced.update(self.attributes[function](*arguments))
+        return referenced
+
+    def match(self, text):
+        if text in self.matches:
+            return self.matches[text]
+        found = None
+        for regex, function in self.definitions:
+            match = regex.fullmatch(text)
+            if match:
+                found = function, match.groups()
+                break
+        self.matches[text] = found
+        return found
+
+    def binding(self, text):
+        # (pattern, arguments) of the definition matching the text, None when no step matches
+        for regex, _ in self.definitions:
+            match = regex.fullmatch(text)
+            if match:
+                return regex.pattern, list(match.groups())
+        return None
+
+    def signature(self):
+        # Identifies the ordered step sentences, bindings only carry over between libraries with the same signature
+        digest = hashlib.sha256()
+        for regex, _ in self.definitions:
+            digest.update(regex.pattern.encode('utf-8') + b'\0')
+        return digest.hexdigest()
+
+    def preload(self, bindings):
+        # Fills the matches from bindings made by binding(), so the step texts need no regex matching
+        functions = {}
+        for regex, function in self.definitions:
+            functions.setdefault(regex.pattern, function)
+        for text, binding in bindings.items():
+            self.matches[text] = None if binding is None else (functions[binding[0]], tuple(binding[1]))
+
+
+def _negate(function):
+    return lambda ctx, negation, *args: function(ctx, bool(negation), *args)
+
+
+def _none(*args):
+    return ()
+
+
+def _first(name, *args):
+    return (name,)
+
+
+# Sentence whose second argument is a regular expression written in the feature file
+MATCH_REGEX = r'its value must (not )?match the "(.+)" regex'
+
+LIBRARY = StepLibrary()
+# Order matters, the more specific sentences are registered first
+LIBRARY.register(r'I have (.+) (?:defined|configured)', i_have_resource_defined, attributes=lambda name: ('tags',) if name in TAGGABLE else ())
+LIBRARY.register(r'it (?:has|contains) (\S+)', it_has_something, attributes=_first)
+LIBRARY.register(r'its (\S+) is (.+)', its_key_is_value, its_key_is_value_batch, attributes=_first)
+LIBRARY.register(r'it must not have (\S+) protocol and port (\S+) for (\S+)', it_must_not_have_proto_protocol_and_port_for_cidr,
+                 attributes=lambda *args: ('ingress',))
+LIBRARY.register(r'it must not contain (\S+)', it_must_not_contain_something, attributes=_first)
+LIBRARY.register(r'it must contain (\S+)', it_must_contain_something, attributes=_first)
+# The value steps read the value a previous step put in focus
+LIBRARY.register(r'its value must (not )?be null', _negate(its_value_must_be_null), attributes=_none)
+LIBRARY.register(r'its value must (not )?be equal to (.+)', _negate(its_value_must_be_equal_to), attributes=_none)
+LIBRARY.register(MATCH_REGEX, _negate(its_value_must_match_regex), attributes=_none)
+LIBRARY.register(r'its value must (not )?be (.+)', _negate(its_value_must_be), attributes=_none)
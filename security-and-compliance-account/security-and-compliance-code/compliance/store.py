@@ -0,0 +1,207 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Object store used for state shared between pipeline runs.
+#
+# A location is either an S3 url (s3://bucket/prefix), used in the pipeline
+# with the pipeline bucket, or a local directory which stands in for the
+# bucket when running outside of AWS. S3 access goes through the aws cli that
+# is already installed on the CodeBuild images.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+# Attempts of a conditional write racing another one
+CREATE_ATTEMPTS = 5
+
+
+def open_store(location):
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3Store(bucket, prefix)
+    return LocalStore(location)
+
+
+class Store:
+
+    def get(self, key, dest):
+        # Copies the object to dest, returns False when it does not exist
+        raise NotImplementedError
+
+    def put(self, key, src):
+        raise NotImplementedError
+
+    def create(self, key, src):
+        # Writes the object only when it does not exist yet, returns whether this call created it.
+        # Of concurrent creates of one key exactly one succeeds
+        raise NotImplementedError
+
+    def list(self, prefix):
+        # Names of the objects directly under prefix/
+        raise NotImplementedError
+
+    def sync(self, prefix, dest):
+        # Mirrors the objects directly under prefix/ into dest, only copying the ones that changed
+        raise NotImplementedError
+
+    def get_text(self, key):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'object')
+            if not self.get(key, path):
+                return None
+            with open(path, 'r') as f:
+                return f.read()
+
+    def put_text(self, key, text):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'object')
+            with open(path, 'w') as f:
+                f.write(text)
+            self.put(key, path)
+
+    def create_text(self, key, text):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'object')
+            with open(path, 'w') as f:
+                f.write(text)
+            return self.create(key, path)
+
+
+class LocalStore(Store):
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def get(self, key, dest):
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return False
+        shutil.copyfile(path, dest)
+        return True
+
+    def put(self, key, src):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write next to the target and rename so concurrent readers never see a partial object
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, path)
+
+    def create(self, key, src):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        shutil.copyfile(src, tmp)
+        # link() fails when the target exists, the object appears complete or not at all
+        try:
+            os.link(tmp, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp)
+
+    def list(self, prefix):
+        path = self.path(prefix)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name for name in os.listdir(path) if os.path.isfile(os.path.join(path, name)))
+
+    def sync(self, prefix, dest):
+        os.makedirs(dest, exist_ok=True)
+        names = self.list(prefix)
+        for name in names:
+            src = os.path.join(self.path(prefix), name)
+            target = os.path.join(dest, name)
+            stat = os.stat(src)
+            if os.path.isfile(target) and os.stat(target).st_size == stat.st_size and os.stat(target).st_mtime >= stat.st_mtime:
+                continue
+            shutil.copy2(src, target)
+        for name in set(os.listdir(dest)) - set(names):
+            os.remove(os.path.join(dest, name))
+
+    def __repr__(self):
+        return 'LocalStore({})'.format(self.root)
+
+
+class S3Store(Store):
+
+    def __init__(self, bucket, prefix=''):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def url(self, key):
+        return 's3://{}/{}'.format(self.bucket, '/'.join(filter(None, [self.prefix, key])))
+
+    def get(self, key, dest):
+        resp_code = subprocess.call(
+            ['aws', 's3', 'cp', self.url(key), dest, '--only-show-errors'],
+            stderr=subprocess.DEVNULL
+        )
+        return resp_code == 0
+
+    def put(self, key, src):
+        subprocess.check_call(['aws', 's3', 'cp', src, self.url(key), '--only-show-errors'])
+
+    def create(self, key, src):
+        # Conditional write (If-None-Match), needs an aws cli released after August 2024
+        key = '/'.join(filter(None, [self.prefix, key]))
+        for _ in range(CREATE_ATTEMPTS):
+            process = subprocess.run(
+                ['aws', 's3api', 'put-object', '--bucket', self.bucket, '--key', key, '--body', src, '--if-none-match', '*'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+            )
+            if process.returncode == 0:
+                return True
+            if 'PreconditionFailed' in process.stderr:
+                return False
+            # Another conditional write of the key is in flight, the retry sees whether it succeeded
+            if 'ConditionalRequestConflict' not in process.stderr:
+                break
+            time.sleep(1)
+        raise subprocess.CalledProcessError(process.returncode, process.args, stderr=process.stderr)
+
+    def list(self, prefix):
+        # aws s3 ls prints "<date> <time> <size> <name>" for objects and "PRE <name>/" for prefixes
+        process = subprocess.run(
+            ['aws', 's3', 'ls', self.url(prefix) + '/'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+        )
+        # An empty prefix exits 1 without an error message, anything else (access denied, throttling) is raised
+        if process.returncode != 0 and process.stderr.strip():
+            raise subprocess.CalledProcessError(process.returncode, process.args, stderr=process.stderr)
+        names = []
+        for line in process.stdout.splitlines():
+            fields = line.split(None, 3)
+            if len(fields) == 4:
+                names.append(fields[3])
+        return sorted(names)
+
+    def sync(self, prefix, dest):
+        # Nested prefixes are left out to match list()
+        subprocess.check_call(
+            ['aws', 's3', 'sync', self.url(prefix) + '/', dest, '--delete', '--exclude', '*/*', '--only-show-errors']
+        )
+
+    def __repr__(self):
+        return 'S3Store({})'.format(self.url(''))
@@ -0,0 +1,119 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Terraform plan step used by the batch check.
+#
+# Same sequence as compliance-check.sh: look the plan up in the plan cache,
+# otherwise `terraform init` (with providers from the shared provider mirror),
+# `terraform plan` and `terraform show -json`, caching the result when the
+# plan succeeded. Terraform output goes to a log
+# file per workload so concurrent plans do not interleave in the build log.
+#
+# Several environments of one workload are planned from the same directory by
+# giving each its own var files, workspace and output directory. The output
+# directory also holds that environment's terraform data (TF_DATA_DIR), so
+# concurrent plans do not share a workspace selection.
+
+import contextlib
+import hashlib
+import os
+import subprocess
+
+from compliance import plan_cache
+from compliance import provider_mirror
+from compliance.store import open_store
+
+PLAN_OUT = 'plan.out'
+PLAN_JSON = 'plan.out.json'
+DEFAULT_WORKSPACE = 'default'
+
+
+class TerraformError(Exception):
+    pass
+
+
+def terraform_version():
+    output = subprocess.check_output(['terraform', 'version'], universal_newlines=True)
+    return output.splitlines()[0]
+
+
+def _terraform(arguments, tf_dir, log, stdout=None, environment=None):
+    env = dict(os.environ, TF_IN_AUTOMATION='1', TF_INPUT='0', **(environment or {}))
+    log.write('$ terraform {}\n'.format(' '.join(arguments)))
+    log.flush()
+    resp_code = subprocess.call(['terraform'] + arguments, cwd=tf_dir, env=env, stdout=stdout or log, stderr=log)
+    if resp_code != 0:
+        raise TerraformError('terraform {} failed with exit code {}'.format(arguments[0], resp_code))
+
+
+def var_file_identity(tf_dir, var_file):
+    # Var files may live outside the source directory hashed by the plan cache
+    with open(os.path.join(tf_dir, var_file), 'rb') as f:
+        return 'var-file={}:{}'.format(var_file, hashlib.sha256(f.read()).hexdigest())
+
+
+def select_workspace(workspace, tf_dir, log, environment):
+    try:
+        _terraform(['workspace', 'select', workspace], tf_dir, log, environment=environment)
+    except TerraformError:
+        _terraform(['workspace', 'new', workspace], tf_dir, log, environment=environment)
+
+
+def plan_json(tf_dir, region, backend_bucket, log, cache_store=None, version=None, mirror_store=None,
+              var_files=(), workspace=DEFAULT_WORKSPACE, out_dir=None, init_lock=None):
+    # Returns the path of the plan JSON of tf_dir, written to out_dir when one is given
+    variables = ['region={}'.format(region)]
+    plan_path = os.path.join(out_dir or tf_dir, PLAN_JSON)
+    plan_out = os.path.abspath(os.path.join(out_dir, PLAN_OUT)) if out_dir else PLAN_OUT
+
+    key = None
+    if cache_store:
+        # The default workspace without var files keeps the key compliance-check.sh computes
+        identity = [var_file_identity(tf_dir, var_file) for var_file in var_files]
+        if workspace != DEFAULT_WORKSPACE:
+            identity.append('workspace={}'.format(workspace))
+        try:
+            state_identity = plan_cache.remote_state_identity(tf_dir, backend_bucket, workspace)
+            key = plan_cache.compute_key(tf_dir, variables + identity, state_identity, [version or terraform_version()])
+        except RuntimeError as e:
+            log.write('Plan cache disabled: {}\n'.format(e))
+        if key and open_store(cache_store).get(plan_cache.object_key(key), plan_path):
+            log.write('Plan cache hit for {}\n'.format(key))
+            return plan_path
+
+    # Concurrent plans needing the same providers share one mirror
+    try:
+        environment = provider_mirror.terraform_environment(tf_dir, store=mirror_store)
+    except (subprocess.CalledProcessError, OSError) as e:
+        log.write('Provider mirror unavailable: {}\n'.format(e))
+        environment = {}
+    if out_dir:
+        environment['TF_DATA_DIR'] = os.path.abspath(os.path.join(out_dir, '.terraform'))
+
+    # Plans of the same directory run init one at a time, they all write its .terraform.lock.hcl
+    with init_lock or contextlib.nullcontext():
+        _terraform(['init', '-backend-config=region={}'.format(region), '-backend-config=bucket={}'.format(backend_bucket)], tf_dir, log, environment=environment)
+    if workspace != DEFAULT_WORKSPACE:
+        select_workspace(workspace, tf_dir, log, environment)
+    arguments = ['plan', '-var', variables[0]] + ['-var-file={}'.format(var_file) for var_file in var_files]
+    _terraform(arguments + ['-out={}'.format(plan_out)], tf_dir, log, environment=environment)
+    with open(plan_path, 'w') as out:
+        _terraform(['show', '-json', plan_out], tf_dir, log, stdout=out, environment=environment)
+
+    # Only successful plans are cached
+    if key:
+        open_store(cache_store).put(plan_cache.object_key(key), plan_path)
+        log.write('Plan cached as {}\n'.format(key))
+    return plan_path
@@ -0,0 +1,165 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Timing of the compliance checks.
+#
+# The report stage feeds every scenario of the cucumber JSON to a
+# TimingCollector, which writes next to the reports
+#   timing.json   per feature, scenario and step durations in nanoseconds,
+#                 plus the time spent in the resource type lookups of the
+#                 `Given I have <type> defined` steps, aggregated per type
+#   slowest.txt   the TOP slowest scenarios and steps
+# The cucumber JSON keeps the integer nanosecond duration of every step, a
+# scenario's duration is the sum of its steps.
+#
+# timing.json is meant to be compared across runs:
+#   python3 -m compliance.timing diff old/timing.json new/timing.json [--min-ms 1]
+
+import argparse
+import heapq
+import json
+import os
+import re
+import sys
+
+from compliance import results
+
+TIMING_JSON = 'timing.json'
+SLOWEST_TXT = 'slowest.txt'
+VERSION = 1
+TOP = int(os.environ.get('COMPLIANCE_TIMING_TOP', 10))
+
+_LOOKUP = re.compile(r'I have (.+) (?:defined|configured)')
+
+
+def _milliseconds(nanoseconds):
+    return '{:.3f} ms'.format(nanoseconds / 10 ** 6)
+
+
+class TimingCollector:
+
+    def __init__(self):
+        self.features = []
+        self.lookups = {}
+
+    def add(self, feature_name, feature_uri, scenario):
+        if not self.features or self.features[-1]['uri'] != feature_uri or self.features[-1]['name'] != feature_name:
+            self.features.append({'name': feature_name, 'uri': feature_uri, 'duration_ns': 0, 'scenarios': []})
+        feature = self.features[-1]
+        steps = []
+        for step in scenario.get('steps', []):
+            duration = int(results.step_duration(step))
+            steps.append({
+                'keyword': step.get('keyword', '').strip(),
+                'name': step.get('name', ''),
+                'line': step.get('line'),
+                'status': results.step_status(step),
+                'duration_ns': duration
+            })
+            match = _LOOKUP.fullmatch(step.get('name', ''))
+            if match and results.step_status(step) != results.UNDEFINED:
+                lookup = self.lookups.setdefault(match.group(1), {'count': 0, 'duration_ns': 0})
+                lookup['count'] += 1
+                lookup['duration_ns'] += duration
+        duration = sum(step['duration_ns'] for step in steps)
+        feature['scenarios'].append({
+            'name': scenario.get('name', ''),
+            'line': scenario.get('line'),
+            'status': results.scenario_status(scenario),
+            'duration_ns': duration,
+            'steps': steps
+        })
+        feature['duration_ns'] += duration
+
+    def timing(self):
+        return {
+            'version': VERSION,
+            'duration_ns': sum(feature['duration_ns'] for feature in self.features),
+            'features': self.features,
+            'lookups': self.lookups
+        }
+
+    def slowest(self, top=TOP):
+        scenarios = [(scenario['duration_ns'], feature['name'], scenario) for feature in self.features for scenario in feature['scenarios']]
+        steps = [
+            (step['duration_ns'], feature['name'], scenario['name'], step)
+            for feature in self.features for scenario in feature['scenarios'] for step in scenario['steps']
+        ]
+        return (heapq.nlargest(top, scenarios, key=lambda entry: entry[0]),
+                heapq.nlargest(top, steps, key=lambda entry: entry[0]))
+
+    def format_slowest(self, top=TOP):
+        scenarios, steps = self.slowest(top)
+        lines = ['Slowest {} scenarios'.format(len(scenarios))]
+        for duration, feature_name, scenario in scenarios:
+            lines.append('  {:>14}  {} -> {} ({})'.format(_milliseconds(duration), feature_name, scenario['name'], scenario['status']))
+        lines.append('Slowest {} steps'.format(len(steps)))
+        for duration, feature_name, scenario_name, step in steps:
+            lines.append('  {:>14}  {} -> {}: {} {}'.format(_milliseconds(duration), feature_name, scenario_name, step['keyword'], step['name']))
+        return '\n'.join(lines)
+
+    def write(self, reports_dir, top=TOP):
+        with open(os.path.join(reports_dir, TIMING_JSON), 'w') as f:
+            json.dump(self.timing(), f, indent=1)
+        with open(os.path.join(reports_dir, SLOWEST_TXT), 'w') as f:
+            f.write(self.format_slowest(top) + '\n')
+
+
+def scenario_durations(timing):
+    # {(feature uri, scenario name): duration} of a timing.json document
+    return dict(
+        ((os.path.basename(feature['uri']), scenario['name']), scenario['duration_ns'])
+        for feature in timing['features'] for scenario in feature['scenarios']
+    )
+
+
+def diff(old, new, min_ns=0):
+    # [(key, old duration or None, new duration or None)] of the scenarios whose duration changed by at least min_ns
+    old_durations = scenario_durations(old)
+    new_durations = scenario_durations(new)
+    changes = []
+    for key in set(old_durations) | set(new_durations):
+        before, after = old_durations.get(key), new_durations.get(key)
+        if before is None or after is None or abs(after - before) >= min_ns:
+            changes.append((key, before, after))
+    return sorted(changes, key=lambda change: -abs((change[2] or 0) - (change[1] or 0)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the timing of two compliance check runs')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    diff_parser = subparsers.add_parser('diff', help='Scenario durations that changed between two timing.json files')
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+    diff_parser.add_argument('--min-ms', type=float, default=1.0, help='Ignore changes below this many milliseconds')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print('Total {} -> {}'.format(_milliseconds(old['duration_ns']), _milliseconds(new['duration_ns'])))
+    for (uri, name), before, after in diff(old, new, int(args.min_ms * 10 ** 6)):
+        print('{:>14} {:>14}  {} -> {}'.format(
+            _milliseconds(before) if before is not None else '-', _milliseconds(after) if after is not None else '-', uri, name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the compliance tooling, run from security-and-compliance-code:
+#
+#   python3 -m pytest -q tests
+#
+# Tests needing terraform, terraform-compliance or the aws CLI are skipped
+# when those are not installed.
+
+import json
+import os
+
+from compliance import results
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEATURES_DIR = os.path.join(CODE_DIR, 'src')
+FIXTURES_DIR = os.path.join(CODE_DIR, 'test')
+
+
+def write_plan(path, resources):
+    # Plan JSON holding the given resources, as (address, values) pairs
+    planned = []
+    changes = []
+    for address, values in resources:
+        resource_type, name = address.split('.')
+        planned.append({'address': address, 'mode': 'managed', 'type': resource_type, 'name': name, 'values': values})
+        changes.append({'address': address, 'mode': 'managed', 'type': resource_type, 'name': name,
+                        'change': {'actions': ['create'], 'before': None, 'after': values, 'after_unknown': {}}})
+    with open(path, 'w') as f:
+        json.dump({'format_version': '0.1', 'planned_values': {'root_module': {'resources': planned}}, 'resource_changes': changes}, f)
+    return path
+
+
+def scenario_statuses(features):
+    # Status of every scenario of cucumber features, by feature and scenario name
+    return dict(
+        ((feature['name'], scenario['name']), results.scenario_status(scenario))
+        for feature in features
+        for scenario in feature.get('elements', [])
+    )
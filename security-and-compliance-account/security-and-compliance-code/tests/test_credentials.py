@@ -0,0 +1,129 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Session broker of compliance/credentials.py against a stand-in for
+# `aws sts assume-role` put first on PATH. The stand-in logs every call and
+# answers sessions that expire STS_SECONDS from now.
+
+import concurrent.futures
+import json
+import os
+import stat
+import sys
+import textwrap
+
+import pytest
+
+from compliance import credentials
+
+ROLE_ARN = 'arn:aws:iam::111111111111:role/cross-account-role'
+OTHER_ROLE_ARN = 'arn:aws:iam::222222222222:role/cross-account-role'
+
+FAKE_AWS = textwrap.dedent('''\
+    #!{python}
+    import datetime, json, os, sys
+    with open(os.environ['STS_CALLS'], 'a') as f:
+        f.write(json.dumps(sys.argv[1:]) + '\\n')
+    role_arn = sys.argv[sys.argv.index('--role-arn') + 1]
+    expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=int(os.environ['STS_SECONDS']))
+    print(json.dumps({{
+        'AccessKeyId': 'ASIA' + role_arn.split(':')[4],
+        'SecretAccessKey': 'secret',
+        'SessionToken': 'token',
+        'Expiration': expiration.strftime('%Y-%m-%dT%H:%M:%SZ')
+    }}))
+''')
+
+
+@pytest.fixture
+def sts(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    aws = bin_dir / 'aws'
+    aws.write_text(FAKE_AWS.format(python=sys.executable))
+    aws.chmod(aws.stat().st_mode | stat.S_IXUSR)
+    calls = tmp_path / 'calls'
+    calls.write_text('')
+    monkeypatch.setenv('PATH', '{}{}{}'.format(bin_dir, os.pathsep, os.environ.get('PATH', '')))
+    monkeypatch.setenv('STS_CALLS', str(calls))
+    monkeypatch.setenv('STS_SECONDS', str(credentials.DURATION_SECONDS))
+
+    def assume_role_calls():
+        return [json.loads(line) for line in calls.read_text().splitlines()]
+    return assume_role_calls
+
+
+def test_session_is_reused(sts, tmp_path):
+    broker = credentials.CredentialBroker(str(tmp_path / 'cache'))
+    first = broker.credentials(ROLE_ARN)
+    second = broker.credentials(ROLE_ARN)
+
+    assert first == second
+    assert first['AccessKeyId'] == 'ASIA111111111111'
+    assert len(sts()) == 1
+    assert sts()[0][:2] == ['sts', 'assume-role']
+
+
+def test_processes_share_the_cache_file(sts, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    credentials.CredentialBroker(cache_dir).credentials(ROLE_ARN)
+    # Another process starts with an empty broker
+    credentials.CredentialBroker(cache_dir).credentials(ROLE_ARN)
+
+    assert len(sts()) == 1
+    cached = [name for name in os.listdir(cache_dir) if name.endswith('.json')]
+    assert len(cached) == 1
+    assert stat.S_IMODE(os.stat(os.path.join(cache_dir, cached[0])).st_mode) == 0o600
+
+
+def test_concurrent_workers_assume_once(sts, tmp_path):
+    broker = credentials.CredentialBroker(str(tmp_path / 'cache'))
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        sessions = list(executor.map(lambda role_arn: broker.credentials(role_arn)['AccessKeyId'], [ROLE_ARN] * 16 + [OTHER_ROLE_ARN] * 16))
+
+    assert sessions == ['ASIA111111111111'] * 16 + ['ASIA222222222222'] * 16
+    assert sorted(call[call.index('--role-arn') + 1] for call in sts()) == [ROLE_ARN, OTHER_ROLE_ARN]
+
+
+def test_expiring_session_is_replaced(sts, tmp_path, monkeypatch):
+    monkeypatch.setenv('STS_SECONDS', str(credentials.REFRESH_SECONDS - 60))
+    broker = credentials.CredentialBroker(str(tmp_path / 'cache'))
+    broker.credentials(ROLE_ARN)
+    broker.credentials(ROLE_ARN)
+
+    assert len(sts()) == 2
+
+
+def test_endpoint_url_is_passed_on(sts, tmp_path):
+    credentials.CredentialBroker(str(tmp_path / 'cache'), endpoint_url='http://127.0.0.1:5000').credentials(ROLE_ARN)
+
+    call = sts()[0]
+    assert call[call.index('--endpoint-url') + 1] == 'http://127.0.0.1:5000'
+
+
+def test_env_and_process_output(sts, tmp_path, capsys):
+    cache_dir = str(tmp_path / 'cache')
+    assert credentials.main(['--cache-dir', cache_dir, 'env', ROLE_ARN]) == 0
+    exports = capsys.readouterr().out.splitlines()
+    assert credentials.main(['process', ROLE_ARN, '--cache-dir', cache_dir]) == 0
+    process = json.loads(capsys.readouterr().out)
+
+    assert exports == [
+        'export AWS_ACCESS_KEY_ID=ASIA111111111111',
+        'export AWS_SECRET_ACCESS_KEY=secret',
+        'export AWS_SESSION_TOKEN=token'
+    ]
+    assert process['Version'] == 1 and process['AccessKeyId'] == 'ASIA111111111111'
+    assert len(sts()) == 1
@@ -0,0 +1,177 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Verdicts of the native engine (compliance/engine.py). The evaluation modes
+# of the runner, serial, forked (compliance/parallel.py) and incremental
+# (compliance/incremental.py), must give the same reports, and the engine
+# the verdicts of terraform-compliance on the test fixtures.
+
+import os
+import shutil
+import subprocess
+import textwrap
+
+import pytest
+
+from benchmarks import generate
+from compliance import incremental
+from compliance import results
+from compliance import runner
+from compliance.engine import Engine, to_cucumber
+from compliance.plan import Plan
+from compliance.results import FAILED, PASSED, SKIPPED
+from compliance.store import LocalStore
+from tests import FEATURES_DIR, FIXTURES_DIR, scenario_statuses, write_plan
+
+SECURITY = 'Service & Data Protection'
+ENCRYPTION = (SECURITY, 'Validate S3 bucket encryption enabled')
+LIFECYCLE = (SECURITY, 'Validate S3 Lifecycle rule')
+EBS_ENCRYPTION = (SECURITY, 'Validate EBS volume encryption enabled. Alternatively can check for presence of resource - aws_ebs_encryption_by_default')
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return Engine.from_directory(FEATURES_DIR)
+
+
+def without_durations(features):
+    for feature in features:
+        for scenario in feature['elements']:
+            for step in scenario['steps']:
+                step['result'].pop('duration', None)
+    return features
+
+
+def test_bucket_verdicts(engine, tmp_path):
+    plan = write_plan(str(tmp_path / 'plan.out.json'), [
+        ('aws_s3_bucket.encrypted', {'bucket': 'encrypted', 'tags': {'Name': 'encrypted'}, 'server_side_encryption_configuration': [
+            {'rule': [{'apply_server_side_encryption_by_default': [{'sse_algorithm': 'aws:kms'}]}]}
+        ]}),
+        ('aws_s3_bucket.plain', {'bucket': 'plain', 'tags': {'Name': 'plain'}, 'lifecycle_rule': [{'id': 'tmp', 'enabled': True}]})
+    ])
+    features, resp_code = runner.evaluate_native(engine, plan)
+    statuses = scenario_statuses(features)
+
+    assert resp_code == 1
+    assert statuses[ENCRYPTION] == FAILED
+    assert statuses[LIFECYCLE] == FAILED
+    assert statuses[EBS_ENCRYPTION] == SKIPPED
+    failures = [step['result']['error_message'] for feature in features for scenario in feature['elements']
+                if scenario['name'] == ENCRYPTION[1] for step in scenario['steps'] if step['result']['status'] == FAILED]
+    assert len(failures) == 1 and 'aws_s3_bucket.plain' in failures[0] and 'aws_s3_bucket.encrypted' not in failures[0]
+
+
+def test_compliant_plan_passes(engine, tmp_path):
+    plan = write_plan(str(tmp_path / 'plan.out.json'), [
+        ('aws_ebs_volume.data', {'availability_zone': 'us-east-1a', 'size': 8, 'encrypted': True, 'tags': {'Name': 'data'}})
+    ])
+    features, _ = runner.evaluate_native(engine, plan)
+
+    assert scenario_statuses(features)[EBS_ENCRYPTION] == PASSED
+    assert scenario_statuses(features)[ENCRYPTION] == SKIPPED
+
+
+def test_evaluation_modes_agree(engine, tmp_path):
+    store = LocalStore(str(tmp_path / 'verdicts'))
+    plans = [
+        (300, 0.2),
+        # The same resources and 40 new ones
+        (340, 0.2),
+        # Other values for most resources, some removed
+        (250, 0.1)
+    ]
+    for index, (count, violations) in enumerate(plans):
+        plan = str(tmp_path / 'plan-{}.out.json'.format(index))
+        generate.write_plan(plan, count, seed=1, violations=violations)
+        serial, serial_code = runner.evaluate_native(engine, plan)
+        forked, forked_code = runner.evaluate_native(engine, plan, jobs=4)
+        carried, carried_code = runner.evaluate_native(engine, plan, verdict_store=str(tmp_path / 'verdicts'))
+
+        assert serial_code == forked_code == carried_code == 1
+        assert FAILED in scenario_statuses(serial).values()
+        assert without_durations(forked) == without_durations(serial)
+        assert without_durations(carried) == without_durations(serial)
+    assert store.get_text(incremental.DEFAULT_STATE_KEY)
+
+
+def incremental_run(engine, plan, store):
+    evaluator = incremental.IncrementalEvaluator(engine, incremental.load_state(store))
+    features = to_cucumber(evaluator.evaluate(Plan.load(plan)))
+    incremental.save_state(store, evaluator.state)
+    return features, evaluator.stats
+
+
+def test_saved_verdicts_follow_the_code(engine, tmp_path, monkeypatch):
+    store = LocalStore(str(tmp_path / 'verdicts'))
+    plan = str(tmp_path / 'plan.out.json')
+    generate.write_plan(plan, 300, violations=0.2)
+    incremental_run(engine, plan, store)
+
+    _, stats = incremental_run(engine, plan, store)
+    assert stats['incremental'] > 0
+    monkeypatch.setattr(incremental, 'code_fingerprint', lambda: '0' * 64)
+    _, stats = incremental_run(engine, plan, store)
+    assert stats['incremental'] == 0
+
+
+def test_scenarios_with_the_same_name_keep_their_verdicts(tmp_path):
+    features_dir = tmp_path / 'features'
+    features_dir.mkdir()
+    (features_dir / 'storage.feature').write_text(textwrap.dedent('''\
+        Feature: Storage
+
+          Scenario: Encryption
+            Given I have aws_s3_bucket defined
+            Then it must contain server_side_encryption_configuration
+
+          Scenario: Encryption
+            Given I have aws_ebs_volume defined
+            Then it must contain encrypted
+    '''))
+    engine = Engine.from_directory(str(features_dir))
+    store = LocalStore(str(tmp_path / 'verdicts'))
+    plan = str(tmp_path / 'plan.out.json')
+    generate.write_plan(plan, 300, violations=0.2)
+    incremental_run(engine, plan, store)
+
+    features, stats = incremental_run(engine, plan, store)
+    serial, _ = runner.evaluate_native(engine, plan)
+    assert stats['incremental'] == 2 and stats['full'] == 0
+    assert without_durations(features) == without_durations(serial)
+
+
+def terraform_plan(tf_dir):
+    subprocess.check_output(['terraform', 'init', '-input=false'], cwd=tf_dir, stderr=subprocess.STDOUT)
+    subprocess.check_output(['terraform', 'plan', '-input=false', '-out=plan.out'], cwd=tf_dir, stderr=subprocess.STDOUT)
+    return os.path.join(tf_dir, 'plan.out')
+
+
+@pytest.mark.skipif(not (shutil.which('terraform') and shutil.which('terraform-compliance')),
+                    reason='needs terraform and terraform-compliance')
+def test_agrees_with_terraform_compliance(tmp_path):
+    tf_dir = str(tmp_path / 'test')
+    shutil.copytree(FIXTURES_DIR, tf_dir)
+    try:
+        plan = terraform_plan(tf_dir)
+    except subprocess.CalledProcessError as e:
+        pytest.skip('terraform can not plan the fixtures here: {}'.format(e.output.decode('utf-8', 'replace')[-500:]))
+
+    runner.run(FEATURES_DIR, plan, str(tmp_path / 'terraform-compliance'), engine=runner.TERRAFORM_COMPLIANCE)
+    runner.run(FEATURES_DIR, plan, str(tmp_path / 'native'))
+    expected = scenario_statuses(results.load_features(str(tmp_path / 'terraform-compliance' / runner.CUCUMBER_JSON)))
+    actual = scenario_statuses(results.load_features(str(tmp_path / 'native' / runner.CUCUMBER_JSON)))
+
+    assert expected
+    assert actual == expected
@@ -0,0 +1,89 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Environments of compliance/multi_env.py: every environment is decided with
+# its own var files and workspace, and the deployment gets those of the
+# environment it deploys.
+
+import json
+import os
+import textwrap
+
+import pytest
+
+from compliance import multi_env
+from compliance import runner
+from compliance.results import FAILED, PASSED
+from tests import FEATURES_DIR, scenario_statuses
+
+RUNTIME = ('Architectural Compliance Checks', 'Validate lambda function runtime environment for non-compliant runtime')
+
+
+@pytest.fixture
+def src_dir(tmp_path):
+    path = tmp_path / 'src'
+    (path / 'env').mkdir(parents=True)
+    (path / 'main.tf').write_text(textwrap.dedent('''\
+        variable "runtime" {
+          default = "python2.7"
+        }
+
+        resource "aws_lambda_function" "handler" {
+          function_name = "handler"
+          role          = "arn:aws:iam::111111111111:role/handler"
+          handler       = "index.handler"
+          runtime       = var.runtime
+          tags          = { Name = "handler" }
+        }
+    '''))
+    (path / 'env' / 'dev.tfvars').write_text('runtime = "python3.9"\n')
+    (path / 'env' / 'prod.tfvars').write_text('runtime = "python3.8"\n')
+    return str(path)
+
+
+def environment_statuses(reports_dir, name):
+    with open(os.path.join(reports_dir, name, runner.CUCUMBER_JSON)) as f:
+        return scenario_statuses(json.load(f))
+
+
+def test_static_check_uses_the_var_files(src_dir, tmp_path):
+    targets = multi_env.parse_targets('env/dev.tfvars env/prod.tfvars@prod')
+    reports_dir = str(tmp_path / 'reports')
+
+    assert multi_env.static_check(targets, src_dir, FEATURES_DIR, reports_dir, '@architecture', 'us-east-1') == 0
+    assert environment_statuses(reports_dir, 'dev')[RUNTIME] == PASSED
+    assert environment_statuses(reports_dir, 'prod')[RUNTIME] == PASSED
+
+    with open(os.path.join(src_dir, 'env', 'prod.tfvars'), 'w') as f:
+        f.write('runtime = "python2.7"\n')
+    assert multi_env.static_check(targets, src_dir, FEATURES_DIR, reports_dir, '@architecture', 'us-east-1') == 1
+    assert environment_statuses(reports_dir, 'dev')[RUNTIME] == PASSED
+    assert environment_statuses(reports_dir, 'prod')[RUNTIME] == FAILED
+    with open(os.path.join(reports_dir, runner.CUCUMBER_JSON)) as f:
+        assert scenario_statuses(json.load(f))[('[prod] ' + RUNTIME[0], RUNTIME[1])] == FAILED
+
+
+def test_env_of_a_checked_environment(capsys):
+    targets = 'env/dev.tfvars base.tfvars,env/prod.tfvars@prod'
+
+    assert multi_env.main(['--targets', targets, 'env', 'prod']) == 0
+    assert capsys.readouterr().out.splitlines() == ["TF_WORKSPACE=prod", "deployVarFiles='base.tfvars env/prod.tfvars'"]
+    assert multi_env.main(['--targets', targets, 'env', 'staging']) == 1
+    assert 'staging is not one of the checked environments dev prod' in capsys.readouterr().err
+
+
+def test_environments_are_named_once():
+    with pytest.raises(ValueError, match='given twice'):
+        multi_env.parse_targets('env/prod.tfvars@prod prod.tfvars@prod')
@@ -0,0 +1,98 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Rule bundles (compliance/rule_bundle.py) published to and fetched from a
+# LocalStore evaluate plans as the feature files they were built from.
+
+import os
+import shutil
+
+import pytest
+
+from benchmarks import generate
+from compliance import rule_bundle
+from compliance import runner
+from compliance.engine import Engine
+from compliance.store import LocalStore
+from tests import FEATURES_DIR
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalStore(str(tmp_path / 'store'))
+
+
+def test_round_trip(store, tmp_path):
+    digest = rule_bundle.publish(FEATURES_DIR, store)
+    path = rule_bundle.fetch(digest, store, str(tmp_path / 'cache'))
+
+    assert store.get_text(rule_bundle.LATEST).strip() == digest
+    assert sorted(store.list('')) == sorted([rule_bundle.LATEST, rule_bundle.object_key(digest)])
+    assert rule_bundle.load(path).digest == digest
+
+    plan = str(tmp_path / 'plan.out.json')
+    generate.write_plan(plan, 300, violations=0.2)
+    from_bundle = runner.evaluate_native(rule_bundle.load_engine(path), plan)
+    from_features = runner.evaluate_native(Engine.from_directory(FEATURES_DIR), plan)
+    for features, _ in (from_bundle, from_features):
+        for feature in features:
+            for scenario in feature['elements']:
+                for step in scenario['steps']:
+                    step['result'].pop('duration', None)
+    assert from_bundle == from_features
+
+
+def test_digest_follows_the_rules(store, tmp_path):
+    digest = rule_bundle.publish(FEATURES_DIR, store)
+    assert rule_bundle.publish(FEATURES_DIR, store) == digest
+
+    features_dir = str(tmp_path / 'features')
+    shutil.copytree(FEATURES_DIR, features_dir)
+    with open(os.path.join(features_dir, 'security.feature'), 'a') as f:
+        f.write('\n  Scenario: Validate EBS volume size\n    Given I have aws_ebs_volume defined\n    Then it must contain size\n')
+    changed = rule_bundle.publish(features_dir, store)
+
+    assert changed != digest
+    assert store.get_text(rule_bundle.LATEST).strip() == changed
+    assert rule_bundle.fetch(digest, store, str(tmp_path / 'cache')) != rule_bundle.fetch(changed, store, str(tmp_path / 'cache'))
+
+
+def test_fetch_verifies_the_digest(store, tmp_path):
+    digest = rule_bundle.publish(FEATURES_DIR, store)
+    cache_dir = str(tmp_path / 'cache')
+    path = rule_bundle.fetch(digest, store, cache_dir)
+
+    # A damaged cached bundle is downloaded again
+    with open(path, 'ab') as f:
+        f.write(b' ')
+    assert rule_bundle.fetch(digest, store, cache_dir) == path
+    assert rule_bundle.load(path).digest == digest
+
+    # A damaged stored bundle is refused
+    os.remove(path)
+    with open(store.path(rule_bundle.object_key(digest)), 'ab') as f:
+        f.write(b' ')
+    with pytest.raises(rule_bundle.RuleBundleError, match='does not match its digest'):
+        rule_bundle.fetch(digest, store, cache_dir)
+    assert not os.listdir(cache_dir)
+
+
+def test_fetch_errors(store, tmp_path):
+    with pytest.raises(rule_bundle.RuleBundleError, match='Not a rule bundle digest'):
+        rule_bundle.fetch('LATEST', store, str(tmp_path / 'cache'))
+    with pytest.raises(rule_bundle.RuleBundleError, match='not found'):
+        rule_bundle.fetch('0' * 64, store, str(tmp_path / 'cache'))
+    with pytest.raises(rule_bundle.RuleBundleError, match='no store was given'):
+        rule_bundle.fetch('0' * 64, None, str(tmp_path / 'cache'))
@@ -0,0 +1,180 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The compliance server (compliance/server.py) on a unix socket answers
+# checks as compliance.runner evaluates the same plan.
+
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from benchmarks import generate
+from compliance import results
+from compliance import rule_bundle
+from compliance import runner
+from compliance import server
+from compliance.engine import Engine
+from tests import CODE_DIR, FEATURES_DIR, scenario_statuses
+
+START_SECONDS = 30
+
+
+def without_durations(features):
+    for feature in features:
+        for scenario in feature['elements']:
+            for step in scenario['steps']:
+                step['result'].pop('duration', None)
+    return features
+
+
+@pytest.fixture(scope='module')
+def plan(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('plan') / 'plan.out.json')
+    generate.write_plan(path, 300, violations=0.2)
+    return path
+
+
+@pytest.fixture
+def features_dir(tmp_path):
+    path = str(tmp_path / 'features')
+    shutil.copytree(FEATURES_DIR, path)
+    return path
+
+
+@pytest.fixture
+def address(tmp_path, features_dir):
+    socket_path = str(tmp_path / 'compliance.sock')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'compliance.server', 'serve', '-f', features_dir, '--socket', socket_path, '--workers', '2', '--poll', '0'],
+        cwd=CODE_DIR, env=dict(os.environ, PYTHONPATH=CODE_DIR)
+    )
+    address = 'unix:' + socket_path
+    deadline = time.monotonic() + START_SECONDS
+    while True:
+        try:
+            server.call(address, 'GET', '/health')
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                pytest.fail('compliance server did not start')
+            time.sleep(0.1)
+    yield address
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(START_SECONDS)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        raise
+    assert not os.path.exists(socket_path)
+
+
+def test_health(address):
+    health = server.call(address, 'GET', '/health')
+
+    assert health['status'] == 'ok'
+    assert health['features'] == 4
+    assert health['workers'] == 2
+
+
+def test_check_plan_body(address, features_dir, plan):
+    with open(plan, 'rb') as f:
+        result = server.call(address, 'POST', '/check', body=f.read())
+    features, resp_code = runner.evaluate_native(Engine.from_directory(features_dir), plan)
+
+    assert result['exit_code'] == resp_code == 1
+    assert without_durations(result['features']) == without_durations(features)
+
+
+def test_check_tags(address, plan):
+    result = server.call(address, 'POST', '/check', {'plan': plan, 'tags': '@security'})
+
+    assert [feature['name'] for feature in result['features']] == ['Service & Data Protection']
+
+
+def test_check_writes_reports(address, plan, tmp_path, capsys):
+    reports_dir = tmp_path / 'reports'
+    resp_code = server.check(address, FEATURES_DIR, plan, str(reports_dir))
+    local_code = runner.run(FEATURES_DIR, plan, str(tmp_path / 'local'))
+
+    assert resp_code == local_code == 1
+    captured = capsys.readouterr()
+    assert 'scenarios (' in captured.out and 'evaluating locally' not in captured.err
+    with open(str(reports_dir / runner.SUMMARY_JSON)) as f:
+        summary = json.load(f)
+    with open(str(tmp_path / 'local' / runner.SUMMARY_JSON)) as f:
+        assert summary['scenarios'] == json.load(f)['scenarios']
+    assert scenario_statuses(results.load_features(str(reports_dir / runner.CUCUMBER_JSON))) == \
+        scenario_statuses(results.load_features(str(tmp_path / 'local' / runner.CUCUMBER_JSON)))
+
+
+def test_check_without_plan(address):
+    with pytest.raises(server.ServerError, match='no plan'):
+        server.call(address, 'POST', '/check')
+
+
+def test_reload(address, features_dir, plan):
+    rules = server.call(address, 'GET', '/health')['rules']
+    assert not server.call(address, 'POST', '/reload')['reloaded']
+
+    with open(os.path.join(features_dir, 'security.feature'), 'a') as f:
+        f.write('\n  Scenario: Validate EBS volume size\n    Given I have aws_ebs_volume defined\n    Then it must contain size\n')
+    reloaded = server.call(address, 'POST', '/reload')
+    result = server.call(address, 'POST', '/check', {'plan': plan})
+
+    assert reloaded['reloaded'] and reloaded['rules'] != rules
+    assert ('Service & Data Protection', 'Validate EBS volume size') in scenario_statuses(result['features'])
+
+
+def test_check_falls_back_to_local_evaluation(plan, tmp_path, capsys):
+    resp_code = server.check('unix:' + str(tmp_path / 'missing.sock'), FEATURES_DIR, plan, str(tmp_path / 'reports'))
+
+    assert resp_code == 1
+    assert 'evaluating locally' in capsys.readouterr().err
+    assert os.path.isfile(str(tmp_path / 'reports' / runner.CUCUMBER_JSON))
+
+
+def test_other_rules_are_refused(address, plan):
+    with pytest.raises(server.RulesMismatch):
+        server.call(address, 'POST', '/check', {'plan': plan, 'rules': '0' * 64})
+
+
+def test_changed_rules_are_evaluated_locally(address, plan, tmp_path, capsys):
+    changed_dir = str(tmp_path / 'changed')
+    shutil.copytree(FEATURES_DIR, changed_dir)
+    with open(os.path.join(changed_dir, 'security.feature'), 'a') as f:
+        f.write('\n  Scenario: Validate EBS volume size\n    Given I have aws_ebs_volume defined\n    Then it must contain size\n')
+    reports_dir = tmp_path / 'reports'
+    resp_code = server.check(address, changed_dir, plan, str(reports_dir))
+
+    assert resp_code == 1
+    assert 'evaluating locally' in capsys.readouterr().err
+    statuses = scenario_statuses(results.load_features(str(reports_dir / runner.CUCUMBER_JSON)))
+    assert ('Service & Data Protection', 'Validate EBS volume size') in statuses
+
+
+def test_rule_bundle_matches_its_features(address, plan, tmp_path, capsys):
+    bundle = str(tmp_path / 'rule-bundle.json')
+    with open(bundle, 'wb') as f:
+        f.write(rule_bundle.encode(rule_bundle.build(FEATURES_DIR)))
+
+    assert server.check(address, bundle, plan, str(tmp_path / 'reports')) == 1
+    assert 'evaluating locally' not in capsys.readouterr().err
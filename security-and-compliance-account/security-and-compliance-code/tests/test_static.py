@@ -0,0 +1,151 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Scenarios compliance/static.py decides from the terraform sources, without
+# a plan, on the test fixtures and on small configurations.
+
+import json
+import os
+import textwrap
+
+import pytest
+
+from compliance import static
+from compliance.engine import Engine
+from compliance.results import FAILED, PASSED, SKIPPED
+from tests import FEATURES_DIR, FIXTURES_DIR
+
+SECURITY = 'Service & Data Protection'
+ENCRYPTION = 'Validate S3 bucket encryption enabled'
+INSTANCE_PROFILE = 'Ensure EC2 have instance profiles'
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return Engine.from_directory(FEATURES_DIR)
+
+
+def decisions(engine, src_dir, variables=()):
+    plan = static.StaticPlan.load(src_dir, static.root_variables(src_dir, variables=variables))
+    feature_results, undecided = static.evaluate(engine, plan)
+    decided = dict(
+        (scenario_result.scenario.name, scenario_result.status)
+        for feature_result in feature_results
+        for scenario_result in feature_result.scenarios
+    )
+    reasons = dict((scenario.name, reason) for _, scenario, reason in undecided)
+    for name in reasons:
+        del decided[name]
+    return decided, reasons
+
+
+def write_module(path, text):
+    os.makedirs(str(path), exist_ok=True)
+    with open(os.path.join(str(path), 'main.tf'), 'w') as f:
+        f.write(textwrap.dedent(text))
+    return str(path)
+
+
+def test_fixtures(engine):
+    decided, reasons = decisions(engine, FIXTURES_DIR, ['region=us-east-1'])
+
+    assert len(decided) == 14 and len(reasons) == 10
+    assert set(decided.values()) == {PASSED}
+    assert reasons[INSTANCE_PROFILE] == 'aws_instance.tf-example-ec2 iam_instance_profile: refers to aws_iam_instance_profile.test_profile.name'
+    assert reasons['Ensure that CloudTrail logs are encrypted'] == 'aws_cloudtrail.foobar kms_key_id: refers to aws_kms_key.mykey.arn'
+    assert reasons['Ensure 1-minute alarms for all critical metrics -- @1.1'].endswith('does not set metric_name, its value comes from the provider')
+
+
+def test_run_writes_static_summary(tmp_path):
+    reports_dir = tmp_path / 'reports'
+    assert static.run(FEATURES_DIR, FIXTURES_DIR, str(reports_dir), variables=['region=us-east-1']) == 0
+
+    with open(str(reports_dir / static.STATIC_JSON)) as f:
+        summary = json.load(f)
+    assert summary['scenarios'] == 24 and summary['decided'] == 14
+    assert len(summary['needs_plan']) == 10
+
+
+def test_failure_is_decided(engine, tmp_path):
+    src_dir = write_module(tmp_path / 'src', '''\
+        variable "encrypt" {
+          default = false
+        }
+
+        resource "aws_s3_bucket" "logs" {
+          bucket = "logs"
+          tags   = { Name = "logs" }
+
+          dynamic "server_side_encryption_configuration" {
+            for_each = var.encrypt ? [1] : []
+            content {
+              rule {
+                apply_server_side_encryption_by_default {
+                  sse_algorithm = "aws:kms"
+                }
+              }
+            }
+          }
+        }
+    ''')
+
+    decided, _ = decisions(engine, src_dir)
+    assert decided[ENCRYPTION] == FAILED
+    assert static.run(FEATURES_DIR, src_dir, str(tmp_path / 'reports')) == 1
+
+    # terraform reads *.auto.tfvars on its own
+    with open(os.path.join(src_dir, 'encrypt.auto.tfvars'), 'w') as f:
+        f.write('encrypt = true\n')
+    decided, _ = decisions(engine, src_dir)
+    assert decided[ENCRYPTION] == PASSED
+
+
+def test_values_of_other_resources_need_a_plan(engine, tmp_path):
+    src_dir = write_module(tmp_path / 'src', '''\
+        resource "aws_iam_instance_profile" "web" {
+          name = "web"
+          role = "web"
+        }
+
+        resource "aws_instance" "web" {
+          ami                  = "ami-12345678"
+          instance_type        = "t3.micro"
+          iam_instance_profile = aws_iam_instance_profile.web.name
+          tags                 = { Name = "web" }
+        }
+    ''')
+
+    decided, reasons = decisions(engine, src_dir)
+    assert INSTANCE_PROFILE not in decided
+    assert reasons[INSTANCE_PROFILE] == 'aws_instance.web iam_instance_profile: refers to aws_iam_instance_profile.web.name'
+    assert decided['Ensure that instance profile resource has role defined'] == PASSED
+    assert decided[ENCRYPTION] == SKIPPED
+
+
+def test_reason_names_the_value_waited_on(engine, tmp_path):
+    src_dir = write_module(tmp_path / 'src', '''\
+        variable "routes" {}
+        variable "tags" {}
+
+        resource "aws_route_table" "private" {
+          vpc_id = "vpc-12345678"
+          route  = var.routes
+          tags   = var.tags
+        }
+    ''')
+
+    _, reasons = decisions(engine, src_dir)
+    assert 'var.tags' in reasons['Ensure that specific tags are defined -- @1.1']
+    assert 'var.routes' not in reasons['Ensure that specific tags are defined -- @1.1']
@@ -0,0 +1,228 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Stack parameters.
+#
+# Each stack reads stacks/<stack>/cdk_stack_param.json on first use, located
+# relative to this package rather than the working directory. A list
+# parameter such as TERRAFORM_APPLICATION_WORKLOADS can instead be given as
+# <NAME>_FILE, a path relative to the parameter file of an inventory in JSON
+# lines (one object per line) or CSV (a header row naming the keys). Inventory
+# files are streamed record by record, and every record is validated against
+# the stack's schema with errors naming the file and line.
+#
+# The validated parameters, with the lists derived from them, are cached in
+# cdk.out/config-cache keyed by the hash of the parameter and inventory files,
+# so an unchanged inventory is not parsed or validated again.
+
+import csv
+import functools
+import hashlib
+import json
+import os
+import pickle
+import re
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(APP_DIR, 'cdk.out', 'config-cache')
+# Bumped whenever the schemas or the derived values change
+CACHE_VERSION = '2'
+
+# Artifact and action names are built from APP_ID
+APP_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Stages BATCH_MODE.ENABLED_STAGES can name
+BATCH_STAGES = ('PullTerraformCode', 'PerformComplianceCheck')
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class Minimum:
+    # An integer of at least minimum
+
+    def __init__(self, minimum):
+        self.minimum = minimum
+
+
+class OneOf:
+    # One of the given values
+
+    def __init__(self, *values):
+        self.values = values
+
+
+# Schemas: key -> (type, required), a nested dict describes an object, a
+# one element list a list of such objects, Minimum and OneOf limit values
+WORKLOAD_SCHEMA = {
+    'GIT_REPO_URL': (str, True),
+    'CROSS_ACCOUNT_ROLE_ARN': (str, True),
+    'APP_ID': (str, True)
+}
+
+WORKLOAD_ACCOUNT_SCHEMA = {
+    'AWS_ACCOUNT_ID': (str, True)
+}
+
+PIPELINE_SCHEMA = {
+    'CODE_COMMIT_SOURCE_REPO_NAME': (str, True),
+    'CODE_COMMIT_SOURCE_REPO_BRANCH': (str, True),
+    'TERRAFORM_APPLICATION_WORKLOADS': ([WORKLOAD_SCHEMA], True),
+    'BATCH_MODE': ({
+        'ENABLED_STAGES': ([OneOf(*BATCH_STAGES)], False),
+        'BATCH_SIZE': (Minimum(1), False)
+    }, False),
+    'SHARDING': ({
+        'SHARD_SIZE': (Minimum(1), False),
+        'SHARDS_PER_PIPELINE': (Minimum(1), False),
+        'CONCURRENCY': (Minimum(0), False)
+    }, False)
+}
+
+CROSS_ACCOUNT_ROLE_SCHEMA = {
+    'TERRAFORM_APPLICATION_WORKLOAD_ACCOUNTS': ([WORKLOAD_ACCOUNT_SCHEMA], True)
+}
+
+
+def validate(value, schema, where):
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            raise ConfigError('{}: expected an object'.format(where))
+        for key, (kind, required) in schema.items():
+            if key not in value:
+                if required:
+                    raise ConfigError('{}: missing {}'.format(where, key))
+                continue
+            validate(value[key], kind, '{}.{}'.format(where, key))
+    elif isinstance(schema, list):
+        if not isinstance(value, list):
+            raise ConfigError('{}: expected a list'.format(where))
+        for index, item in enumerate(value):
+            validate(item, schema[0], '{}[{}]'.format(where, index))
+    elif isinstance(schema, Minimum):
+        validate(value, int, where)
+        if value < schema.minimum:
+            raise ConfigError('{}: expected an integer of at least {}'.format(where, schema.minimum))
+    elif isinstance(schema, OneOf):
+        if value not in schema.values:
+            raise ConfigError('{}: expected one of {}'.format(where, ', '.join(schema.values)))
+    elif not isinstance(value, schema) or (schema is int and isinstance(value, bool)):
+        raise ConfigError('{}: expected {}'.format(where, schema.__name__))
+
+
+def read_inventory(path, schema):
+    # Yields the validated records of a JSON lines or CSV inventory
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            reader = csv.DictReader(f)
+            for record in reader:
+                where = '{}:{}'.format(path, reader.line_num)
+                if None in record:
+                    raise ConfigError('{}: more fields than the header names'.format(where))
+                validate(record, schema, where)
+                yield record
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            where = '{}:{}'.format(path, line_number)
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ConfigError('{}: {}'.format(where, e))
+            validate(record, schema, where)
+            yield record
+
+
+def inventory_files(path, params):
+    # Inventory files referenced by the parameters, by the list parameter they stand for
+    directory = os.path.dirname(path)
+    return dict(
+        (key[:-len('_FILE')], os.path.join(directory, value))
+        for key, value in sorted(params.items()) if key.endswith('_FILE')
+    )
+
+
+def file_hash(paths):
+    digest = hashlib.sha256(CACHE_VERSION.encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def compile_params(path, params, files, schema):
+    for key, inventory_path in files.items():
+        if key in params:
+            raise ConfigError('{}: both {} and {}_FILE are set'.format(path, key, key))
+        kind, _ = schema.get(key, (None, False))
+        if not isinstance(kind, list):
+            raise ConfigError('{}: {}_FILE is not a list parameter'.format(path, key))
+        params[key] = list(read_inventory(inventory_path, kind[0]))
+        del params[key + '_FILE']
+    validate(params, schema, path)
+    return params
+
+
+def load(stack, schema, derive=None):
+    # Validated parameters of stacks/<stack>/cdk_stack_param.json, cached by content
+    path = os.path.join(APP_DIR, 'stacks', stack, 'cdk_stack_param.json')
+    with open(path, 'r') as f:
+        params = json.load(f)
+    files = inventory_files(path, params)
+    cache_path = os.path.join(CACHE_DIR, '{}-{}.pickle'.format(stack, file_hash([path] + list(files.values()))))
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    params = compile_params(path, params, files, schema)
+    if derive:
+        derive(params)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Earlier versions of the parameters are not needed anymore
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith(stack + '-') and name.endswith('.pickle'):
+            os.remove(os.path.join(CACHE_DIR, name))
+    tmp = cache_path + '.' + str(os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(params, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache_path)
+    return params
+
+
+def derive_pipeline(params):
+    app_ids = set()
+    roles = {}
+    for tf_workload in params['TERRAFORM_APPLICATION_WORKLOADS']:
+        if not APP_ID_PATTERN.match(tf_workload['APP_ID']):
+            raise ConfigError('APP_ID {} may only hold letters, digits, _ and -'.format(tf_workload['APP_ID']))
+        if tf_workload['APP_ID'] in app_ids:
+            raise ConfigError('APP_ID {} is used by more than one workload'.format(tf_workload['APP_ID']))
+        app_ids.add(tf_workload['APP_ID'])
+        roles.setdefault(tf_workload['CROSS_ACCOUNT_ROLE_ARN'], None)
+    # Workloads often share a role, the order of first use keeps synth output stable
+    params['CROSS_ACCOUNT_ROLE_ARNS'] = list(roles)
+
+
+@functools.lru_cache(maxsize=None)
+def pipeline_params():
+    return load('pipeline_stack', PIPELINE_SCHEMA, derive_pipeline)
+
+
+@functools.lru_cache(maxsize=None)
+def cross_account_role_params():
+    return load('cross_account_role_stack', CROSS_ACCOUNT_ROLE_SCHEMA)
@@ -24,23 +24,20 @@ from aws_cdk import aws_codepipeline_actions as codepipeline_actions
 import json
 import os
 
-# Pipeline Stack Parameters 
-params = {}
-with open('stacks/cross_account_role_stack/cdk_stack_param.json', 'r') as f:
-  params = json.load(f)
-print(params)
+from stacks import config
 
 
 class CrossAccountRoleStack(core.Stack):
 
-    def __init__(self, scope: core.Construct, id: str, source_repo_arn, **kwargs) -> None:
+    def __init__(self, scope: core.Construct, id: str, source_repo_arn, rule_bundle_objects_arn, pipeline_encryption_key_arn, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
+        # Cross Account Role Stack Parameters, see stacks/config.py
+        params = config.cross_account_role_params()
         #####################################---START---##########################################
         # List of principals to have access for code pull
         principal_list = []
         for account in params['TERRAFORM_APPLICATION_WORKLOAD_ACCOUNTS']:
             principal_list.append(iam.AccountPrincipal(account['AWS_ACCOUNT_ID']))
-        print(principal_list)
 
         # IAM Role for Cross Account Access to the security and compliance account
         cross_account_role = iam.Role(
@@ -68,6 +65,27 @@ class CrossAccountRoleStack(core.Stack):
                     resources = [
                         source_repo_arn
                     ]
+                ),
+                # Workload compliance checks fetch the rule bundles published by MergeCode
+                iam.PolicyStatement(
+                    sid = 'RuleBundleRead',
+                    actions = [
+                        's3:GetObject'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        rule_bundle_objects_arn
+                    ]
+                ),
+                iam.PolicyStatement(
+                    sid = 'RuleBundleDecrypt',
+                    actions = [
+                        'kms:Decrypt'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        pipeline_encryption_key_arn
+                    ]
                 )
             ]
         )        
@@ -17,6 +17,7 @@ from aws_cdk import core
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_kms as kms
 from aws_cdk import aws_s3 as s3
+from aws_cdk import aws_ssm as ssm
 from aws_cdk import aws_codecommit as codecommit
 from aws_cdk import aws_codebuild as codebuild
 from aws_cdk import aws_codepipeline as codepipeline
@@ -24,17 +25,17 @@ from aws_cdk import aws_codepipeline_actions as codepipeline_actions
 import json
 import os
 
-# Pipeline Stack Parameters 
-params = {}
-with open('stacks/pipeline_stack/cdk_stack_param.json', 'r') as f:
-  params = json.load(f)
-print(params)
+from stacks import config
+from stacks.pipeline_stack import sharding
 
 class PipelineStack(core.Stack):
 
     def __init__(self, scope: core.Construct, id: str, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
+        # Pipeline Stack Parameters, see stacks/config.py
+        params = config.pipeline_params()
+
         #####################################---START PREREQS---##########################################
         # Create a new Code Commit Repo for holding compliance code
         source_repo = codecommit.Repository(
@@ -94,11 +95,44 @@ class PipelineStack(core.Stack):
             versioned = True
         )
 
-        # Retrieve cross account role list from params
-        cross_account_role_list = []
-        for tf_workload in params['TERRAFORM_APPLICATION_WORKLOADS']:
-            cross_account_role_list.append(tf_workload['CROSS_ACCOUNT_ROLE_ARN'])
-        print(cross_account_role_list)
+        # Prefix in the pipeline bucket holding cached terraform plans
+        plan_cache_prefix = 'plan-cache'
+        # Prefix in the pipeline bucket holding the shared terraform provider mirror
+        provider_mirror_prefix = 'provider-mirror'
+
+        # Prefix in the pipeline bucket holding the git mirrors of the workload repos
+        git_mirror_prefix = 'git-mirror'
+
+        # Prefix in the pipeline bucket holding the last passing check of every workload repo
+        change_state_prefix = 'change-state'
+
+        # Prefix in the pipeline bucket holding the resource inventory of every checked workload
+        inventory_prefix = 'inventory'
+
+        # Prefix in the pipeline bucket where sibling pipelines record the commits they passed
+        shard_gate_prefix = 'shard-gate'
+
+        # Prefix in the pipeline bucket holding the rule bundles published by MergeCode, see compliance/rule_bundle.py
+        rule_bundle_prefix = 'rule-bundles'
+        # Rule bundles are read by the workload accounts through the cross account role
+        self.rule_bundle_objects_arn = pipeline_bucket.bucket_arn+'/'+rule_bundle_prefix+'/*'
+        self.pipeline_encryption_key_arn = pipeline_encryption_key.key_arn
+
+        # Batch mode: stages listed in BATCH_MODE.ENABLED_STAGES run one action per batch of
+        # BATCH_SIZE workloads instead of one action per workload
+        batch_mode = params.get('BATCH_MODE', {})
+        batch_stages = batch_mode.get('ENABLED_STAGES', [])
+        batch_size = batch_mode.get('BATCH_SIZE', 20)
+        pull_in_batches = 'PullTerraformCode' in batch_stages
+        check_in_batches = 'PerformComplianceCheck' in batch_stages
+        tf_workloads = params['TERRAFORM_APPLICATION_WORKLOADS']
+        workload_batches = [tf_workloads[i:i + batch_size] for i in range(0, len(tf_workloads), batch_size)]
+        # SSM parameters holding the workload list of each batch, action environment variables are limited to 1000 characters
+        batch_parameter_prefix = '/'+params['CODE_COMMIT_SOURCE_REPO_NAME']+'/'+params['CODE_COMMIT_SOURCE_REPO_BRANCH']+'/batch-workloads'
+
+        # Cross account roles of the workloads, each listed once
+        cross_account_role_list = params['CROSS_ACCOUNT_ROLE_ARNS']
+        print(str(len(tf_workloads))+' workloads, '+str(len(cross_account_role_list))+' cross account roles')
         
         # IAM Role for CodePipeline
         code_pipeline_role = iam.Role(
@@ -236,6 +270,117 @@ class PipelineStack(core.Stack):
                         tf_backend_bucket.bucket_arn+'/*'
                     ]
                 ),
+                iam.PolicyStatement(
+                    sid = 'PlanCacheObjectAccess',
+                    actions = [
+                        's3:GetObject*',
+                        's3:PutObject*'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        pipeline_bucket.bucket_arn+'/'+plan_cache_prefix+'/*'
+                    ]
+                ),
+                iam.PolicyStatement(
+                    sid = 'ProviderMirrorObjectAccess',
+                    actions = [
+                        's3:GetObject*',
+                        's3:PutObject*'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        pipeline_bucket.bucket_arn+'/'+provider_mirror_prefix+'/*'
+                    ]
+                ),
+                iam.PolicyStatement(
+                    sid = 'GitMirrorObjectAccess',
+                    actions = [
+                        's3:GetObject*',
+                        's3:PutObject*'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        pipeline_bucket.bucket_arn+'/'+git_mirror_prefix+'/*'
+                    ]
+                ),
+                iam.PolicyStatement(
+                    sid = 'ChangeStateObjectAccess',
+                    actions = [
+                        's3:GetObject*',
+                        's3:PutObject*'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        pipeline_bucket.bucket_arn+'/'+change_state_prefix+'/*'
+                    ]
+                ),
+                iam.PolicyStatement(
+                    sid = 'InventoryObjectAccess',
+                    actions = [
+                        's3:GetObject*',
+                        's3:PutObject*'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        pipeline_bucket.bucket_arn+'/'+inventory_prefix+'/*'
+                    ]
+                ),
+                iam.PolicyStatement(
+                    sid = 'ShardGateObjectAccess',
+                    actions = [
+                        's3:GetObject*',
+                        's3:PutObject*'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        pipeline_bucket.bucket_arn+'/'+shard_gate_prefix+'/*'
+                    ]
+                ),
+                iam.PolicyStatement(
+                    sid = 'ShardGateListAccess',
+                    actions = [
+                        's3:ListBucket'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    conditions = {
+                        'StringLike': {
+                            's3:prefix': [
+                                shard_gate_prefix+'/*'
+                            ]
+                        }
+                    },
+                    resources = [
+                        pipeline_bucket.bucket_arn
+                    ]
+                ),
+                iam.PolicyStatement(
+                    sid = 'RuleBundleObjectAccess',
+                    actions = [
+                        's3:GetObject*',
+                        's3:PutObject*'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        pipeline_bucket.bucket_arn+'/'+rule_bundle_prefix+'/*'
+                    ]
+                ),
+                iam.PolicyStatement(
+                    sid = 'RuleBundleListAccess',
+                    actions = [
+                        's3:ListBucket'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    conditions = {
+                        'StringLike': {
+                            's3:prefix': [
+                                rule_bundle_prefix+'/*'
+                            ]
+                        }
+                    },
+                    resources = [
+                        pipeline_bucket.bucket_arn
+                    ]
+                ),
                 iam.PolicyStatement(
                     sid = 'CodeCommitAccessPolicy',
                     actions = [
@@ -285,6 +430,20 @@ class PipelineStack(core.Stack):
             ]
         )
 
+        if pull_in_batches:
+            code_build_policy.add_statements(
+                iam.PolicyStatement(
+                    sid = 'BatchWorkloadParameterAccess',
+                    actions = [
+                        'ssm:GetParameters'
+                    ],
+                    effect = iam.Effect.ALLOW,
+                    resources = [
+                        'arn:aws:ssm:'+core.Aws.REGION+':'+core.Aws.ACCOUNT_ID+':parameter'+batch_parameter_prefix+'/*'
+                    ]
+                )
+            )
+
         # CodePipeline Encryption Key Policy
         pipeline_encryption_key.add_to_resource_policy(
             statement = iam.PolicyStatement(
@@ -410,6 +569,40 @@ class PipelineStack(core.Stack):
             role = code_build_role
         )
 
+        # Create code build projects for pulling and checking workloads in batches
+        if pull_in_batches:
+            code_build_code_pull_batch = codebuild.PipelineProject(
+                self,
+                'CodeBuildForCodePullBatch',
+                build_spec = codebuild.BuildSpec.from_source_filename('buildspec-code-pull-batch.yml'),
+                description = 'CodeBuild project for pulling a batch of remote terraform workload repos',
+                environment = codebuild.BuildEnvironment(
+                    build_image = codebuild.LinuxBuildImage.from_code_build_image_id(
+                        'aws/codebuild/amazonlinux2-x86_64-standard:3.0'
+                    ),
+                    compute_type = codebuild.ComputeType.SMALL
+                ),
+                project_name = 'cb-code-pull-batch-'+params['CODE_COMMIT_SOURCE_REPO_NAME']+'-'+params['CODE_COMMIT_SOURCE_REPO_BRANCH'],
+                role = code_build_role
+            )
+
+        if check_in_batches:
+            # Plans of the batch run concurrently, give them more cores
+            code_build_compliance_check_batch = codebuild.PipelineProject(
+                self,
+                'CodeBuildForComplianceCheckBatch',
+                build_spec = codebuild.BuildSpec.from_source_filename('buildspec-compliance-check-batch.yml'),
+                description = 'CodeBuild project for carrying out compliance checks on a batch of terraform workload repos',
+                environment = codebuild.BuildEnvironment(
+                    build_image = codebuild.LinuxBuildImage.from_code_build_image_id(
+                        'aws/codebuild/amazonlinux2-x86_64-standard:3.0'
+                    ),
+                    compute_type = codebuild.ComputeType.MEDIUM
+                ),
+                project_name = 'cb-compliance-check-batch-'+params['CODE_COMMIT_SOURCE_REPO_NAME']+'-'+params['CODE_COMMIT_SOURCE_REPO_BRANCH'],
+                role = code_build_role
+            )
+
         # Create code build project for merging compliance code into main branch
         code_build_code_merge = codebuild.PipelineProject(
             self,
@@ -426,114 +619,306 @@ class PipelineStack(core.Stack):
             role = code_build_role
         )
 
-        # Create CodePipeline for compliance check
-        pipeline = codepipeline.Pipeline(
-            self,
-            'SecurityAndCompliancePipeline',
-            artifact_bucket = pipeline_bucket,
-            pipeline_name = 'pipeline-'+params['CODE_COMMIT_SOURCE_REPO_NAME']+'-'+params['CODE_COMMIT_SOURCE_REPO_BRANCH'],
-            role = code_pipeline_role
-        )
+        # Shard the pulled units over stages and sibling pipelines, see sharding.py
+        # A unit is a batch of workloads in batch mode and a single workload otherwise
+        sharding_params = params.get('SHARDING', {})
+        pull_units = workload_batches if pull_in_batches else [[tf_workload] for tf_workload in tf_workloads]
+        # Batches pulled as one unit but checked per workload add one check action per workload
+        check_actions = [len(unit) if pull_in_batches and not check_in_batches else 1 for unit in pull_units]
+        try:
+            pipeline_shards = sharding.shard(
+                list(range(len(pull_units))),
+                sharding_params.get('SHARD_SIZE', sharding.MAX_ACTIONS_PER_STAGE),
+                sharding_params.get('SHARDS_PER_PIPELINE', sharding.MAX_SHARDS_PER_PIPELINE),
+                check_actions
+            )
+        except ValueError as e:
+            if pull_in_batches and not check_in_batches:
+                raise ValueError(str(e)+', lower BATCH_MODE.BATCH_SIZE or add PerformComplianceCheck to BATCH_MODE.ENABLED_STAGES')
+            raise
+        concurrency = sharding_params.get('CONCURRENCY', 0)
+        shard_count = sum(len(shards) for shards in pipeline_shards)
+        tf_code_artifact_name_prefix = "tf_code_"
+        shard_index = 0
+        check_batch_index = 0
+        for pipeline_index, shards in enumerate(pipeline_shards):
+            # Create CodePipeline for compliance check
+            pipeline = codepipeline.Pipeline(
+                self,
+                'SecurityAndCompliancePipeline'+('' if pipeline_index == 0 else 'Shard'+str(pipeline_index)),
+                artifact_bucket = pipeline_bucket,
+                pipeline_name = 'pipeline-'+params['CODE_COMMIT_SOURCE_REPO_NAME']+'-'+params['CODE_COMMIT_SOURCE_REPO_BRANCH']+sharding.pipeline_suffix(pipeline_index),
+                role = code_pipeline_role
+            )
 
-        # Add CodeCommit source repo as the action
-        pipeline.add_stage(
-            stage_name = 'Source',
-            actions = [
-                codepipeline_actions.CodeCommitSourceAction(
-                    action_name = "Source",
-                    output = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
-                    repository = source_repo,
-                    branch = params['CODE_COMMIT_SOURCE_REPO_BRANCH'],
-                    trigger = codepipeline_actions.CodeCommitTrigger.EVENTS
-                )
-            ]
-        )
+            # Add CodeCommit source repo as the action
+            pipeline.add_stage(
+                stage_name = 'Source',
+                actions = [
+                    codepipeline_actions.CodeCommitSourceAction(
+                        action_name = "Source",
+                        output = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
+                        repository = source_repo,
+                        branch = params['CODE_COMMIT_SOURCE_REPO_BRANCH'],
+                        trigger = codepipeline_actions.CodeCommitTrigger.EVENTS
+                    )
+                ]
+            )
 
-        # Add stage to pull terraform source workload
-        tf_code_artifact_name_prefix = "tf_code_"
-        pull_tf_code_stage = pipeline.add_stage(stage_name = 'PullTerraformCode')
-        for tf_workload in params['TERRAFORM_APPLICATION_WORKLOADS']:
-            pull_tf_code_stage.add_action(
-                codepipeline_actions.CodeBuildAction(
-                    input = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
-                    project = code_build_code_pull,
-                    environment_variables = {
-                        'CROSS_ACCOUNT_ROLE': codebuild.BuildEnvironmentVariable(
-                            value = tf_workload['CROSS_ACCOUNT_ROLE_ARN'],
-                            type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
-                        ),
-                        'TF_WOKLOAD_REPO_URL': codebuild.BuildEnvironmentVariable(
-                            value = tf_workload['GIT_REPO_URL'],
-                            type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            for shard in shards:
+                stage_suffix = sharding.stage_suffix(shard_index, shard_count)
+                shard_index += 1
+
+                # Add stage to pull terraform source workload
+                pull_tf_code_stage = pipeline.add_stage(stage_name = 'PullTerraformCode'+stage_suffix)
+                # Artifact and subdirectory holding the source of each workload
+                workload_sources = {}
+                for batch_index, run_order in zip(shard, sharding.run_orders(len(shard), concurrency)):
+                    batch = pull_units[batch_index]
+                    if pull_in_batches:
+                        batch_workloads = json.dumps(batch, separators = (',', ':'))
+                        if len(batch_workloads) > 4096:
+                            raise ValueError('Workload list of batch '+str(batch_index)+' exceeds the 4KB SSM parameter limit, lower BATCH_MODE.BATCH_SIZE')
+                        batch_parameter = ssm.StringParameter(
+                            self,
+                            'BatchWorkloads'+str(batch_index),
+                            parameter_name = batch_parameter_prefix+'/'+str(batch_index),
+                            string_value = batch_workloads,
+                            description = 'Terraform workloads pulled by batch '+str(batch_index)
                         )
+                        batch_artifact_name = tf_code_artifact_name_prefix+'batch'+str(batch_index)
+                        pull_tf_code_stage.add_action(
+                            codepipeline_actions.CodeBuildAction(
+                                input = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
+                                project = code_build_code_pull_batch,
+                                environment_variables = {
+                                    'TF_WORKLOADS': codebuild.BuildEnvironmentVariable(
+                                        value = batch_parameter.parameter_name,
+                                        type = codebuild.BuildEnvironmentVariableType.PARAMETER_STORE
+                                    ),
+                                    'GIT_MIRROR_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+git_mirror_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'CHANGE_STATE_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+change_state_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    )
+                                },
+                                outputs = [
+                                    codepipeline.Artifact(artifact_name = batch_artifact_name)
+                                ],
+                                type = codepipeline_actions.CodeBuildActionType.BUILD,
+                                action_name = 'PullCode_Batch'+str(batch_index),
+                                run_order = run_order
+                            )
+                        )
+                        for tf_workload in batch:
+                            workload_sources[tf_workload['APP_ID']] = (batch_artifact_name, tf_workload['APP_ID'])
+                    else:
+                        tf_workload = batch[0]
+                        pull_tf_code_stage.add_action(
+                            codepipeline_actions.CodeBuildAction(
+                                input = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
+                                project = code_build_code_pull,
+                                environment_variables = {
+                                    'CROSS_ACCOUNT_ROLE': codebuild.BuildEnvironmentVariable(
+                                        value = tf_workload['CROSS_ACCOUNT_ROLE_ARN'],
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'TF_WOKLOAD_REPO_URL': codebuild.BuildEnvironmentVariable(
+                                        value = tf_workload['GIT_REPO_URL'],
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'GIT_MIRROR_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+git_mirror_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'CHANGE_STATE_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+change_state_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    # Change state is kept per workload, see compliance/change_state.py
+                                    'TF_APP_ID': codebuild.BuildEnvironmentVariable(
+                                        value = tf_workload['APP_ID'],
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    )
+                                },
+                                outputs = [
+                                    codepipeline.Artifact(artifact_name = tf_code_artifact_name_prefix+tf_workload['APP_ID'])
+                                ],
+                                type = codepipeline_actions.CodeBuildActionType.BUILD,
+                                action_name = 'PullCode_'+tf_workload['APP_ID'],
+                                run_order = run_order
+                            )
+                        )
+                        workload_sources[tf_workload['APP_ID']] = (tf_code_artifact_name_prefix+tf_workload['APP_ID'], '')
 
-                    },
-                    outputs = [
-                        codepipeline.Artifact(artifact_name = tf_code_artifact_name_prefix+tf_workload['APP_ID'])
-                    ],
-                    type = codepipeline_actions.CodeBuildActionType.BUILD,
-                    action_name = 'PullCode_'+tf_workload['APP_ID'],
-                    run_order = 10
-                )
-            )
-        
-        # Add stage to perform compliance check on terraform source workload
-        compliance_check_stage = pipeline.add_stage(stage_name = 'PerformComplianceCheck')
-        for tf_workload in params['TERRAFORM_APPLICATION_WORKLOADS']:
-            compliance_check_stage.add_action(
-                codepipeline_actions.CodeBuildAction(
-                    input = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
-                    project = code_build_compliance_check,
-                    environment_variables = {
-                        'TF_SOURCE_CODE_FOLDER': codebuild.BuildEnvironmentVariable(
-                            value = 'CODEBUILD_SRC_DIR_'+tf_code_artifact_name_prefix+tf_workload['APP_ID'],
-                            type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
-                        ),
-                        'TF_BACKEND_S3_BUCKET': codebuild.BuildEnvironmentVariable(
-                            value = tf_backend_bucket.bucket_name,
-                            type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                # Add stage to perform compliance check on terraform source workload
+                compliance_check_stage = pipeline.add_stage(stage_name = 'PerformComplianceCheck'+stage_suffix)
+                shard_workloads = [tf_workload for batch_index in shard for tf_workload in pull_units[batch_index]]
+                if check_in_batches:
+                    # A CodeBuild action takes at most 5 input artifacts: the compliance code and 4 workload artifacts
+                    # unless the workloads were pulled in batches as well
+                    check_batches = [pull_units[batch_index] for batch_index in shard] if pull_in_batches else [shard_workloads[i:i + min(batch_size, 4)] for i in range(0, len(shard_workloads), min(batch_size, 4))]
+                    for batch, run_order in zip(check_batches, sharding.run_orders(len(check_batches), concurrency)):
+                        batch_artifact_names = []
+                        batch_sources = []
+                        for tf_workload in batch:
+                            artifact_name, subdir = workload_sources[tf_workload['APP_ID']]
+                            if artifact_name in batch_artifact_names:
+                                continue
+                            batch_artifact_names.append(artifact_name)
+                            # A batch artifact holds one workload per subdirectory
+                            if subdir:
+                                batch_sources.append('CODEBUILD_SRC_DIR_'+artifact_name)
+                            else:
+                                batch_sources.append(tf_workload['APP_ID']+':CODEBUILD_SRC_DIR_'+artifact_name)
+                        compliance_check_stage.add_action(
+                            codepipeline_actions.CodeBuildAction(
+                                input = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
+                                project = code_build_compliance_check_batch,
+                                environment_variables = {
+                                    'TF_BATCH_SOURCES': codebuild.BuildEnvironmentVariable(
+                                        value = ' '.join(batch_sources),
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'TF_BACKEND_S3_BUCKET': codebuild.BuildEnvironmentVariable(
+                                        value = tf_backend_bucket.bucket_name,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'PLAN_CACHE_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+plan_cache_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'PROVIDER_MIRROR_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+provider_mirror_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'CHANGE_STATE_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+change_state_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'INVENTORY_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+inventory_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    )
+                                },
+                                extra_inputs = [
+                                    codepipeline.Artifact(artifact_name = artifact_name) for artifact_name in batch_artifact_names
+                                ],
+                                outputs = [
+                                    codepipeline.Artifact(artifact_name = 'report_batch'+str(check_batch_index))
+                                ],
+                                type = codepipeline_actions.CodeBuildActionType.BUILD,
+                                action_name = 'ComplianceCheck_Batch'+str(check_batch_index),
+                                run_order = run_order
+                            )
                         )
-                    },
-                    extra_inputs = [
-                        codepipeline.Artifact(artifact_name = tf_code_artifact_name_prefix+tf_workload['APP_ID'])
-                    ],
-                    outputs = [
-                        codepipeline.Artifact(artifact_name = 'report_'+tf_workload['APP_ID'])
-                    ],
-                    type = codepipeline_actions.CodeBuildActionType.BUILD,
-                    action_name = 'ComplianceCheck_'+tf_workload['APP_ID'],
-                    run_order = 10
+                        check_batch_index += 1
+                else:
+                    for tf_workload, run_order in zip(shard_workloads, sharding.run_orders(len(shard_workloads), concurrency)):
+                        artifact_name, subdir = workload_sources[tf_workload['APP_ID']]
+                        compliance_check_stage.add_action(
+                            codepipeline_actions.CodeBuildAction(
+                                input = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
+                                project = code_build_compliance_check,
+                                environment_variables = {
+                                    'TF_SOURCE_CODE_FOLDER': codebuild.BuildEnvironmentVariable(
+                                        value = 'CODEBUILD_SRC_DIR_'+artifact_name,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'TF_SOURCE_CODE_SUBDIR': codebuild.BuildEnvironmentVariable(
+                                        value = subdir,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'TF_BACKEND_S3_BUCKET': codebuild.BuildEnvironmentVariable(
+                                        value = tf_backend_bucket.bucket_name,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'PLAN_CACHE_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+plan_cache_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'PROVIDER_MIRROR_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+provider_mirror_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'CHANGE_STATE_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+change_state_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'INVENTORY_STORE': codebuild.BuildEnvironmentVariable(
+                                        value = 's3://'+pipeline_bucket.bucket_name+'/'+inventory_prefix,
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    ),
+                                    'TF_APP_ID': codebuild.BuildEnvironmentVariable(
+                                        value = tf_workload['APP_ID'],
+                                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                                    )
+                                },
+                                extra_inputs = [
+                                    codepipeline.Artifact(artifact_name = artifact_name)
+                                ],
+                                outputs = [
+                                    codepipeline.Artifact(artifact_name = 'report_'+tf_workload['APP_ID'])
+                                ],
+                                type = codepipeline_actions.CodeBuildActionType.BUILD,
+                                action_name = 'ComplianceCheck_'+tf_workload['APP_ID'],
+                                run_order = run_order
+                            )
+                        )
+
+            # Add stage to merge the compliance code once it passed for every workload
+            merge_environment_variables = {
+                'CODE_COMMIT_SOURCE_REPO_NAME': codebuild.BuildEnvironmentVariable(
+                    value = params['CODE_COMMIT_SOURCE_REPO_NAME'],
+                    type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                ),
+                'CODE_COMMIT_SOURCE_BRANCH': codebuild.BuildEnvironmentVariable(
+                    value = params['CODE_COMMIT_SOURCE_REPO_BRANCH'],
+                    type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                ),
+                'CODE_COMMIT_TARGET_BRANCH': codebuild.BuildEnvironmentVariable(
+                    value = 'main',
+                    type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                ),
+                # The merged rules are published there as a rule bundle pinned by the workload pipelines
+                'RULE_BUNDLE_STORE': codebuild.BuildEnvironmentVariable(
+                    value = 's3://'+pipeline_bucket.bucket_name+'/'+rule_bundle_prefix,
+                    type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
                 )
-            )
-        
-        # Add stage to perform compliance check on terraform source workload
-        code_merge_stage = pipeline.add_stage(stage_name = 'MergeCode')
-        code_merge_stage.add_action(
-            codepipeline_actions.CodeBuildAction(
-                input = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
-                project = code_build_code_merge,
-                environment_variables = {
-                    'CODE_COMMIT_SOURCE_REPO_NAME': codebuild.BuildEnvironmentVariable(
-                        value = params['CODE_COMMIT_SOURCE_REPO_NAME'],
+            }
+            if len(pipeline_shards) > 1:
+                # Sibling pipelines record their pass for the commit, the one completing the set merges
+                merge_environment_variables.update({
+                    'SHARD_GATE_STORE': codebuild.BuildEnvironmentVariable(
+                        value = 's3://'+pipeline_bucket.bucket_name+'/'+shard_gate_prefix,
                         type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
                     ),
-                    'CODE_COMMIT_SOURCE_BRANCH': codebuild.BuildEnvironmentVariable(
-                        value = params['CODE_COMMIT_SOURCE_REPO_BRANCH'],
+                    'SHARD_ID': codebuild.BuildEnvironmentVariable(
+                        value = str(pipeline_index),
                         type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
                     ),
-                    'CODE_COMMIT_TARGET_BRANCH': codebuild.BuildEnvironmentVariable(
-                        value = 'main',
+                    'SHARD_COUNT': codebuild.BuildEnvironmentVariable(
+                        value = str(len(pipeline_shards)),
                         type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
                     )
-                },
-                outputs = [
-                    codepipeline.Artifact(artifact_name = 'merge_response')
-                ],
-                type = codepipeline_actions.CodeBuildActionType.BUILD,
-                action_name = 'CodeMerge',
-                run_order = 10
+                })
+            code_merge_stage = pipeline.add_stage(stage_name = 'MergeCode')
+            code_merge_stage.add_action(
+                codepipeline_actions.CodeBuildAction(
+                    input = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
+                    project = code_build_code_merge,
+                    environment_variables = merge_environment_variables,
+                    outputs = [
+                        codepipeline.Artifact(artifact_name = 'merge_response')
+                    ],
+                    type = codepipeline_actions.CodeBuildActionType.BUILD,
+                    action_name = 'CodeMerge',
+                    run_order = 10
+                )
             )
-        )
 
         ########################### List of Outputs ##########################
         core.CfnOutput(
@@ -0,0 +1,71 @@
+# Copyright 2019-2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Layout of the workload actions over stages and pipelines.
+#
+# CodePipeline takes at most 50 actions per stage and 50 stages per pipeline.
+# The units pulled by the pipeline (workloads, or batches of them in batch
+# mode) are cut into shards of at most SHARD_SIZE actions per stage, each
+# shard gets its own pull and compliance check stages. A unit adds one pull
+# action, but a batch pulled as one unit and checked per workload adds one
+# check action per workload, so shards are sized by the actions of their
+# busiest stage. Shards beyond SHARDS_PER_PIPELINE go to
+# sibling pipelines running next to the first one. CONCURRENCY caps the
+# actions of a stage running at once by spreading them over run orders.
+#
+# The layout only depends on the order of the units, so synth output is
+# stable for an unchanged parameter file.
+
+MAX_ACTIONS_PER_STAGE = 50
+MAX_STAGES_PER_PIPELINE = 50
+# Source and MergeCode stages besides the two stages of each shard
+MAX_SHARDS_PER_PIPELINE = (MAX_STAGES_PER_PIPELINE - 2) // 2
+# Run order of the first wave, as used by every other action of the pipelines
+FIRST_RUN_ORDER = 10
+
+
+def run_orders(count, concurrency):
+    # Run order of each of count actions so that at most concurrency of them run at once
+    if concurrency <= 0:
+        return [FIRST_RUN_ORDER] * count
+    return [FIRST_RUN_ORDER * (1 + i // concurrency) for i in range(count)]
+
+
+def shard(units, shard_size, shards_per_pipeline, weights=None):
+    # Returns the units of every shard grouped by pipeline: [[[unit]]]
+    # weights are the actions each unit adds to the busiest stage of its shard, one by default
+    if not 0 < shard_size <= MAX_ACTIONS_PER_STAGE:
+        raise ValueError('SHARDING.SHARD_SIZE must be between 1 and '+str(MAX_ACTIONS_PER_STAGE))
+    if not 0 < shards_per_pipeline <= MAX_SHARDS_PER_PIPELINE:
+        raise ValueError('SHARDING.SHARDS_PER_PIPELINE must be between 1 and '+str(MAX_SHARDS_PER_PIPELINE))
+    shards = [[]]
+    size = 0
+    for unit, weight in zip(units, weights or [1] * len(units)):
+        if weight > shard_size:
+            raise ValueError('Unit '+str(unit)+' needs '+str(weight)+' actions in one stage, more than SHARDING.SHARD_SIZE ('+str(shard_size)+')')
+        if size + weight > shard_size:
+            shards.append([])
+            size = 0
+        shards[-1].append(unit)
+        size += weight
+    return [shards[i:i + shards_per_pipeline] for i in range(0, len(shards), shards_per_pipeline)]
+
+
+def stage_suffix(shard_index, shard_count):
+    # A single shard keeps the plain stage names
+    return '' if shard_count == 1 else '_'+str(shard_index)
+
+
+def pipeline_suffix(pipeline_index):
+    return '' if pipeline_index == 0 else '-shard'+str(pipeline_index)
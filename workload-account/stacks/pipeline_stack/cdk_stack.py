@@ -644,28 +644,68 @@ class PipelineStack(core.Stack):
 
         # Add stage to pull compliance source code and run compliance check
         tf_code_artifact_name_prefix = "tf_code_"
+        compliance_verdict_prefix = 'compliance-verdicts'
+        # Terraform providers shared by the compliance check and the deployment
+        provider_mirror_prefix = 'provider-mirror'
+        # Git mirror of the compliance repo pulled by the compliance check and the deployment
+        git_mirror_prefix = 'git-mirror'
+        # Output of the compliance check, holds the reports and the checked plan handed off to the deployment
+        compliance_check_artifact = codepipeline.Artifact(artifact_name = tf_code_artifact_name_prefix+params['COMPLIANCE_CODE']['ID'])
         pull_tf_code_stage = pipeline.add_stage(stage_name = 'RunComplianceCheck')
+        compliance_environment_variables = {
+            'CROSS_ACCOUNT_ROLE': codebuild.BuildEnvironmentVariable(
+                value = cross_account_role,
+                type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            ),
+            'COMPLIANCE_REPO_URL': codebuild.BuildEnvironmentVariable(
+                value = params['COMPLIANCE_CODE']['GIT_REPO_URL'],
+                type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            ),
+            'WORLOAD_STATEFILE_BUCKET_NAME': codebuild.BuildEnvironmentVariable(
+                value = statefile_bucket.bucket_name,
+                type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            ),
+            'PROVIDER_MIRROR_STORE': codebuild.BuildEnvironmentVariable(
+                value = 's3://'+statefile_bucket.bucket_name+'/'+provider_mirror_prefix,
+                type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            ),
+            'GIT_MIRROR_STORE': codebuild.BuildEnvironmentVariable(
+                value = 's3://'+statefile_bucket.bucket_name+'/'+git_mirror_prefix,
+                type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            ),
+            # Verdicts of the previous compliance run, used to only re-evaluate changed resources
+            'COMPLIANCE_VERDICT_STORE': codebuild.BuildEnvironmentVariable(
+                value = 's3://'+statefile_bucket.bucket_name+'/'+compliance_verdict_prefix,
+                type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            ),
+            # Scenarios the terraform sources decide are checked before terraform init and plan (compliance/static.py)
+            'COMPLIANCE_STATIC_CHECK': codebuild.BuildEnvironmentVariable(
+                value = 'true',
+                type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            )
+        }
+        # Rules pinned to a rule bundle published by the MergeCode stage of the compliance pipeline
+        # (compliance/rule_bundle.py), remote_pull_repo.sh then only pulls the compliance code
+        rule_bundle = params['COMPLIANCE_CODE'].get('RULE_BUNDLE')
+        if rule_bundle:
+            compliance_environment_variables.update({
+                'RULE_BUNDLE_STORE': codebuild.BuildEnvironmentVariable(
+                    value = rule_bundle['STORE'],
+                    type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                ),
+                'RULE_BUNDLE_DIGEST': codebuild.BuildEnvironmentVariable(
+                    value = rule_bundle['DIGEST'],
+                    type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                )
+            })
         #for tf_workload in params['TERRAFORM_APPLICATION_WORKLOAD_LIST']:
         pull_tf_code_stage.add_action(
             codepipeline_actions.CodeBuildAction(
                 input = codepipeline.Artifact(artifact_name = 'SourceArtifact'),
                 project = code_build_compliance_run,
-                environment_variables = {
-                    'CROSS_ACCOUNT_ROLE': codebuild.BuildEnvironmentVariable(
-                        value = cross_account_role,
-                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
-                    ),
-                    'COMPLIANCE_REPO_URL': codebuild.BuildEnvironmentVariable(
-                        value = params['COMPLIANCE_CODE']['GIT_REPO_URL'],
-                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
-                    ),
-                    'WORLOAD_STATEFILE_BUCKET_NAME': codebuild.BuildEnvironmentVariable(
-                        value = statefile_bucket.bucket_name,
-                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
-                    )
-                },
+                environment_variables = compliance_environment_variables,
                 outputs = [
-                    codepipeline.Artifact(artifact_name = tf_code_artifact_name_prefix+params['COMPLIANCE_CODE']['ID'])
+                    compliance_check_artifact
                 ],
                 type = codepipeline_actions.CodeBuildActionType.BUILD,
                 action_name = 'RunCompliance_'+params['COMPLIANCE_CODE']['ID'],
@@ -692,8 +732,24 @@ class PipelineStack(core.Stack):
                     'WORLOAD_STATEFILE_BUCKET_NAME': codebuild.BuildEnvironmentVariable(
                         value = statefile_bucket.bucket_name,
                         type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                    ),
+                    'PROVIDER_MIRROR_STORE': codebuild.BuildEnvironmentVariable(
+                        value = 's3://'+statefile_bucket.bucket_name+'/'+provider_mirror_prefix,
+                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                    ),
+                    'GIT_MIRROR_STORE': codebuild.BuildEnvironmentVariable(
+                        value = 's3://'+statefile_bucket.bucket_name+'/'+git_mirror_prefix,
+                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                    ),
+                    # Secondary input holding the checked plan, found by workload-deploy.sh as CODEBUILD_SRC_DIR_<artifact name>
+                    'PLAN_HANDOFF_ARTIFACT': codebuild.BuildEnvironmentVariable(
+                        value = compliance_check_artifact.artifact_name,
+                        type = codebuild.BuildEnvironmentVariableType.PLAINTEXT
                     )
                 },
+                extra_inputs = [
+                    compliance_check_artifact
+                ],
                 outputs = [
                     codepipeline.Artifact(artifact_name = tf_code_artifact_name_prefix2+params['COMPLIANCE_CODE']['ID'])
                 ],
@@ -6,6 +6,53 @@ arg_tag=$1
 [ -n "${AWS_DEFAULT_REGION}" ] || { echo "AWS_DEFAULT_REGION environment variable not defined"; exit 1; }
 [ -n "${WORLOAD_STATEFILE_BUCKET_NAME}" ] || { echo "WORLOAD_STATEFILE_BUCKET_NAME environment variable not defined"; exit 1; }
 
+# Providers come from the shared mirror when it can be set up, otherwise terraform downloads them
+export PYTHONPATH=$(pwd)/security-and-compliance-code
+eval "$(python3 -m compliance.provider_mirror env ./src ${PROVIDER_MIRROR_STORE:+--store $PROVIDER_MIRROR_STORE})"
+
+# Rules come from the pinned rule bundle when remote_pull_repo.sh fetched one, otherwise from the feature files
+var_rules=security-and-compliance-code/src/
+if [ -f security-and-compliance-code/rule-bundle.json ]
+then
+  var_rules=security-and-compliance-code/rule-bundle.json
+fi
+
+# Scenarios the terraform sources decide on their own are checked first, without terraform init and plan.
+# A failure there fails the check right away, the others are left to the plan, see compliance/static.py.
+# Every environment of COMPLIANCE_ENVIRONMENTS is decided with its own var files and workspace
+if [[ $COMPLIANCE_STATIC_CHECK == "true" ]]
+then
+  if [[ $COMPLIANCE_ENVIRONMENTS != "" ]]
+  then
+    python3 -m compliance.multi_env static -f $var_rules -d ./src -o ./reports ${arg_tag:+--tags $arg_tag}
+  else
+    python3 -m compliance.static -f $var_rules -d ./src -o ./reports --var "region=${AWS_DEFAULT_REGION}" ${arg_tag:+--tags $arg_tag}
+  fi
+  if [ $? != 0 ]
+  then
+    echo Failure
+    python3 -m compliance.report -f ./reports/test.json -o ./reports
+    exit 1
+  fi
+fi
+
+# Environments listed in COMPLIANCE_ENVIRONMENTS (e.g. "env/dev.tfvars@dev env/prod.tfvars@prod") are planned
+# concurrently and checked with one rule compilation and one combined report, see compliance/multi_env.py.
+# The plan of every passing environment is handed off under ./handoff/<ENVIRONMENT>, the deployment applies
+# the one named by DEPLOY_ENVIRONMENT
+if [[ $COMPLIANCE_ENVIRONMENTS != "" ]]
+then
+  echo "Compliance check requested for environments $COMPLIANCE_ENVIRONMENTS"
+  python3 -m compliance.multi_env check -f $var_rules -d ./src -o ./reports --handoff ./handoff ${arg_tag:+--tags $arg_tag}
+  if [ $? == 0 ]
+  then
+    echo Success
+    exit 0
+  fi
+  echo Failure
+  exit 1
+fi
+
 # Create Terraform Plan
 cd ./src
 terraform init \
@@ -15,16 +62,28 @@ terraform init \
 terraform plan -var "region=${AWS_DEFAULT_REGION}" -out="plan.out"
 
 # Check for compliance
+# The plan is evaluated once and the cucumber json, bdd xml and summary reports are all written from that run
+# When COMPLIANCE_VERDICT_STORE is set only the resources changed since the previous run are evaluated again
 cd ../
+var_runner_args=""
+# A running compliance server (COMPLIANCE_SERVER=unix:<socket> or host:port) evaluates with rules it already loaded,
+# see compliance/server.py. The check falls back to a local evaluation when it is not reachable or holds other rules
+var_runner="compliance.runner"
+if [[ $COMPLIANCE_SERVER != "" ]]
+then
+  var_runner="compliance.server check --server $COMPLIANCE_SERVER"
+fi
+if [[ $COMPLIANCE_VERDICT_STORE != "" ]]
+then
+  var_runner_args="--verdict-store $COMPLIANCE_VERDICT_STORE"
+fi
 if [[ $arg_tag != "" ]]
 then
   echo "Compliance check requested for tag $arg_tag"
-  terraform-compliance -f security-and-compliance-code/src/ -p ./src/plan.out --cucumber-json=./reports/test.json --tags $arg_tag
-  terraform-compliance -f security-and-compliance-code/src/ -p ./src/plan.out --bdd-xml=./reports/test.xml --tags $arg_tag
+  python3 -m $var_runner -f $var_rules -p ./src/plan.out -o ./reports --tags $arg_tag $var_runner_args
 else
   echo "Compliance check requested for all tags"
-  terraform-compliance -f security-and-compliance-code/src/ -p ./src/plan.out --cucumber-json=./reports/test.json
-  terraform-compliance -f security-and-compliance-code/src/ -p ./src/plan.out --bdd-xml=./reports/test.xml
+  python3 -m $var_runner -f $var_rules -p ./src/plan.out -o ./reports $var_runner_args
 fi
 
 # Handle reponse
@@ -32,13 +91,15 @@ var_resp_code=$?
 if [ $var_resp_code == 0 ]
 then
   echo Success
-  sed -i 's/\.[0-9]*,/,/g' ./reports/test.json
-  java -jar ./lib/cucumber-sandwich.jar -f ./reports -o ./reports -n
+  python3 -m compliance.report -f ./reports/test.json -o ./reports
+  # Hand the checked plan off to the deployment, which applies it instead of planning again
+  python3 -m compliance.plan_handoff publish ./src --dest ./handoff \
+    --var "region=${AWS_DEFAULT_REGION}" \
+    --backend-bucket "${WORLOAD_STATEFILE_BUCKET_NAME}"
   exit 0
 else
   echo Failure
-  sed -i 's/\.[0-9]*,/,/g' ./reports/test.json
-  java -jar ./lib/cucumber-sandwich.jar -f ./reports -o ./reports -n
+  python3 -m compliance.report -f ./reports/test.json -o ./reports
   exit 1
 fi
 
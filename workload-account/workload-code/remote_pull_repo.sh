@@ -22,25 +22,64 @@ if [ -z "$1" ]; then
 fi
 assumeRole=$1
 gitRepo=$2
+repoName=$(basename $gitRepo)
 
-# Setting role for cross-account
-set_creds() {
-  Role=$1
-  echo "Assuming role: $Role"
-  temp_role=$(aws sts assume-role --role-arn $Role --role-session-name childssmPipeline)
-  export AWS_ACCESS_KEY_ID=$(echo $temp_role | jq .Credentials.AccessKeyId | xargs)
-  export AWS_SECRET_ACCESS_KEY=$(echo $temp_role | jq .Credentials.SecretAccessKey | xargs)
-  export AWS_SESSION_TOKEN=$(echo $temp_role | jq .Credentials.SessionToken | xargs)
-  env | grep -i AWS_
-}
+# The repo is pulled through its git mirror (compliance/git_mirror.py) with sessions from the credential
+# broker (compliance/credentials.py). Both come from the repo itself: from this host's mirror of it when
+# there is one, otherwise from a shallow clone, which is also the fallback when the mirror is unavailable.
+# Only the paths in GIT_MIRROR_PATHS are exported from the mirror
+# With rules pinned to a rule bundle (RULE_BUNDLE_DIGEST) the feature files are not needed
+if [ -n "$RULE_BUNDLE_DIGEST" ]; then
+  mirrorPaths=${GIT_MIRROR_PATHS:-compliance}
+else
+  mirrorPaths=${GIT_MIRROR_PATHS:-src compliance}
+fi
+mirrorDir=$HOME/.cache/git-mirror/$(echo -n $gitRepo | sha256sum | cut -c1-24).git
+toolsDir=$(mktemp -d)
 
-unset_creds(){
-  echo "unset aws Credentials"
-  unset AWS_ACCESS_KEY_ID
-  unset AWS_SECRET_ACCESS_KEY
-  unset AWS_SESSION_TOKEN
+# One-off session for the bootstrap clone, the broker caches the sessions of everything after it.
+# Credentials are never printed, the build log outlives them
+bootstrap_creds() {
+  creds=$(aws sts assume-role --role-arn $assumeRole --role-session-name childssmPipeline \
+    ${STS_ENDPOINT_URL:+--endpoint-url $STS_ENDPOINT_URL} --query Credentials --output json) || return 1
+  export AWS_ACCESS_KEY_ID=$(echo "$creds" | jq -r .AccessKeyId)
+  export AWS_SECRET_ACCESS_KEY=$(echo "$creds" | jq -r .SecretAccessKey)
+  export AWS_SESSION_TOKEN=$(echo "$creds" | jq -r .SessionToken)
+  echo "Assumed role: $assumeRole as $AWS_ACCESS_KEY_ID"
 }
 
-set_creds $assumeRole
-git clone $gitRepo
+if [ -d $mirrorDir ]; then
+  git --git-dir $mirrorDir archive HEAD compliance | tar -x -C $toolsDir
+else
+  echo "Cloning $repoName"
+  ( bootstrap_creds && git clone --quiet --depth 1 $gitRepo $toolsDir )
+fi
+export PYTHONPATH=$toolsDir
+
+# Mirror store access uses the build's own role, only git talks to the repo with the cross account role
+rm -rf $repoName
+python3 -m compliance.git_mirror pull $gitRepo --dest $repoName --role-arn $assumeRole \
+  $(for mirrorPath in $mirrorPaths; do echo --path $mirrorPath; done)
+if [ $? != 0 ]
+then
+  echo "Git mirror unavailable, using a clone"
+  rm -rf $repoName
+  if [ -d $toolsDir/.git ]; then
+    mv $toolsDir $repoName
+  else
+    ( bootstrap_creds && git clone $gitRepo ) || exit 1
+  fi
+fi
 echo "compliance check repo cloned successfully"
+
+# Pinned rule bundle published by the compliance pipeline (compliance/rule_bundle.py), read with the cross account role.
+# Bundles already fetched on this host come from the local cache
+if [ -n "$RULE_BUNDLE_DIGEST" ]; then
+  ( eval "$(python3 -m compliance.credentials env $assumeRole)" && cd $repoName && python3 -m compliance.rule_bundle fetch $RULE_BUNDLE_DIGEST --store $RULE_BUNDLE_STORE --dest rule-bundle.json )
+  if [ $? != 0 ]; then
+    echo "Rule bundle $RULE_BUNDLE_DIGEST unavailable"
+    exit 1
+  fi
+  echo "rule bundle $RULE_BUNDLE_DIGEST fetched successfully"
+fi
+rm -rf $toolsDir
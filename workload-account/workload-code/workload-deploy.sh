@@ -25,19 +25,72 @@ elif [ "$#" -eq 0 ]; then
 fi
 
 
+# Providers come from the mirror shared with the compliance check when the compliance code is available
+if [ -d ./security-and-compliance-code ]; then
+    export PYTHONPATH=$(pwd)/security-and-compliance-code
+    eval "$(python3 -m compliance.provider_mirror env ./src ${PROVIDER_MIRROR_STORE:+--store $PROVIDER_MIRROR_STORE})"
+fi
+
+# With COMPLIANCE_ENVIRONMENTS the check covered several environments, DEPLOY_ENVIRONMENT names the one deployed
+# here. It is deployed with the var files and workspace it was checked with, from its own plan handoff
+deployEnvironment=""
+deployVarFileArgs=""
+handoffVarFileArgs=""
+if [[ $COMPLIANCE_ENVIRONMENTS != "" ]]; then
+    [ -n "${DEPLOY_ENVIRONMENT}" ] || { echo "DEPLOY_ENVIRONMENT environment variable not defined, it names one of the checked environments $COMPLIANCE_ENVIRONMENTS"; exit 1; }
+    [ -d ./security-and-compliance-code ] || { echo "security-and-compliance-code is needed to deploy one of the checked environments"; exit 1; }
+    environmentVariables=$(python3 -m compliance.multi_env env "${DEPLOY_ENVIRONMENT}") || { echo "Failure"; exit 1; }
+    eval "$environmentVariables"
+    export TF_WORKSPACE
+    deployEnvironment=$DEPLOY_ENVIRONMENT
+    for varFile in $deployVarFiles; do
+        deployVarFileArgs="$deployVarFileArgs -var-file=$varFile"
+        handoffVarFileArgs="$handoffVarFileArgs --var-file $varFile"
+    done
+    echo "Deploying environment ${deployEnvironment} (workspace ${TF_WORKSPACE}${deployVarFiles:+, var files $deployVarFiles})"
+fi
+
+# The compliance check hands off the plan it checked as the PLAN_HANDOFF_ARTIFACT input artifact
+# That plan is applied as is, unless the state moved since it was made
+applyHandoff=0
+if [ $terraformAction = "apply" ] && [ -d ./security-and-compliance-code ]; then
+    handoffSrcDir="CODEBUILD_SRC_DIR_${PLAN_HANDOFF_ARTIFACT}"
+    handoffDir=${PLAN_HANDOFF_DIR:-${!handoffSrcDir:+${!handoffSrcDir}/handoff}}
+    handoffDir=${handoffDir:+${handoffDir}${deployEnvironment:+/$deployEnvironment}}
+    python3 -m compliance.plan_handoff verify ./src ${handoffDir:+--handoff $handoffDir} \
+        --var "region=${AWS_DEFAULT_REGION}" \
+        $handoffVarFileArgs \
+        ${deployEnvironment:+--workspace $TF_WORKSPACE} \
+        --backend-bucket "${WORLOAD_STATEFILE_BUCKET_NAME}"
+    case $? in
+        0) applyHandoff=1 ;;
+        1) echo "Planning again" ;;
+        *) echo "Failure"; exit 1 ;;
+    esac
+fi
+
 # Create Terraform Plan and apply
+# Providers are locked to the ones the checked plan was made with
+if [ $applyHandoff = 1 ]; then
+    python3 -m compliance.plan_handoff restore-lock ./src --handoff $handoffDir
+fi
+
 cd ./src
 terraform init \
 -backend-config="bucket=${WORLOAD_STATEFILE_BUCKET_NAME}" \
 -backend-config="region=${AWS_DEFAULT_REGION}"
 
-if [ $terraformAction = "apply" ]; then
+if [ $terraformAction = "apply" ] && [ $applyHandoff = 1 ]; then
+    cp "${handoffDir}/plan.out" ./plan.out
+    terraform apply -auto-approve plan.out
+    var_resp_code=$?
+elif [ $terraformAction = "apply" ]; then
     terraform apply -auto-approve \
-        -var "region=${AWS_DEFAULT_REGION}"
+        -var "region=${AWS_DEFAULT_REGION}" $deployVarFileArgs
     var_resp_code=$?
 elif [ $terraformAction = "destroy" ]; then
     terraform destroy -force \
-        -var "region=${AWS_DEFAULT_REGION}"
+        -var "region=${AWS_DEFAULT_REGION}" $deployVarFileArgs
     var_resp_code=$?
 else
     echo "Invalid Terraform action: ${terraformAction}"